@@ -0,0 +1,119 @@
+"""
+Events-per-second benchmark for the Falco ingest sources.
+
+Writes the same synthetic Falco JSON lines through each source and measures
+how long it takes until the consumer has drained all of them with
+get_batch():
+
+- file: appended to a file followed by FileTailQueue
+- http: POSTed to HttpReceiverQueue, --http-batch events per request
+  (Falco's http_output sends one event per request)
+- unix: streamed over a Unix domain socket to UnixSocketQueue
+- docker: only with --docker CONTAINER; the container must print the
+  events itself, so this mode just measures consumption for --seconds
+
+Usage:
+    python benchmarks/ingest_sources.py [--events N] [--http-batch B] [--sources file,http,unix]
+"""
+import argparse
+import http.client
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from hanabi.utils.sources import DockerLogQueue, FileTailQueue, HttpReceiverQueue, UnixSocketQueue
+from queue_framing import make_chunks
+
+WRITE_SIZE = 65536
+
+
+def make_lines(events):
+    payload = b"".join(make_chunks(events, 1 << 30))
+    return payload.splitlines(keepends=True)
+
+
+def drain(source, expected, timeout=120):
+    """Consume until `expected` events arrived; return the number received."""
+    received = 0
+    deadline = time.monotonic() + timeout
+    while received < expected and time.monotonic() < deadline:
+        received += len(source.get_batch(max_items=4096, max_wait=0.5))
+    return received
+
+
+def write_file(path, lines):
+    with open(path, "ab", buffering=0) as f:
+        for i in range(0, len(lines), 256):
+            f.write(b"".join(lines[i:i + 256]))
+
+
+def post_http(address, lines, batch):
+    conn = http.client.HTTPConnection(*address)
+    for i in range(0, len(lines), batch):
+        conn.request("POST", "/", body=b"".join(lines[i:i + batch]),
+                     headers={"Content-Type": "application/json"})
+        conn.getresponse().read()
+    conn.close()
+
+
+def send_unix(path, lines):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(b"".join(lines))
+
+
+def run(name, source, writer, expected):
+    source.start()
+    try:
+        start = time.perf_counter()
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+        received = drain(source, expected)
+        elapsed = time.perf_counter() - start
+        thread.join()
+    finally:
+        source.stop()
+    print(f"{name:<8} {received:>9} events  {elapsed:8.3f}s  {received / elapsed:>12,.0f} events/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--http-batch", type=int, default=1)
+    parser.add_argument("--sources", default="file,http,unix")
+    parser.add_argument("--docker", metavar="CONTAINER")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    lines = make_lines(args.events)
+    sources = args.sources.split(",")
+    workdir = tempfile.mkdtemp(prefix="hanabi-bench-")
+    options = {"max_queue_size": 0}
+
+    if "file" in sources:
+        path = os.path.join(workdir, "events.json")
+        open(path, "wb").close()
+        run("file", FileTailQueue(path, poll_interval=0.01, **options),
+            lambda: write_file(path, lines), len(lines))
+    if "http" in sources:
+        source = HttpReceiverQueue(port=0, **options)
+        run(f"http/{args.http_batch}", source,
+            lambda: post_http(source.server_address, lines, args.http_batch), len(lines))
+    if "unix" in sources:
+        path = os.path.join(workdir, "events.sock")
+        run("unix", UnixSocketQueue(path, **options), lambda: send_unix(path, lines), len(lines))
+    if args.docker:
+        source = DockerLogQueue(container_name=args.docker, **options)
+        source.start()
+        time.sleep(args.seconds)
+        source.stop()
+        received = source.get_stats()["lines_processed"]
+        print(f"{'docker':<8} {received:>9} events  {args.seconds:8.3f}s  {received / args.seconds:>12,.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
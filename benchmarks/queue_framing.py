@@ -0,0 +1,108 @@
+"""
+Throughput benchmark for DockerLogQueue line framing and JSON decoding.
+
+Replays synthetic Falco JSON lines in Docker-sized chunks through the
+previous implementation (str buffer + split + json.loads + Queue.put per
+line) and through LineFramer + decode_lines + EventBuffer.put_batch, and
+reports lines per second for each.
+
+Usage:
+    python benchmarks/queue_framing.py [--lines N] [--chunk-size BYTES] [--repeat R]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from queue import Queue
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from hanabi.utils.queue import JSON_DECODER, EventBuffer, LineFramer, decode_lines
+
+SAMPLE_EVENT = {
+    "hostname": "node-1",
+    "output": "12:00:00.000000000: Notice file opened (user=root command=cat /etc/passwd)",
+    "priority": "Notice",
+    "rule": "file",
+    "source": "syscall",
+    "tags": [],
+    "time": "2025-01-01T12:00:00.000000000Z",
+    "output_fields": {
+        "container.id": "3f2a9c1b7d4e",
+        "container.name": "web",
+        "container.image.repository": "nginx",
+        "evt.type": "openat",
+        "evt.time": 1735732800000000000,
+        "proc.name": "cat",
+        "proc.cmdline": "cat /etc/passwd",
+        "fd.name": "/etc/passwd",
+        "fd.directory": "/etc",
+        "k8s.ns.name": None,
+        "k8s.pod.name": None,
+    },
+}
+
+
+def make_chunks(lines, chunk_size):
+    """Serialize `lines` events and cut the byte stream into fixed-size chunks."""
+    payload = b"".join(
+        json.dumps(dict(SAMPLE_EVENT, output_fields=dict(SAMPLE_EVENT["output_fields"], **{"evt.num": i}))).encode()
+        + b"\n"
+        for i in range(lines)
+    )
+    return [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
+
+
+def run_legacy(chunks):
+    """The original _stream_logs loop."""
+    queue = Queue()
+    buffer = ""
+    count = 0
+    for chunk in chunks:
+        buffer += chunk.decode('utf-8')
+        while '\n' in buffer:
+            line, buffer = buffer.split('\n', 1)
+            if line.strip():
+                queue.put(json.loads(line))
+                count += 1
+    return count
+
+
+def run_framed(chunks):
+    """LineFramer + bulk decode + batched hand-off."""
+    queue = EventBuffer(maxsize=0)
+    framer = LineFramer()
+    count = 0
+    for chunk in chunks:
+        events, _ = decode_lines(framer.feed(chunk))
+        queue.put_batch(events)
+        count += len(events)
+    return count
+
+
+def measure(name, func, chunks, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = func(chunks)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<10} {count:>9} lines  {best:8.3f}s  {count / best:>12,.0f} lines/s")
+    return count / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.lines, args.chunk_size)
+    print(f"{args.lines} lines, {len(chunks)} chunks of {args.chunk_size} bytes, decoder={JSON_DECODER}")
+    legacy = measure("legacy", run_legacy, chunks, args.repeat)
+    framed = measure("framed", run_framed, chunks, args.repeat)
+    print(f"speedup    {framed / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import atexit
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Event, Lock, Thread
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from ..utils.metrics import record_anomalies_suppressed, record_anomaly
+from ..utils.parser import event_time_ns
+from ..utils.queue import EventBuffer
+
+DEFAULT_ANOMALY_LOG = os.getenv("HANABI_ANOMALY_LOG")
+DEFAULT_MAX_BYTES = int(os.getenv("HANABI_ANOMALY_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+DEFAULT_BACKUPS = int(os.getenv("HANABI_ANOMALY_LOG_BACKUPS", "5"))
+# 每秒最多发布的异常记录数（0表示不限制），允许的突发量与之相同
+DEFAULT_RATE = float(os.getenv("HANABI_ANOMALY_RATE", "100"))
+# 同一容器、分支、层级和名称的异常在该时间内只发布一次
+DEFAULT_DEDUP_SECONDS = float(os.getenv("HANABI_ANOMALY_DEDUP_SECONDS", "60"))
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_MAX_DEDUP_KEYS = 10000
+
+
+class Anomaly:
+    """
+    检测阶段的一次未匹配查找
+
+    记录未匹配的分支和树层级、所属容器、查找的名称，以及该层级已知节点中最接近的节点和相似度
+    """
+
+    __slots__ = ("container", "branch", "level", "query", "nearest", "similarity", "fields",
+                 "evt_time", "detected_at", "repeats")
+
+    def __init__(self, container: str, branch: str, level: str, query: str, nearest: Optional[str],
+                 similarity: float, fields: Dict[str, Any], repeats: int = 0):
+        """
+        初始化异常记录
+
+        Args:
+            container: 模型key（通常是container.id）
+            branch: 分支（'process', 'network', 'file'）
+            level: 未匹配的层级（'operation', 'process', 'attribute'）
+            query: 未匹配的名称
+            nearest: 该层级已知节点中最接近的名称，没有节点时为None
+            similarity: 与最接近节点的相似度
+            fields: 事件的输出字段
+            repeats: 上一次发布之后被去重的相同异常数
+        """
+        self.container = container
+        self.branch = branch
+        self.level = level
+        self.query = query
+        self.nearest = nearest
+        self.similarity = similarity
+        self.fields = fields
+        self.evt_time = event_time_ns({"output_fields": fields})
+        self.detected_at = time.time()
+        self.repeats = repeats
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可以写成JSON的字典"""
+        return {
+            "detected_at": datetime.fromtimestamp(self.detected_at, timezone.utc).isoformat(),
+            "evt_time": self.evt_time,
+            "container": self.container,
+            "branch": self.branch,
+            "level": self.level,
+            "query": self.query,
+            "nearest": self.nearest,
+            "similarity": round(self.similarity, 4),
+            "repeats": self.repeats,
+            "output_fields": self.fields,
+        }
+
+
+class RotatingJsonlWriter:
+    """按大小轮转的JSONL文件：超过max_bytes后path重命名为path.1，已有的备份依次后移，最多保留backups个"""
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, backups: int = DEFAULT_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+
+    def write(self, lines: List[str]):
+        """写入一批JSON行，必要时先轮转"""
+        for line in lines:
+            if self.max_bytes > 0 and self.size >= self.max_bytes:
+                self.rotate()
+            self.file.write(line)
+            self.file.write("\n")
+            self.size += len(line) + 1
+        self.file.flush()
+
+    def rotate(self):
+        self.file.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{index}"):
+                    os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+
+
+class AnomalySink:
+    """
+    异常记录的发布端
+
+    report()在检测线程中调用：计入Prometheus指标，去重和限速后把记录放入有界队列，不做任何I/O。
+    后台线程从队列取出记录，写入JSONL文件（未配置文件时写到stderr）并调用订阅者。
+    队列满时丢弃新记录，检测不会被告警输出阻塞
+    """
+
+    def __init__(
+        self,
+        log_path: Optional[str] = DEFAULT_ANOMALY_LOG,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backups: int = DEFAULT_BACKUPS,
+        rate: float = DEFAULT_RATE,
+        dedup_seconds: float = DEFAULT_DEDUP_SECONDS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_dedup_keys: int = DEFAULT_MAX_DEDUP_KEYS,
+    ):
+        """
+        初始化异常发布端
+
+        Args:
+            log_path: JSONL文件路径，None时写到stderr
+            max_bytes: 文件轮转的大小（0表示不轮转）
+            backups: 保留的轮转文件数
+            rate: 每秒最多发布的记录数（0表示不限制）
+            dedup_seconds: 相同异常的去重时间窗口（0表示不去重）
+            max_queue: 等待写出的记录数上限
+            max_dedup_keys: 去重表最多记录的异常数
+        """
+        self.log_path = log_path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.rate = rate
+        self.dedup_seconds = dedup_seconds
+        self.max_dedup_keys = max_dedup_keys
+        self.queue = EventBuffer(max_queue, "drop_newest", on_drop=self._on_drop)
+        self.subscribers: List[Callable[[Anomaly], None]] = []
+        self.lock = Lock()
+        # (容器, 分支, 层级, 名称) -> [上次发布的时间, 之后被去重的次数]
+        self.recent: "OrderedDict[Tuple[str, str, str, str], List[float]]" = OrderedDict()
+        self.tokens = rate
+        self.last_refill = time.monotonic()
+        self.stop_event = Event()
+        self.thread = None
+        self.reported_count = 0
+        self.published_count = 0
+        self.duplicate_count = 0
+        self.rate_limited_count = 0
+        self.dropped_count = 0
+
+    def _on_drop(self, rule, priority, policy, count):
+        self.dropped_count += count
+        record_anomalies_suppressed("dropped", count)
+
+    def subscribe(self, callback: Callable[[Anomaly], None]):
+        """
+        注册订阅者，在后台线程中对每条发布的记录调用callback(anomaly)
+
+        Args:
+            callback: 回调函数
+        """
+        self.subscribers.append(callback)
+
+    def start(self):
+        """启动后台写出线程（第一次发布记录时会自动启动）"""
+        self.thread = Thread(target=self._run, name="anomaly-sink", daemon=True)
+        self.thread.start()
+
+    def report(self, container: str, branch: str, level: str, query: str, fields: Dict[str, Any],
+               nearest: Optional[Callable[[], Tuple[Optional[str], float]]] = None) -> bool:
+        """
+        报告一次未匹配的查找
+
+        Args:
+            container: 模型key
+            branch: 分支
+            level: 未匹配的层级
+            query: 未匹配的名称
+            fields: 事件的输出字段
+            nearest: 返回(最接近的名称, 相似度)的函数，只在记录真正发布时调用
+
+        Returns:
+            bool: 是否发布了记录（被去重、限速或队列满时为False）
+        """
+        record_anomaly(branch, level)
+        now = time.monotonic()
+        with self.lock:
+            self.reported_count += 1
+            repeats = 0
+            if self.dedup_seconds > 0:
+                key = (container, branch, level, query)
+                entry = self.recent.get(key)
+                if entry is not None and now - entry[0] < self.dedup_seconds:
+                    entry[1] += 1
+                    self.duplicate_count += 1
+                    record_anomalies_suppressed("duplicate")
+                    return False
+                if entry is not None:
+                    repeats = int(entry[1])
+                    del self.recent[key]
+                self.recent[key] = [now, 0]
+                if len(self.recent) > self.max_dedup_keys:
+                    self.recent.popitem(last=False)
+            if self.rate > 0:
+                # 令牌桶：每秒补充rate个，最多积累rate个
+                self.tokens = min(self.rate, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens < 1:
+                    self.rate_limited_count += 1
+                    record_anomalies_suppressed("rate_limited")
+                    return False
+                self.tokens -= 1
+            if self.thread is None:
+                self.start()
+        nearest_key, similarity = nearest() if nearest is not None else (None, 0.0)
+        anomaly = Anomaly(container, branch, level, query, nearest_key, similarity, fields, repeats)
+        # drop_newest策略：队列满时记录被丢弃并计数，不会阻塞
+        dropped = self.dropped_count
+        self.queue.put_batch([anomaly])
+        return self.dropped_count == dropped
+
+    def _run(self):
+        writer = RotatingJsonlWriter(self.log_path, self.max_bytes, self.backups) if self.log_path else None
+        try:
+            while not self.stop_event.is_set() or len(self.queue):
+                batch = self.queue.get_batch(256, timeout=0.1)
+                if batch:
+                    self._publish(batch, writer)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def _publish(self, anomalies: List[Anomaly], writer: Optional[RotatingJsonlWriter]):
+        lines = [json.dumps(anomaly.to_dict(), ensure_ascii=False, default=str) for anomaly in anomalies]
+        try:
+            if writer is not None:
+                writer.write(lines)
+            else:
+                sys.stderr.write("".join(f"Anomaly: {line}\n" for line in lines))
+        except OSError as e:
+            print(f"Failed to write anomalies to {self.log_path}: {e}", file=sys.stderr)
+        for anomaly in anomalies:
+            for callback in self.subscribers:
+                try:
+                    callback(anomaly)
+                except Exception as e:
+                    print(f"Anomaly subscriber failed: {e}", file=sys.stderr)
+        self.published_count += len(anomalies)
+
+    def stop(self, timeout: float = 5.0):
+        """写出队列中剩余的记录后停止后台线程"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取发布统计信息"""
+        return {
+            "reported": self.reported_count,
+            "published": self.published_count,
+            "duplicates": self.duplicate_count,
+            "rate_limited": self.rate_limited_count,
+            "dropped": self.dropped_count,
+            "pending": len(self.queue),
+        }
+
+
+_sink: Optional[AnomalySink] = None
+_sink_lock = Lock()
+
+
+def get_anomaly_sink() -> AnomalySink:
+    """获取进程内共用的异常发布端，第一次调用时按环境变量创建，进程退出时写出剩余记录"""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = AnomalySink()
+                atexit.register(_sink.stop)
+    return _sink
+
+
+def set_anomaly_sink(sink: AnomalySink) -> Optional[AnomalySink]:
+    """
+    替换进程内共用的异常发布端
+
+    Args:
+        sink: 新的发布端
+
+    Returns:
+        AnomalySink: 原来的发布端（可能为None），由调用方负责停止
+    """
+    global _sink
+    with _sink_lock:
+        previous, _sink = _sink, sink
+    return previous
+
+
+def report_anomaly(container: str, branch: str, level: str, query: str, fields: Dict[str, Any],
+                   nearest: Optional[Callable[[], Tuple[Optional[str], float]]] = None) -> bool:
+    """向进程内共用的异常发布端报告一次未匹配的查找，参数见AnomalySink.report"""
+    return get_anomaly_sink().report(container, branch, level, query, fields, nearest)
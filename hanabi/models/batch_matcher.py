@@ -0,0 +1,190 @@
+import time
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+from typing import Dict, Any, List, Union
+
+from .child_index import SEMANTIC_MATCH_TIMER
+from .embedding import is_backend_loading, prefetch_embeddings
+from .event_parser import EventParser
+from .hbt_builder import HBTBuilder
+from .registry import HBTRegistry
+from ..utils.metrics import StageTimer, observe_event_lag, track_queue_depth
+
+DEFAULT_MAX_BATCH_SIZE = 256
+DEFAULT_MAX_DELAY = 0.005
+DEFAULT_MAX_PENDING = 10000
+
+PARSE_TIMER = StageTimer("parse")
+PREFETCH_TIMER = StageTimer("prefetch")
+BUILD_TIMER = StageTimer("build")
+
+
+class MicroBatchMatcher:
+    """
+    位于DockerLogQueue与HBTBuilder.add_event之间的微批语义匹配阶段
+
+    后台线程收集一批待处理事件（最多max_batch_size个，或第一个事件到达后最多等待max_delay秒），
+    把其中不在向量缓存中的查找字符串合并成一个padded batch送入语义模型预计算向量，
+    然后再依次把事件交给HBTBuilder，此时语义查找都会命中向量缓存。
+    语义模型还在后台加载时，可以选择只走精确/词法匹配，或者先缓冲事件直到模型就绪
+    """
+
+    def __init__(
+        self,
+        builder: Union[HBTBuilder, HBTRegistry],
+        max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+        max_delay: float = DEFAULT_MAX_DELAY,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        buffer_until_ready: bool = False,
+    ):
+        """
+        初始化微批匹配器
+
+        Args:
+            builder: 接收事件的HBT构建器或多容器注册表
+            max_batch_size: 每批最多处理的事件数
+            max_delay: 凑批时最多等待的秒数
+            max_pending: 等待处理的事件数上限，满时submit阻塞
+            buffer_until_ready: 模型加载期间是否缓冲事件（否则只用精确/词法匹配处理）
+        """
+        self.builder = builder
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.buffer_until_ready = buffer_until_ready
+        self.pending: Queue = Queue(maxsize=max_pending)
+        self.stop_event = Event()
+        self.thread = None
+        self.batch_count = 0
+        self.event_count = 0
+        self.encoded_count = 0
+
+    def start(self):
+        """启动后台匹配线程"""
+        track_queue_depth("micro_batch", self.pending.qsize)
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, event: Dict[str, Any], timeout: float = None) -> bool:
+        """
+        提交一个事件等待批量处理
+
+        Args:
+            event: 原始Falco事件
+            timeout: 队列满时最多等待的秒数（None表示一直等待）
+
+        Returns:
+            bool: 是否成功提交
+        """
+        try:
+            self.pending.put(event, timeout=timeout)
+            return True
+        except Full:
+            return False
+
+    def submit_batch(self, events: List[Dict[str, Any]], timeout: float = None) -> int:
+        """
+        提交一批事件等待批量处理
+
+        Args:
+            events: 原始Falco事件列表
+            timeout: 队列满时每个事件最多等待的秒数（None表示一直等待）
+
+        Returns:
+            int: 成功提交的事件数
+        """
+        for submitted, event in enumerate(events):
+            if not self.submit(event, timeout):
+                return submitted
+        return len(events)
+
+    def _collect_batch(self) -> List[Dict[str, Any]]:
+        try:
+            batch = [self.pending.get(timeout=0.1)]
+        except Empty:
+            return []
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def process_batch(self, events: List[Dict[str, Any]]):
+        """
+        预计算一批事件中不在向量缓存中的字符串的语义向量，然后把事件加入HBT模型
+
+        Args:
+            events: 原始Falco事件列表
+        """
+        # 每个事件只解析一次，预计算时提取的属性保留在记录中供建树复用
+        start = PARSE_TIMER.start()
+        records = EventParser.parse_records(events)
+        PARSE_TIMER.stop(start, len(events))
+        # 模型加载期间不做预计算，避免阻塞在加载上
+        if not is_backend_loading():
+            start = PREFETCH_TIMER.start()
+            # 只预计算各自父节点上精确和词法层级都无法确定的字符串，按原始字符串去重，
+            # 已在向量缓存中的字符串由prefetch_embeddings跳过
+            queries = list(dict.fromkeys(
+                query for record in records for query in self.builder.semantic_queries(record) if query
+            ))
+            if queries:
+                self.encoded_count += prefetch_embeddings(queries, max_batch=len(queries))
+            PREFETCH_TIMER.stop(start, len(events))
+        # build只记录分支处理和建树，其中语义层级的耗时单独记为semantic_match
+        SEMANTIC_MATCH_TIMER.take()
+        start = BUILD_TIMER.start()
+        self.builder.add_events(records)
+        if start:
+            semantic = SEMANTIC_MATCH_TIMER.take()
+            BUILD_TIMER.observe(time.perf_counter() - start - semantic, len(events))
+            SEMANTIC_MATCH_TIMER.observe(semantic, len(events))
+        observe_event_lag("hbt", events)
+
+        self.batch_count += 1
+        self.event_count += len(events)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            if self.buffer_until_ready and is_backend_loading():
+                self.stop_event.wait(0.05)
+                continue
+            batch = self._collect_batch()
+            if batch:
+                self.process_batch(batch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批处理统计信息"""
+        return {
+            "batches": self.batch_count,
+            "events": self.event_count,
+            "avg_batch_size": self.event_count / self.batch_count if self.batch_count else 0.0,
+            "strings_encoded": self.encoded_count,
+            "pending": self.pending.qsize(),
+        }
+
+    def stop(self, drain: bool = True):
+        """
+        停止后台匹配线程
+
+        Args:
+            drain: 是否先处理完已提交的事件
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+        if drain:
+            while True:
+                batch = []
+                while len(batch) < self.max_batch_size:
+                    try:
+                        batch.append(self.pending.get_nowait())
+                    except Empty:
+                        break
+                if not batch:
+                    break
+                self.process_batch(batch)
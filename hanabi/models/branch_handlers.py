@@ -1,12 +1,11 @@
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from .tree_node import TreeNode
-import json
 import re
-import time
-from ..utils.timeCount import EventCounter
-from .embedding import has_semantic_match
-
-learnState = True
+from .anomaly import report_anomaly
+from .learning_state import LearningState
+from .event_parser import EventRecord
+from .embedding import has_semantic_match, is_backend_loading
+from .child_index import ChildIndex, MATCH_STATS
 
 def is_semantic_match(query: str, candidates_dict: dict) -> bool:
     """
@@ -17,275 +16,281 @@ def is_semantic_match(query: str, candidates_dict: dict) -> bool:
     candidates = list(candidates_dict.keys())
     return has_semantic_match(query, candidates)
 
-def find_semantic_key(query: str, candidates_dict: dict) -> str:
+def _child_index(node: TreeNode, mask_volatile: bool) -> ChildIndex:
+    if node.child_index is None:
+        node.child_index = ChildIndex(node.child_names(), mask_volatile=mask_volatile)
+    return node.child_index
+
+def find_semantic_key(query: str, node: TreeNode, mask_volatile: bool = True) -> Tuple[str, float]:
     """
-    在candidates_dict中查找与query语义匹配的key，如果没有匹配则返回query本身
+    在node的子节点中查找与query最接近的key
+
+    精确匹配未命中时交给node.child_index分层匹配（归一化、trigram、语义向量），
+    只有词法层级都无法确定时才会调用语义模型；模型还在后台加载时只做词法匹配
+
+    Args:
+        query: 待匹配的名称
+        node: 父节点
+        mask_volatile: 归一化时是否屏蔽容器ID、/proc/<pid>等易变部分
+
+    Returns:
+        tuple: (匹配的key, 相似度)，如果没有匹配的key则返回(query本身, 最高相似度)
     """
-    if candidates_dict is None or len(candidates_dict) == 0:
-        return query
-    
     # 先尝试精确匹配
-    if query in candidates_dict:
-        return query
-    
-    # 再尝试语义匹配
-    for key in candidates_dict.keys():
-        if has_semantic_match(query, [key]):
-            return key
-    
-    return query
+    if node.get_child(query) is not None:
+        MATCH_STATS.record("exact")
+        return query, 1.0
+    if not node.has_children():
+        MATCH_STATS.record("miss")
+        return query, 0.0
 
-def update_learn_state(eventCounter: EventCounter):
+    # 再依次尝试词法匹配和语义匹配
+    key, score = _child_index(node, mask_volatile).match(query, semantic=not is_backend_loading())
+    if key is None:
+        return query, score
+    return key, score
+
+def find_nearest_key(query: str, node: TreeNode, mask_volatile: bool = True) -> Tuple[Optional[str], float]:
     """
-    根据事件速率和时间窗口更新learnState
-    在预热期间不进行判断，预热结束后才开始统计
+    返回node的子节点中与query最接近的key和相似度，不论是否达到匹配阈值
+
+    Returns:
+        tuple: (最接近的key, 相似度)，没有子节点时为(None, 0.0)
     """
-    global learnState
-    
-    # 如果还在预热期，直接返回，不进行判断
-    if eventCounter.is_warmup_period():
-        print("training (warmup period), eventCounter.get_rate():", eventCounter.get_rate())
-        return
-    
-    now = int(time.time() * 1000)
-    earliest_time = eventCounter.timestamps[0] if eventCounter.timestamps else now
-    print("training, eventCounter.get_rate():", eventCounter.get_rate())
-    print("time window:", now - earliest_time)
-    if now - earliest_time >= 1000 * 10:
-        if eventCounter.get_rate() < 2:
-            learnState = False
-            print("Learning completed! Switching to detecting...")
+    if not node.has_children():
+        return None, 0.0
+    return _child_index(node, mask_volatile).nearest(query, semantic=not is_backend_loading())
+
+CMD_ARGUMENT_PATTERN = re.compile(r'-{1,2}[^\s-]+')
+
 
 class BranchHandler:
     """基础分支处理器"""
+
+    # 分支名称和操作层节点的类型，由子类指定
+    branch = "unknown"
+    operation_type = "operation"
+    # 匹配时是否忽略名称中的易变部分（容器ID、/proc/<pid>）
+    mask_volatile = True
     
-    def __init__(self, branch_root: TreeNode):
+    def __init__(self, branch_root: TreeNode, container_id: str = "unknown"):
         """
         初始化分支处理器
         
         Args:
             branch_root: 分支根节点
+            container_id: 所属模型的key，报告异常时使用
+        """
+        self.root = branch_root
+        self.container_id = container_id
+        # 分支中的节点数（包括分支根节点），新建节点时更新，抓取指标时不必遍历整棵树
+        self.node_count = branch_root.count_nodes()
+
+    def bind(self, branch_root: TreeNode, container_id: str):
+        """
+        换成另一棵已经构建好的分支（加载模型时），只在这里统计一次节点数
+
+        Args:
+            branch_root: 分支根节点
+            container_id: 所属模型的key
         """
         self.root = branch_root
+        self.container_id = container_id
+        self.node_count = branch_root.count_nodes()
     
-    def handle_event(self, event: Dict[str, Any],eventCounter: EventCounter):
+    def handle_event(self, record: EventRecord, state: LearningState) -> bool:
         """
-        处理事件的基础方法，需要在子类中实现
+        处理事件：学习阶段更新树结构，检测阶段只做只读查找
         
         Args:
-            event: 事件数据
+            record: 事件记录
+            state: 所属模型的学习状态
+
+        Returns:
+            bool: 检测阶段发现异常时为True
         """
-        raise NotImplementedError("This method should be implemented by subclasses")
+        if not state.learning:
+            if not self.detect(record):
+                return False
+            # 异常速率过高时状态机切换到relearning
+            state.on_anomaly()
+            state.update()
+            return True
+        state.on_event()
+        self.learn(record, state)
+        state.update()
+        return False
 
+    def learn(self, record: EventRecord, state: LearningState):
+        """
+        学习阶段处理事件：operation -> process -> attribute逐层匹配，不存在的节点新建
+        
+        Args:
+            record: 事件记录
+            state: 所属模型的学习状态
+        """
+        # 获取operation layer级别的节点，再获取process layer级别的节点，即相应的proc.name
+        evt_node = self._learn_child(self.root, record.evt_type, self.operation_type, record, state)
+        proc_node = self._learn_child(evt_node, record.proc_name, "process_name", record, state)
+        # 获取Attribute Token Bag级别的节点
+        for name, node_type in self.record_attributes(record):
+            self._learn_child(proc_node, name, node_type, record, state).events_count += 1
 
-class ProcessBranchHandler(BranchHandler):
-    """进程分支处理器"""
-    
-    def handle_event(self, event: Dict[str, Any],eventCounter: EventCounter):
+    def detect(self, record: EventRecord) -> bool:
         """
-        处理进程相关事件
+        检测阶段处理事件：只读地逐层查找，任一层不匹配即报告并停止
         
         Args:
-            event: 进程事件数据
+            record: 事件记录
+
+        Returns:
+            bool: 是否为异常事件（某一层没有匹配的节点）
         """
-        if learnState == False:
-            print("handle_event called with learnState=False")  # Debugging line
-            evt_type = event.get("evt.type", "")
-            proc_name = event.get("proc.name", "unknown")
-            evt_key = find_semantic_key(evt_type, self.root.children)
-            if evt_key not in self.root.children:
-                print("warning(T):    " + json.dumps(event, ensure_ascii=False)+"\n")
-                return
-            proc_key = find_semantic_key(proc_name, self.root.children[evt_key].children)
-            if proc_key not in self.root.children[evt_key].children:
-                print("Warning(T):    " + json.dumps(event, ensure_ascii=False)+"\n")
-                return
-            cmdline = event.get("proc.cmdline", "")
-            keys = re.findall(r'-{1,2}[^\s-]+', cmdline)
-            for k in keys:
-                arg_key = find_semantic_key(k, self.root.children[evt_key].children[proc_key].children)
-                if arg_key not in self.root.children[evt_key].children[proc_key].children:
-                    print("Warning(T):    " + json.dumps(event, ensure_ascii=False)+"\n")
-                    break
-            return
-        # 获取进程相关信息
-        # 获取operation layer级别的节点，即start、exit、prctl等
-        evt_type = event.get("evt.type", "")
-        evt_key = find_semantic_key(evt_type, self.root.children)
-        if evt_key not in self.root.children:
-            eventCounter.on_event()
-            print("Warning(F):    " + json.dumps(event, ensure_ascii=False)+"\n")
-            self.root.add_child(evt_type, "process_operation")
-            evt_key = evt_type
-        # 获取process layer级别的节点,即相应的proc.name
-        proc_name = event.get("proc.name", "unknown")
-        proc_key = find_semantic_key(proc_name, self.root.children[evt_key].children)
-        if proc_key not in self.root.children[evt_key].children:
-            eventCounter.on_event()
-            print("Warning(F):    " + json.dumps(event, ensure_ascii=False)+"\n")
-            self.root.children[evt_key].add_child(proc_name, "process_name")
-            proc_key = proc_name
-        # 获取Attribute Token Bag级别的节点，在进程中就是命令参数
-        cmdline = event.get("proc.cmdline", "")
-        keys = re.findall(r'-{1,2}[^\s-]+', cmdline)
-        for k in keys:
-            arg_key = find_semantic_key(k, self.root.children[evt_key].children[proc_key].children)
-            if arg_key not in self.root.children[evt_key].children[proc_key].children:
-                eventCounter.on_event()
-                print("Warning(F):    " + json.dumps(event, ensure_ascii=False)+"\n")
-                self.root.children[evt_key].children[proc_key].add_child(k, "cmd_argument")
-                arg_key = k
-            self.root.children[evt_key].children[proc_key].children[arg_key].events_count += 1
-
-        if learnState == True:
-            update_learn_state(eventCounter)
+        evt_node = self._detect_child(self.root, record.evt_type, "operation", record)
+        if evt_node is None:
+            return True
+        proc_node = self._detect_child(evt_node, record.proc_name, "process", record)
+        if proc_node is None:
+            return True
+        for name, _ in self.record_attributes(record):
+            if self._detect_child(proc_node, name, "attribute", record) is None:
+                return True
+        return False
 
-class NetworkBranchHandler(BranchHandler):
-    """网络分支处理器"""
-    
-    def handle_event(self, event: Dict[str, Any],eventCounter: EventCounter):
+    def _learn_child(self, parent: TreeNode, query: str, node_type: str,
+                     record: EventRecord, state: LearningState) -> TreeNode:
+        """查找与query匹配的子节点，不存在时新建"""
+        key, _ = find_semantic_key(query, parent, self.mask_volatile)
+        child = parent.get_child(key)
+        if child is None:
+            state.on_new_node()
+            child = parent.add_child(query, node_type)
+            self.node_count += 1
+        return child
+
+    def _detect_child(self, parent: TreeNode, query: str, level: str, record: EventRecord) -> Optional[TreeNode]:
+        """只读地查找与query匹配的子节点，不存在时报告异常并返回None"""
+        key, _ = find_semantic_key(query, parent, self.mask_volatile)
+        child = parent.get_child(key)
+        if child is None:
+            # 最接近的节点只在记录没有被去重或限速时才计算
+            report_anomaly(self.container_id, self.branch, level, query, record.fields,
+                           lambda: find_nearest_key(query, parent, self.mask_volatile))
+        return child
+
+    @staticmethod
+    def attributes(event: Dict[str, Any]) -> List[Tuple[str, str]]:
         """
-        处理网络相关事件
+        返回事件在Attribute Token Bag层级的(名称, 节点类型)列表，由子类实现
         
         Args:
-            event: 网络事件数据
+            event: 事件数据
+        """
+        return []
+
+    @classmethod
+    def record_attributes(cls, record: EventRecord) -> List[Tuple[str, str]]:
+        """
+        返回事件记录的Attribute Token Bag，只在第一次调用时从输出字段提取
+
+        Args:
+            record: 事件记录
         """
-        if learnState == False:
-            print("handle_event called with learnState=False")  # Debugging line
-            evt_type = event.get("evt.type", "")
-            proc_name = event.get("proc.name", "unknown")
-            evt_key = find_semantic_key(evt_type, self.root.children)
-            if evt_key not in self.root.children:
-                print("Warning(T): " + json.dumps(event, ensure_ascii=False)+"\n")
-                return
-            proc_key = find_semantic_key(proc_name, self.root.children[evt_key].children)
-            if proc_key not in self.root.children[evt_key].children:
-                print("Warning(T): " + json.dumps(event, ensure_ascii=False)+"\n")
-                return
-            protocol = event.get("fd.type", "")
-            str = event.get("fd.name", "")
-            # 检查 fd.name 是否为 None 或空字符串
-            if not str:
-                return
-            # 检查是否包含 "->" 分隔符
-            if "->" not in str:
-                right = ":"
-            else:
-                _ , right = str.split("->")
-            value = right + ":" + protocol
-            attr_key = find_semantic_key(value, self.root.children[evt_key].children[proc_key].children)
-            if attr_key not in self.root.children[evt_key].children[proc_key].children:
-                print("Warning(T): " + json.dumps(event, ensure_ascii=False)+"\n")
-            else:
-                pass
-            return
-        # 获取网络相关信息
-        # 获取operation layer级别的节点，即connection、listen、shutdown等
-        evt_type = event.get("evt.type", "")
-        evt_key = find_semantic_key(evt_type, self.root.children)
-        if evt_key not in self.root.children:
-            eventCounter.on_event()
-            self.root.add_child(evt_type, "network_operation")
-            evt_key = evt_type
-        # 获取process layer级别的节点,即相应的proc.name
-        proc_name = event.get("proc.name", "unknown")
-        proc_key = find_semantic_key(proc_name, self.root.children[evt_key].children)
-        if proc_key not in self.root.children[evt_key].children:
-            eventCounter.on_event()
-            self.root.children[evt_key].add_child(proc_name, "process_name")
-            proc_key = proc_name
-        # 获取Attribute Token Bag级别的节点，在网络中就是ip、port、protocol等
-        protocol = event.get("fd.type", "")
-        str = event.get("fd.name", "")
+        attributes = record.attributes
+        if attributes is None:
+            attributes = record.attributes = cls.attributes(record.fields)
+        return attributes
+
+    def semantic_queries(self, record: EventRecord) -> List[str]:
+        """
+        返回处理该事件时需要语义模型才能确定的查找字符串，供批量预计算语义向量
+
+        沿树只读地逐层查找，精确、归一化或trigram能确定的层级不需要向量；某一层需要语义匹配时，
+        后面的层级挂在哪个节点下无法预先确定，剩余的字符串都返回
+
+        Args:
+            record: 事件记录
+        """
+        attributes = [name for name, _ in self.record_attributes(record)]
+        node = self.root
+        for level, query in enumerate((record.evt_type, record.proc_name)):
+            node, unresolved = self._lexical_child(node, query)
+            if unresolved:
+                return [record.evt_type, record.proc_name][level:] + attributes
+            if node is None:
+                # 父节点没有子节点：该层会新建节点，之后的层级都不需要匹配
+                return []
+        return [name for name in attributes if self._lexical_child(node, name)[1]]
+
+    def _lexical_child(self, parent: TreeNode, query: str) -> Tuple[Optional[TreeNode], bool]:
+        """
+        不调用语义模型地查找子节点
+
+        Returns:
+            tuple: (匹配的子节点, 是否需要语义匹配)，父节点没有子节点时为(None, False)
+        """
+        child = parent.get_child(query)
+        if child is not None:
+            return child, False
+        if not parent.has_children():
+            return None, False
+        key, _, _ = _child_index(parent, self.mask_volatile).lexical_match(query)
+        if key is None:
+            return None, True
+        return parent.get_child(key), False
+
+
+class ProcessBranchHandler(BranchHandler):
+    """进程分支处理器"""
+
+    branch = "process"
+    operation_type = "process_operation"
+
+    @staticmethod
+    def attributes(event: Dict[str, Any]) -> List[Tuple[str, str]]:
+        # 进程的Attribute Token Bag是命令参数
+        cmdline = event.get("proc.cmdline") or ""
+        return [(k, "cmd_argument") for k in CMD_ARGUMENT_PATTERN.findall(cmdline)]
+
+
+class NetworkBranchHandler(BranchHandler):
+    """网络分支处理器"""
+
+    branch = "network"
+    operation_type = "network_operation"
+    # IP和端口中的数字都有意义，不做屏蔽
+    mask_volatile = False
+
+    @staticmethod
+    def attributes(event: Dict[str, Any]) -> List[Tuple[str, str]]:
+        # 网络的Attribute Token Bag是对端ip、port和protocol
+        fd_name = event.get("fd.name", "")
         # 检查 fd.name 是否为 None 或空字符串
-        if not str:
-            return
-        if "->" not in str:
+        if not fd_name:
+            return []
+        # 检查是否包含 "->" 分隔符
+        if "->" not in fd_name:
             right = ":"
         else:
-            _ , right = str.split("->")
-        value = right + ":" + protocol
-        attr_key = find_semantic_key(value, self.root.children[evt_key].children[proc_key].children)
-        if attr_key not in self.root.children[evt_key].children[proc_key].children:
-            eventCounter.on_event()
-            print("Warning(F): " + json.dumps(event, ensure_ascii=False)+"\n")
-            self.root.children[evt_key].children[proc_key].add_child(value, "network_attribute")
-            attr_key = value
-        self.root.children[evt_key].children[proc_key].children[attr_key].events_count += 1
-
-        if learnState == True:
-            update_learn_state(eventCounter)
+            _, right = fd_name.split("->")
+        return [(right + ":" + (event.get("fd.type") or ""), "network_attribute")]
+
 
 class FileBranchHandler(BranchHandler):
     """文件分支处理器"""
-    
-    def handle_event(self, event: Dict[str, Any],eventCounter: EventCounter):
-        """
-        处理文件相关事件
-        
-        Args:
-            event: 文件事件数据
-        """
-        if learnState == False:
-            print("handle_event called with learnState=False")  # Debugging line
-            evt_type = event.get("evt.type", "")
-            proc_name = event.get("proc.name", "unknown")
-            evt_key = find_semantic_key(evt_type, self.root.children)
-            if evt_key not in self.root.children:
-                print("Warning(T): " + json.dumps(event, ensure_ascii=False)+"\n")
-                return
-            proc_key = find_semantic_key(proc_name, self.root.children[evt_key].children)
-            if proc_key not in self.root.children[evt_key].children:
-                print("Warning(T): " + json.dumps(event, ensure_ascii=False)+"\n")
-                return
-            directory = event.get("fd.directory", "")
-            filename = event.get("fd.name", "")
-            if directory:
-                dir_key = find_semantic_key(directory, self.root.children[evt_key].children[proc_key].children)
-                if dir_key not in self.root.children[evt_key].children[proc_key].children:
-                    print("Warning(T): " + json.dumps(event, ensure_ascii=False)+"\n")
-                    return
-            if filename:
-                file_key = find_semantic_key(filename, self.root.children[evt_key].children[proc_key].children)
-                if file_key not in self.root.children[evt_key].children[proc_key].children:
-                    print("Warning(T): " + json.dumps(event, ensure_ascii=False)+"\n")
-                    return
-            # 匹配画像放行
-            return
-        # 获取文件相关信息
-        # 获取operation layer级别的节点，即create、open、read、write、close等
-        evt_type = event.get("evt.type", "")
-        evt_key = find_semantic_key(evt_type, self.root.children)
-        if evt_key not in self.root.children:
-            eventCounter.on_event()
-            self.root.add_child(evt_type, "file_operation")
-            evt_key = evt_type
-        # 获取process layer级别的节点,即相应的proc.name
-        proc_name = event.get("proc.name", "unknown")
-        proc_key = find_semantic_key(proc_name, self.root.children[evt_key].children)
-        if proc_key not in self.root.children[evt_key].children:
-            eventCounter.on_event()
-            self.root.children[evt_key].add_child(proc_name, "process_name")
-            proc_key = proc_name
-        # 获取Attribute Token Bag级别的节点，在文件中就是directory和filename
+
+    branch = "file"
+    operation_type = "file_operation"
+
+    @staticmethod
+    def attributes(event: Dict[str, Any]) -> List[Tuple[str, str]]:
+        # 文件的Attribute Token Bag是directory和filename
+        attributes = []
         directory = event.get("fd.directory", "")
         filename = event.get("fd.name", "")
         if directory:
-            dir_key = find_semantic_key(directory, self.root.children[evt_key].children[proc_key].children)
-            if dir_key not in self.root.children[evt_key].children[proc_key].children:
-                eventCounter.on_event()
-                print("Warning(F): " + json.dumps(event, ensure_ascii=False)+"\n")
-                self.root.children[evt_key].children[proc_key].add_child(directory, "directory_path")
-                dir_key = directory
-            self.root.children[evt_key].children[proc_key].children[dir_key].events_count += 1
+            attributes.append((directory, "directory_path"))
         if filename:
-            file_key = find_semantic_key(filename, self.root.children[evt_key].children[proc_key].children)
-            if file_key not in self.root.children[evt_key].children[proc_key].children:
-                eventCounter.on_event()
-                print("Warning(F): " + json.dumps(event, ensure_ascii=False)+"\n")
-                self.root.children[evt_key].children[proc_key].add_child(filename, "file_name")
-                file_key = filename
-            self.root.children[evt_key].children[proc_key].children[file_key].events_count += 1
-
-        if learnState == True:
-            update_learn_state(eventCounter)
+            attributes.append((filename, "file_name"))
+        return attributes
+
@@ -0,0 +1,252 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .embedding import CandidateMatrix, best_semantic_match
+from ..utils.metrics import StageTimer
+
+# 匹配层级，按代价从低到高排列
+TIERS = ("exact", "normalized", "trigram", "semantic", "miss")
+
+DEFAULT_TRIGRAM_THRESHOLD = 0.85
+
+# 出现在过多子节点中的trigram（如文件路径中的"/et"）区分度很低，查找时跳过
+DEFAULT_MAX_POSTINGS = 512
+
+_HEX_ID = re.compile(r'\b[0-9a-f]{12,}\b')
+_SLASHES = re.compile(r'/{2,}')
+_PROC_PID = re.compile(r'^/proc/\d+(?=/|$)')
+_NUMBERS = re.compile(r'\d+')
+
+
+def normalize_name(text: str, mask_volatile: bool = True) -> str:
+    """
+    将节点名称归一化，忽略大小写、空白和路径中重复/结尾的斜杠
+
+    只屏蔽明确易变的部分：12位以上的十六进制ID（容器ID、哈希）和/proc/<pid>，
+    其他数字（IP、端口、文件名中的编号）保留，新的IP、端口或文件在检测阶段仍然不匹配
+
+    Args:
+        text: 原始名称
+        mask_volatile: 是否屏蔽易变部分，网络分支的属性（IP、端口）不屏蔽
+
+    Returns:
+        str: 归一化后的名称
+    """
+    text = text.strip().lower()
+    if text.startswith('/'):
+        text = _SLASHES.sub('/', text)
+        if len(text) > 1:
+            text = text.rstrip('/')
+    if mask_volatile:
+        text = _HEX_ID.sub('<id>', text)
+        if text.startswith('/proc/'):
+            # /proc/<pid> 统一为 /proc/self
+            text = _PROC_PID.sub('/proc/self', text)
+    return text
+
+
+def _trigrams(text: str) -> List[str]:
+    padded = f"\x02{text}\x03"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _dice(a: str, b: str) -> float:
+    grams_a, grams_b = set(_trigrams(a)), set(_trigrams(b))
+    if not grams_a and not grams_b:
+        # 两个空字符串
+        return 1.0
+    return 2.0 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+class MatchStats:
+    """统计每个匹配层级解决的查找次数"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = dict.fromkeys(TIERS, 0)
+
+    def record(self, tier: str):
+        self.counts[tier] += 1
+
+    def reset(self):
+        for tier in TIERS:
+            self.counts[tier] = 0
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """
+        生成匹配层级报告
+
+        Returns:
+            dict: 每个层级的查找次数和占比
+        """
+        total = sum(self.counts.values())
+        return {
+            tier: {
+                "lookups": count,
+                "ratio": count / total if total else 0.0,
+            }
+            for tier, count in self.counts.items()
+        }
+
+
+# 进程内所有节点共享的统计
+MATCH_STATS = MatchStats()
+
+# 语义层级的耗时在每次查找时累加，由微批匹配器从build阶段中扣除后单独记录
+SEMANTIC_MATCH_TIMER = StageTimer("semantic_match")
+
+
+def get_match_report() -> Dict[str, Dict[str, float]]:
+    """返回各匹配层级解决的查找次数报告"""
+    return MATCH_STATS.report()
+
+
+class ChildIndex:
+    """
+    节点子名称的分层匹配索引
+
+    精确匹配未命中后依次尝试：归一化匹配 -> trigram相似度 -> 语义向量匹配，
+    只有前面的层级都无法确定时才会调用语义模型。
+    trigram和语义层级只接受数字（屏蔽易变部分后）完全相同的名称，新的IP、端口或编号文件不会被合并；
+    不屏蔽易变部分的索引（网络分支）不使用trigram层级。
+    归一化命中只说明两个名称仅在易变部分不同、不需要语义模型，返回的相似度是原始名称的trigram相似度，
+    不作为精确匹配计分
+    """
+
+    def __init__(
+        self,
+        keys: Iterable[str] = (),
+        trigram_threshold: float = DEFAULT_TRIGRAM_THRESHOLD,
+        max_postings: int = DEFAULT_MAX_POSTINGS,
+        mask_volatile: bool = True,
+    ):
+        """
+        初始化子节点索引
+
+        Args:
+            keys: 已有的子节点名称
+            trigram_threshold: trigram Dice相似度达到该值即视为匹配
+            max_postings: trigram倒排表长度上限，超过的trigram在查找时忽略
+            mask_volatile: 归一化时是否屏蔽易变部分（见normalize_name）
+        """
+        self.trigram_threshold = trigram_threshold
+        self.max_postings = max_postings
+        self.mask_volatile = mask_volatile
+        self.keys: List[str] = []
+        self.normalized: Dict[str, str] = {}
+        self.gram_counts: List[int] = []
+        self.postings: Dict[str, List[int]] = {}
+        # 语义向量矩阵只在第一次走到语义层级时创建
+        self.semantic: Optional[CandidateMatrix] = None
+        for key in keys:
+            self.add(key)
+
+    def add(self, key: str):
+        """
+        将新的子节点名称加入索引
+
+        Args:
+            key: 子节点名称
+        """
+        key_id = len(self.keys)
+        self.keys.append(key)
+        norm = normalize_name(key, self.mask_volatile)
+        self.normalized.setdefault(norm, key)
+        grams = set(_trigrams(norm))
+        self.gram_counts.append(len(grams))
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(key_id)
+        if self.semantic is not None:
+            self.semantic.add(key)
+
+    def _trigram_match(self, norm: str) -> Tuple[Optional[str], float]:
+        grams = set(_trigrams(norm))
+        shared: Counter = Counter()
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting and len(posting) <= self.max_postings:
+                shared.update(posting)
+        if not shared:
+            return None, 0.0
+        # 按Dice相似度选择，而不是共享的trigram数（长名称共享的trigram多，但不一定更接近）
+        key_id, score = max(
+            ((key_id, 2.0 * overlap / (len(grams) + self.gram_counts[key_id])) for key_id, overlap in shared.items()),
+            key=lambda item: item[1],
+        )
+        return self.keys[key_id], score
+
+    def _same_numbers(self, norm: str, key: str) -> bool:
+        """两个名称中的数字（屏蔽易变部分后）是否完全相同"""
+        return _NUMBERS.findall(norm) == _NUMBERS.findall(normalize_name(key, self.mask_volatile))
+
+    def lexical_match(self, query: str) -> Tuple[Optional[str], float, str]:
+        """
+        只用归一化和trigram层级查找，不调用语义模型，也不计入匹配统计
+
+        Args:
+            query: 待匹配的名称
+
+        Returns:
+            tuple: (匹配的名称, 相似度, 层级)，未匹配时名称为None、层级为"miss"，相似度为最接近的trigram相似度
+        """
+        norm = normalize_name(query, self.mask_volatile)
+        key = self.normalized.get(norm)
+        if key is not None:
+            return key, _dice(query.strip().lower(), key.strip().lower()), "normalized"
+
+        score = 0.0
+        if self.mask_volatile:
+            key, score = self._trigram_match(norm)
+            if key is not None and score >= self.trigram_threshold and self._same_numbers(norm, key):
+                return key, score, "trigram"
+        return None, score, "miss"
+
+    def match(self, query: str, semantic: bool = True) -> Tuple[Optional[str], float]:
+        """
+        在子节点中查找与query匹配的名称，精确匹配由调用方在子节点字典上完成
+
+        Args:
+            query: 待匹配的名称
+            semantic: 前面层级都未命中时是否调用语义模型
+
+        Returns:
+            tuple: (匹配的名称, 相似度)，未匹配时名称为None
+        """
+        key, score, tier = self.lexical_match(query)
+        if key is not None:
+            MATCH_STATS.record(tier)
+            return key, score
+
+        if semantic:
+            start = SEMANTIC_MATCH_TIMER.start()
+            norm = normalize_name(query, self.mask_volatile)
+            if self.semantic is None:
+                self.semantic = CandidateMatrix(self.keys)
+            key, semantic_score = best_semantic_match(query, self.semantic)
+            SEMANTIC_MATCH_TIMER.add(start)
+            if key is not None and self._same_numbers(norm, key):
+                MATCH_STATS.record("semantic")
+                return key, semantic_score
+
+        MATCH_STATS.record("miss")
+        return None, score
+
+    def nearest(self, query: str, semantic: bool = True) -> Tuple[Optional[str], float]:
+        """
+        返回与query最接近的名称和相似度，不论是否达到匹配阈值，用于报告未匹配的查找
+
+        Args:
+            query: 未匹配的名称
+            semantic: 是否使用语义相似度（否则使用trigram相似度）
+
+        Returns:
+            tuple: (最接近的名称, 相似度)，没有子节点时为(None, 0.0)
+        """
+        if not self.keys:
+            return None, 0.0
+        if semantic:
+            if self.semantic is None:
+                self.semantic = CandidateMatrix(self.keys)
+            # match()刚编码过query，这里命中向量缓存
+            return best_semantic_match(query, self.semantic, threshold=float("-inf"))
+        return self._trigram_match(normalize_name(query, self.mask_volatile))
@@ -0,0 +1,401 @@
+import time
+from array import array
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+from .tree_node import _WALL_CLOCK_OFFSET_NS
+
+# 表示“没有节点”的下标（根节点的父节点、链表结尾）
+NO_NODE = -1
+# 子节点索引的key把父节点下标和名称ID打包成一个整数，比(parent, name_id)元组省内存
+_NAME_ID_BITS = 32
+
+
+class ColumnarStore:
+    """
+    以并行数组保存的HBT树
+
+    每个节点是若干数组中的同一个下标：parent、name_id、type_id、events_count，
+    以及用于按插入顺序遍历子节点的first_child/last_child/next_sibling链表。
+    名称和类型保存在字符串表中，(父节点, 名称ID) -> 节点的哈希索引提供O(1)的子节点查找。
+    数组都是array.array，可以零拷贝地导出为NumPy数组，快照和比较模型时无需遍历Python对象
+    """
+
+    def __init__(self, root_name: str = "root", root_type: str = "root"):
+        """
+        初始化列式存储并创建根节点
+
+        Args:
+            root_name: 根节点名称
+            root_type: 根节点类型
+        """
+        # 下标类数组用32位整数，计数和时间戳用64位整数
+        self.strings: List[str] = []
+        self.string_ids: Dict[str, int] = {}
+
+        self.parent = array("i")
+        self.name_id = array("i")
+        self.type_id = array("i")
+        self.events_count = array("q")
+        self.updated_ns = array("q")
+        self.first_child = array("i")
+        self.last_child = array("i")
+        self.next_sibling = array("i")
+        self.child_count = array("i")
+
+        # (父节点下标 << 32 | 名称ID) -> 子节点下标
+        self.index: Dict[int, int] = {}
+        # 大多数节点没有元数据和匹配索引，按节点下标稀疏保存
+        self.metadata: Dict[int, Dict[str, Any]] = {}
+        self.child_indexes: Dict[int, Any] = {}
+
+        self._append(NO_NODE, root_name, root_type)
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    @property
+    def root(self) -> "ColumnarNode":
+        """根节点视图"""
+        return ColumnarNode(self, 0)
+
+    def intern(self, text: str) -> int:
+        """
+        返回字符串在字符串表中的ID，不存在时加入
+
+        Args:
+            text: 字符串
+
+        Returns:
+            int: 字符串ID
+        """
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(text)
+            self.string_ids[text] = string_id
+        return string_id
+
+    def _append(self, parent: int, name: str, node_type: str) -> int:
+        node = len(self.parent)
+        name_id = self.intern(name)
+        self.parent.append(parent)
+        self.name_id.append(name_id)
+        self.type_id.append(self.intern(node_type))
+        self.events_count.append(0)
+        self.updated_ns.append(time.monotonic_ns())
+        self.first_child.append(NO_NODE)
+        self.last_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.child_count.append(0)
+        if parent != NO_NODE:
+            self.index[parent << _NAME_ID_BITS | name_id] = node
+            if self.last_child[parent] == NO_NODE:
+                self.first_child[parent] = node
+            else:
+                self.next_sibling[self.last_child[parent]] = node
+            self.last_child[parent] = node
+            self.child_count[parent] += 1
+        return node
+
+    def find_child(self, parent: int, name: str) -> int:
+        """
+        O(1)查找子节点
+
+        Args:
+            parent: 父节点下标
+            name: 子节点名称
+
+        Returns:
+            int: 子节点下标，不存在时为NO_NODE
+        """
+        name_id = self.string_ids.get(name)
+        if name_id is None:
+            return NO_NODE
+        return self.index.get(parent << _NAME_ID_BITS | name_id, NO_NODE)
+
+    def add_child(self, parent: int, name: str, node_type: str) -> int:
+        """
+        添加子节点，已存在时返回已有节点
+
+        Args:
+            parent: 父节点下标
+            name: 子节点名称
+            node_type: 子节点类型
+
+        Returns:
+            int: 子节点下标
+        """
+        node = self.find_child(parent, name)
+        if node == NO_NODE:
+            node = self._append(parent, name, node_type)
+            child_index = self.child_indexes.get(parent)
+            if child_index is not None:
+                child_index.add(name)
+        return node
+
+    def iter_children(self, parent: int) -> Iterator[int]:
+        """按插入顺序遍历子节点下标"""
+        node = self.first_child[parent]
+        while node != NO_NODE:
+            yield node
+            node = self.next_sibling[node]
+
+    def increment(self, nodes: Iterable[int], count: int = 1):
+        """
+        批量增加节点的事件计数
+
+        Args:
+            nodes: 节点下标
+            count: 每个节点增加的数量
+        """
+        events_count = self.events_count
+        now = time.monotonic_ns()
+        for node in nodes:
+            events_count[node] += count
+            self.updated_ns[node] = now
+
+    def subtree_size(self, node: int) -> int:
+        """统计以node为根的子树中的节点数量（包括自身）"""
+        if node == 0:
+            return len(self.parent)
+        count = 0
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            count += 1
+            stack.extend(self.iter_children(current))
+        return count
+
+    def to_dict(self, node: int = 0) -> Dict[str, Any]:
+        """
+        将节点及其子树转换为与TreeNode.to_dict相同的字典格式
+
+        Args:
+            node: 节点下标，默认为根节点
+
+        Returns:
+            dict: 节点的字典表示
+        """
+        strings = self.strings
+        return {
+            "name": strings[self.name_id[node]],
+            "type": strings[self.type_id[node]],
+            "events_count": self.events_count[node],
+            "metadata": self.metadata.get(node) or {},
+            "children": {
+                strings[self.name_id[child]]: self.to_dict(child) for child in self.iter_children(node)
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ColumnarStore":
+        """
+        从字典格式重建列式存储（to_dict的逆操作），按广度优先顺序分配节点下标
+
+        Args:
+            data: 根节点的字典表示
+
+        Returns:
+            ColumnarStore: 重建的存储
+        """
+        store = cls(data["name"], data["type"])
+        queue = [(0, data)]
+        for node, node_dict in queue:
+            store.events_count[node] = node_dict["events_count"]
+            if node_dict["metadata"]:
+                store.metadata[node] = node_dict["metadata"]
+            for child_name, child_dict in node_dict["children"].items():
+                queue.append((store.add_child(node, child_name, child_dict["type"]), child_dict))
+        return store
+
+    @classmethod
+    def from_arrays(cls, strings: List[str], parent: array, name_id: array, type_id: array,
+                    events_count: array, updated_ns: array) -> "ColumnarStore":
+        """
+        直接用节点数组构建存储，子节点链表和哈希索引一次线性扫描重建
+
+        节点必须按父节点在前、兄弟节点按插入顺序排列（即本存储自身的下标顺序），数组被存储直接持有
+
+        Args:
+            strings: 字符串表（不能有重复）
+            parent: 父节点下标（根节点为NO_NODE）
+            name_id: 名称ID
+            type_id: 类型ID
+            events_count: 事件计数
+            updated_ns: 更新时间（monotonic纳秒）
+
+        Returns:
+            ColumnarStore: 构建的存储
+        """
+        store = cls.__new__(cls)
+        store.strings = list(strings)
+        store.string_ids = {text: string_id for string_id, text in enumerate(store.strings)}
+        store.parent = parent
+        store.name_id = name_id
+        store.type_id = type_id
+        store.events_count = events_count
+        store.updated_ns = updated_ns
+        size = len(parent)
+        first_child = array("i", [NO_NODE]) * size
+        last_child = array("i", [NO_NODE]) * size
+        next_sibling = array("i", [NO_NODE]) * size
+        child_count = array("i", [0]) * size
+        index: Dict[int, int] = {}
+        for node in range(1, size):
+            parent_node = parent[node]
+            index[parent_node << _NAME_ID_BITS | name_id[node]] = node
+            if last_child[parent_node] == NO_NODE:
+                first_child[parent_node] = node
+            else:
+                next_sibling[last_child[parent_node]] = node
+            last_child[parent_node] = node
+            child_count[parent_node] += 1
+        store.first_child = first_child
+        store.last_child = last_child
+        store.next_sibling = next_sibling
+        store.child_count = child_count
+        store.index = index
+        store.metadata = {}
+        store.child_indexes = {}
+        return store
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """
+        零拷贝地把节点数组导出为NumPy数组
+
+        返回的数组与存储共享内存；持有这些数组期间不能再添加节点（array.array在被导出时不能扩容），
+        需要在添加节点前释放，或自行调用.copy()
+
+        Returns:
+            dict: 列名 -> numpy.ndarray，另含"strings"字符串表
+        """
+        import numpy as np
+
+        columns = {
+            name: np.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode)
+            for name in ("parent", "name_id", "type_id", "events_count", "first_child", "next_sibling")
+        }
+        columns["strings"] = self.strings
+        return columns
+
+
+class _ChildrenView(Mapping):
+    """节点子节点的只读映射视图：名称 -> ColumnarNode"""
+
+    __slots__ = ("store", "node")
+
+    def __init__(self, store: ColumnarStore, node: int):
+        self.store = store
+        self.node = node
+
+    def __getitem__(self, name: str) -> "ColumnarNode":
+        child = self.store.find_child(self.node, name)
+        if child == NO_NODE:
+            raise KeyError(name)
+        return ColumnarNode(self.store, child)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self.store.find_child(self.node, name) != NO_NODE
+
+    def __iter__(self) -> Iterator[str]:
+        strings, name_id = self.store.strings, self.store.name_id
+        for child in self.store.iter_children(self.node):
+            yield strings[name_id[child]]
+
+    def __len__(self) -> int:
+        return self.store.child_count[self.node]
+
+
+class ColumnarNode:
+    """
+    ColumnarStore中一个节点的轻量视图，提供与TreeNode相同的接口，
+    使分支处理器无需区分两种存储
+    """
+
+    __slots__ = ("store", "node")
+
+    def __init__(self, store: ColumnarStore, node: int):
+        self.store = store
+        self.node = node
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ColumnarNode) and other.store is self.store and other.node == self.node
+
+    def __hash__(self) -> int:
+        return hash((id(self.store), self.node))
+
+    @property
+    def name(self) -> str:
+        return self.store.strings[self.store.name_id[self.node]]
+
+    @property
+    def node_type(self) -> str:
+        return self.store.strings[self.store.type_id[self.node]]
+
+    @property
+    def events_count(self) -> int:
+        return self.store.events_count[self.node]
+
+    @events_count.setter
+    def events_count(self, value: int):
+        self.store.events_count[self.node] = value
+
+    @property
+    def children(self) -> Mapping:
+        """子节点映射（只读），通过add_child添加子节点"""
+        return _ChildrenView(self.store, self.node)
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return self.store.metadata.setdefault(self.node, {})
+
+    @metadata.setter
+    def metadata(self, value: Dict[str, Any]):
+        if value:
+            self.store.metadata[self.node] = value
+        else:
+            self.store.metadata.pop(self.node, None)
+
+    @property
+    def last_updated(self) -> datetime:
+        return datetime.fromtimestamp((self.store.updated_ns[self.node] + _WALL_CLOCK_OFFSET_NS) / 1e9)
+
+    @property
+    def child_index(self) -> Optional[Any]:
+        return self.store.child_indexes.get(self.node)
+
+    @child_index.setter
+    def child_index(self, value: Optional[Any]):
+        if value is None:
+            self.store.child_indexes.pop(self.node, None)
+        else:
+            self.store.child_indexes[self.node] = value
+
+    def add_child(self, child_name: str, child_type: str) -> "ColumnarNode":
+        return ColumnarNode(self.store, self.store.add_child(self.node, child_name, child_type))
+
+    def get_child(self, child_name: str) -> Optional["ColumnarNode"]:
+        child = self.store.find_child(self.node, child_name)
+        return None if child == NO_NODE else ColumnarNode(self.store, child)
+
+    def has_children(self) -> bool:
+        return self.store.child_count[self.node] > 0
+
+    def child_names(self) -> Iterable[str]:
+        return iter(_ChildrenView(self.store, self.node))
+
+    def increment_events_count(self, count: int = 1):
+        self.store.increment((self.node,), count)
+
+    def update_metadata(self, key: str, value: Any):
+        self.metadata[key] = value
+        self.store.updated_ns[self.node] = time.monotonic_ns()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self.store.to_dict(self.node)
+
+    def count_nodes(self) -> int:
+        return self.store.subtree_size(self.node)
+
@@ -2,20 +2,23 @@
 
 from __future__ import annotations
 
-from functools import lru_cache
+from collections import OrderedDict
 from itertools import islice
-from typing import Iterable, Iterator, List, Sequence
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+import atexit
+import json
 import logging
+import os
+import threading
+import time
+import zlib
 
-try:  # Import optional dependencies lazily so we can emit friendly errors.
-    import torch  # type: ignore[import]
-    from transformers import AutoModel, AutoTokenizer  # type: ignore[import]
-except ImportError as exc:  # pragma: no cover - depends on optional deps.
-    raise ImportError(
-        "Embedding utilities require `torch` and `transformers`. "
-        "Install them with `pip install torch transformers`."
-    ) from exc
+from ..utils.metrics import record_embedding_inference, timer_start
+
+# Heavy optional dependencies are imported on first use (see ``_import_torch``)
+# so that importing the branch handlers stays cheap.
+torch = None
 
 LOGGER = logging.getLogger(__name__)
 
@@ -23,6 +26,40 @@ DEFAULT_MODEL_NAME = "BAAI/bge-m3"
 DEFAULT_BATCH_SIZE = 16
 DEFAULT_MAX_LENGTH = 512
 DEFAULT_THRESHOLD = 0.83
+DEFAULT_CACHE_SIZE = 65536
+DEFAULT_CACHE_FLUSH_INTERVAL = 1024
+# Rows the in-memory cache matrix starts with; it doubles up to ``max_size`` as it fills.
+CACHE_INITIAL_ROWS = 4096
+DEFAULT_CACHE_PATH = os.getenv("HANABI_EMBEDDING_CACHE_PATH")
+DEFAULT_BACKEND = os.getenv("HANABI_EMBEDDING_BACKEND", "transformer")
+# Overrides the backend's own default model (an ONNX export directory for ``onnx``).
+DEFAULT_BACKEND_MODEL = os.getenv("HANABI_EMBEDDING_MODEL")
+# Overrides the backend's ``DEFAULT_THRESHOLD``, e.g. with a value from ``calibrate_threshold``.
+THRESHOLD_OVERRIDE = os.getenv("HANABI_EMBEDDING_THRESHOLD")
+
+
+def _import_torch():
+    global torch
+    if torch is None:
+        try:
+            import torch as torch_module  # type: ignore[import]
+        except ImportError as exc:  # pragma: no cover - depends on optional deps.
+            raise ImportError(
+                "Embedding utilities require `torch`. Install it with `pip install torch`."
+            ) from exc
+        torch = torch_module
+    return torch
+
+
+def _import_transformers():
+    try:
+        from transformers import AutoModel, AutoTokenizer  # type: ignore[import]
+    except ImportError as exc:  # pragma: no cover - depends on optional deps.
+        raise ImportError(
+            "The transformer embedding backends require `transformers`. "
+            "Install it with `pip install transformers`."
+        ) from exc
+    return AutoModel, AutoTokenizer
 
 
 def _batch_iterator(items: Sequence[str], batch_size: int) -> Iterator[List[str]]:
@@ -42,26 +79,305 @@ def _mean_pool(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) ->
     return summed / counts
 
 
-class _EmbeddingBackend:
+class EmbeddingCache:
+    """Bounded LRU ``text -> embedding`` cache.
+
+    Vectors live in one ``(rows, dim)`` float32 matrix; evicted slots are reused
+    in place. In memory the matrix starts at ``CACHE_INITIAL_ROWS`` rows and
+    doubles as it fills, so a large ``max_size`` costs nothing until it is
+    used. When ``path`` is given the matrix is a sparse memory-mapped file of
+    ``max_size`` rows and the ``text -> slot`` index is written next to it as
+    ``<path>.index.json``, so a restarted process can reuse the vocabulary it
+    already embedded.
+
+    The index records ``key`` (the backend and model that produced the
+    vectors) and is discarded when a different backend opens the same path.
+    Each entry also carries a CRC32 of its row: slots evicted and overwritten
+    after the last flush no longer match and are dropped on load instead of
+    serving the new vector under the old text.
+    """
+
+    INDEX_VERSION = 2
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_CACHE_SIZE,
+        *,
+        path: str | None = None,
+        flush_interval: int = DEFAULT_CACHE_FLUSH_INTERVAL,
+        key: str | None = None,
+    ) -> None:
+        if max_size <= 0:
+            raise ValueError("max_size must be positive.")
+        _import_torch()
+        self._max_size = max_size
+        self._path = path
+        self._flush_interval = flush_interval
+        self._key = key
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        # slot -> CRC32 of the row it holds, persisted with the index.
+        self._checksums: Dict[int, int] = {}
+        # Slots below ``_next_slot`` left unused by entries dropped on load.
+        self._free: List[int] = []
+        self._storage: Optional[torch.Tensor] = None
+        self._dim: Optional[int] = None
+        self._next_slot = 0
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if path is not None:
+            self._load_index()
+            atexit.register(self.flush)
+
+    @property
+    def index_path(self) -> str | None:
+        return None if self._path is None else self._path + ".index.json"
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def __contains__(self, text: str) -> bool:
+        return text in self._slots
+
+    def _allocate(self, dim: int) -> None:
+        self._dim = dim
+        if self._path is None:
+            self._storage = torch.zeros((min(self._max_size, CACHE_INITIAL_ROWS), dim), dtype=torch.float32)
+            return
+        size = self._max_size * dim
+        with open(self._path, "ab") as handle:
+            handle.truncate(size * 4)
+        flat = torch.from_file(self._path, shared=True, size=size, dtype=torch.float32)
+        self._storage = flat.view(self._max_size, dim)
+
+    def _grow(self) -> None:
+        rows = min(self._max_size, 2 * self._storage.shape[0])
+        storage = torch.zeros((rows, self._dim), dtype=torch.float32)
+        storage[: self._storage.shape[0]] = self._storage
+        self._storage = storage
+
+    def _load_index(self) -> None:
+        index_path = self.index_path
+        if not os.path.exists(index_path) or not os.path.exists(self._path):
+            return
+        try:
+            with open(index_path, "r", encoding="utf-8") as handle:
+                index = json.load(handle)
+        except (OSError, ValueError) as exc:
+            LOGGER.warning("Ignoring unreadable embedding cache index %s: %s", index_path, exc)
+            return
+        if index.get("version") != self.INDEX_VERSION or index.get("key") != self._key:
+            LOGGER.info("Embedding cache %s was written by %s; discarding it", index_path, index.get("key"))
+            return
+        if index.get("max_size") != self._max_size:
+            LOGGER.info("Embedding cache size changed; discarding %s", index_path)
+            return
+
+        self._allocate(int(index["dim"]))
+        stale = 0
+        for text, slot, checksum in index["slots"]:
+            if _row_checksum(self._storage[slot]) != checksum:
+                stale += 1
+                continue
+            self._slots[text] = slot
+            self._checksums[slot] = checksum
+        self._next_slot = max(self._checksums, default=-1) + 1
+        self._free = [slot for slot in range(self._next_slot) if slot not in self._checksums]
+        if stale:
+            LOGGER.info("Dropped %d embeddings overwritten after the last flush of %s", stale, index_path)
+        LOGGER.debug("Loaded %d cached embeddings from %s", len(self._slots), self._path)
+
+    def get(self, text: str) -> Optional[torch.Tensor]:
+        """Return the cached vector for ``text`` (a copy), or ``None``."""
+
+        with self._lock:
+            slot = self._slots.get(text)
+            if slot is None:
+                self.misses += 1
+                return None
+            self._slots.move_to_end(text)
+            self.hits += 1
+            return self._storage[slot].clone()
+
+    def put(self, text: str, vector: torch.Tensor) -> None:
+        """Store ``vector`` for ``text``, evicting the least recently used entry if full."""
+
+        with self._lock:
+            if self._storage is None:
+                self._allocate(int(vector.shape[-1]))
+            elif vector.shape[-1] != self._dim:
+                raise ValueError(f"Embedding dim {vector.shape[-1]} does not match the cache dim {self._dim}.")
+
+            slot = self._slots.get(text)
+            if slot is not None:
+                self._slots.move_to_end(text)
+            elif self._free:
+                slot = self._free.pop()
+            elif self._next_slot < self._max_size:
+                slot = self._next_slot
+                self._next_slot += 1
+                if slot == self._storage.shape[0]:
+                    self._grow()
+            else:
+                _, slot = self._slots.popitem(last=False)
+                self.evictions += 1
+            self._slots[text] = slot
+            self._storage[slot] = vector.detach().to(dtype=torch.float32)
+            if self._path is not None:
+                self._checksums[slot] = _row_checksum(self._storage[slot])
+            self._dirty += 1
+            should_flush = self._path is not None and self._dirty >= self._flush_interval
+
+        if should_flush:
+            self.flush()
+
+    def peek_many(self, texts: Sequence[str]) -> Tuple[List[int], Optional[torch.Tensor]]:
+        """Return ``(positions in texts, rows)`` of the cached ``texts``.
+
+        Unlike :meth:`get` this leaves the LRU order and hit counters alone.
+        """
+
+        with self._lock:
+            positions = [position for position, text in enumerate(texts) if text in self._slots]
+            if not positions:
+                return [], None
+            slots = torch.tensor([self._slots[texts[position]] for position in positions], dtype=torch.long)
+            return positions, self._storage.index_select(0, slots)
+
+    def flush(self) -> None:
+        """Persist the ``text -> slot`` index next to the memory-mapped matrix."""
+
+        if self._path is None:
+            return
+        with self._lock:
+            if self._dim is None or not self._dirty:
+                return
+            index = {
+                "version": self.INDEX_VERSION,
+                "key": self._key,
+                "max_size": self._max_size,
+                "dim": self._dim,
+                "slots": [[text, slot, self._checksums[slot]] for text, slot in self._slots.items()],
+            }
+            self._dirty = 0
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(index, handle, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._slots),
+            "max_size": self._max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def _row_checksum(row: torch.Tensor) -> int:
+    return zlib.crc32(row.numpy().tobytes())
+
+
+class EmbeddingBackend:
+    """Interface of the text encoders behind the semantic helpers.
+
+    Subclasses implement :meth:`_encode_uncached` and return L2-normalized
+    float32 rows on CPU. Each backend ships its own ``DEFAULT_THRESHOLD`` since
+    cosine scores are not comparable across models.
+    """
+
+    NAME = ""
+    DEFAULT_MODEL_NAME: str | None = None
+    DEFAULT_THRESHOLD = DEFAULT_THRESHOLD
+
+    def __init__(
+        self,
+        model_name: str | None = None,
+        *,
+        device: str | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_length: int = DEFAULT_MAX_LENGTH,
+        use_fp16: bool = True,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        cache_path: str | None = None,
+    ) -> None:
+        _import_torch()
+        self.model_name = model_name or self.DEFAULT_MODEL_NAME
+        if THRESHOLD_OVERRIDE:
+            self.DEFAULT_THRESHOLD = float(THRESHOLD_OVERRIDE)
+        self._batch_size = batch_size
+        self._max_length = max_length
+        self.cache = EmbeddingCache(cache_size, path=cache_path, key=_backend_id(self)) if cache_size else None
+
+    def encode(self, texts: Sequence[str], batch_size: int | None = None) -> torch.Tensor:
+        if not texts:
+            raise ValueError("No texts provided for encoding.")
+
+        normalized: List[str] = [text.strip() for text in texts if text and text.strip()]
+        if not normalized:
+            raise ValueError("All texts were empty after stripping whitespace.")
+
+        if self.cache is None:
+            return self._encode_timed(normalized, batch_size)
+
+        rows: List[Optional[torch.Tensor]] = [self.cache.get(text) for text in normalized]
+        missing = list(dict.fromkeys(text for text, row in zip(normalized, rows) if row is None))
+        if missing:
+            encoded = dict(zip(missing, self._encode_timed(missing, batch_size)))
+            for text, vector in encoded.items():
+                self.cache.put(text, vector)
+            rows = [encoded[text] if row is None else row for text, row in zip(normalized, rows)]
+
+        return torch.stack(rows)
+
+    def _encode_timed(self, normalized: Sequence[str], batch_size: int | None = None) -> torch.Tensor:
+        start = timer_start()
+        vectors = self._encode_uncached(normalized, batch_size)
+        record_embedding_inference(self.NAME, start, len(normalized))
+        return vectors
+
+    def _encode_uncached(self, normalized: Sequence[str], batch_size: int | None = None) -> torch.Tensor:
+        raise NotImplementedError
+
+
+class TransformerBackend(EmbeddingBackend):
     """Thin wrapper around a HF model/tokenizer pair."""
 
+    NAME = "transformer"
+    DEFAULT_MODEL_NAME = DEFAULT_MODEL_NAME
+    DEFAULT_THRESHOLD = DEFAULT_THRESHOLD
+
     def __init__(
         self,
-        model_name: str = DEFAULT_MODEL_NAME,
+        model_name: str | None = None,
         *,
         device: str | None = None,
         batch_size: int = DEFAULT_BATCH_SIZE,
         max_length: int = DEFAULT_MAX_LENGTH,
         use_fp16: bool = True,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        cache_path: str | None = None,
     ) -> None:
+        super().__init__(
+            model_name,
+            batch_size=batch_size,
+            max_length=max_length,
+            cache_size=cache_size,
+            cache_path=cache_path,
+        )
         resolved_device = device or ("cuda" if torch.cuda.is_available() else "cpu")
         self._device = torch.device(resolved_device)
-        self._batch_size = batch_size
-        self._max_length = max_length
 
-        LOGGER.debug("Loading tokenizer and model for %s on %s", model_name, self._device)
-        self._tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self._model = AutoModel.from_pretrained(model_name)
+        LOGGER.debug("Loading tokenizer and model for %s on %s", self.model_name, self._device)
+        _, auto_tokenizer = _import_transformers()
+        self._tokenizer = auto_tokenizer.from_pretrained(self.model_name)
+        self._model = self._load_model()
 
         if use_fp16 and self._device.type == "cuda":
             self._model = self._model.half()
@@ -69,17 +385,14 @@ class _EmbeddingBackend:
         self._model.to(self._device)
         self._model.eval()
 
-    def encode(self, texts: Sequence[str]) -> torch.Tensor:
-        if not texts:
-            raise ValueError("No texts provided for encoding.")
-
-        normalized: List[str] = [text.strip() for text in texts if text and text.strip()]
-        if not normalized:
-            raise ValueError("All texts were empty after stripping whitespace.")
+    def _load_model(self):
+        auto_model, _ = _import_transformers()
+        return auto_model.from_pretrained(self.model_name)
 
+    def _encode_uncached(self, normalized: Sequence[str], batch_size: int | None = None) -> torch.Tensor:
         embeddings: List[torch.Tensor] = []
         with torch.inference_mode():
-            for batch in _batch_iterator(normalized, self._batch_size):
+            for batch in _batch_iterator(normalized, batch_size or self._batch_size):
                 tokens = self._tokenizer(
                     batch,
                     padding=True,
@@ -91,39 +404,486 @@ class _EmbeddingBackend:
                 outputs = self._model(**tokens)
                 pooled = _mean_pool(outputs.last_hidden_state, tokens["attention_mask"])
                 normalized_batch = torch.nn.functional.normalize(pooled, p=2, dim=1)
-                embeddings.append(normalized_batch.cpu())
+                embeddings.append(normalized_batch.float().cpu())
 
         return torch.cat(embeddings, dim=0)
 
 
-@lru_cache(maxsize=1)
+class QuantizedTransformerBackend(TransformerBackend):
+    """Same HF model with its Linear layers dynamically quantized to int8 (CPU only)."""
+
+    NAME = "quantized"
+    # int8 weights slightly compress the score distribution of bge-m3.
+    DEFAULT_THRESHOLD = 0.82
+
+    def __init__(self, model_name: str | None = None, **kwargs) -> None:
+        kwargs["device"] = "cpu"
+        kwargs["use_fp16"] = False
+        super().__init__(model_name, **kwargs)
+
+    def _load_model(self):
+        model = super()._load_model()
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend(TransformerBackend):
+    """ONNX Runtime session over an exported model directory.
+
+    ``model_name`` is required and points at a directory holding ``model.onnx``
+    next to the tokenizer files, as produced by ``optimum-cli export onnx``.
+    The threshold is not calibrated for any particular export: it starts from
+    the fp32 bge-m3 value, and ``calibrate_threshold`` should be run against
+    the export, with the result set through ``HANABI_EMBEDDING_THRESHOLD``.
+    """
+
+    NAME = "onnx"
+    DEFAULT_MODEL_NAME = None
+    # Uncalibrated; see the class docstring.
+    DEFAULT_THRESHOLD = DEFAULT_THRESHOLD
+
+    def __init__(self, model_name: str | None = None, **kwargs) -> None:
+        if not model_name or not os.path.isfile(os.path.join(model_name, "model.onnx")):
+            raise ValueError(
+                "The onnx embedding backend needs HANABI_EMBEDDING_MODEL set to an export directory "
+                f"containing model.onnx and the tokenizer files (got {model_name!r}); "
+                "create one with `optimum-cli export onnx --model BAAI/bge-m3 <dir>`."
+            )
+        kwargs["device"] = "cpu"
+        kwargs["use_fp16"] = False
+        super().__init__(model_name, **kwargs)
+        if not THRESHOLD_OVERRIDE:
+            LOGGER.warning(
+                "The onnx backend threshold %.2f is not calibrated for %s; run calibrate_threshold() "
+                "and set HANABI_EMBEDDING_THRESHOLD.", self.DEFAULT_THRESHOLD, model_name
+            )
+
+    def _load_model(self):
+        try:
+            import onnxruntime  # type: ignore[import]
+        except ImportError as exc:  # pragma: no cover - depends on optional deps.
+            raise ImportError(
+                "The onnx embedding backend requires `onnxruntime`. "
+                "Install it with `pip install onnxruntime`."
+            ) from exc
+
+        path = os.path.join(self.model_name, "model.onnx")
+        self._session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self._input_names = {item.name for item in self._session.get_inputs()}
+        return torch.nn.Identity()
+
+    def _encode_uncached(self, normalized: Sequence[str], batch_size: int | None = None) -> torch.Tensor:
+        embeddings: List[torch.Tensor] = []
+        for batch in _batch_iterator(normalized, batch_size or self._batch_size):
+            tokens = self._tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self._max_length,
+                return_tensors="np",
+            )
+            feeds = {key: value for key, value in tokens.items() if key in self._input_names}
+            last_hidden_state = torch.from_numpy(self._session.run(None, feeds)[0])
+            attention_mask = torch.from_numpy(tokens["attention_mask"])
+            pooled = _mean_pool(last_hidden_state.float(), attention_mask)
+            embeddings.append(torch.nn.functional.normalize(pooled, p=2, dim=1))
+
+        return torch.cat(embeddings, dim=0)
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Small sentence-transformers model, e.g. MiniLM (~90 MB, fast on CPU)."""
+
+    NAME = "sentence-transformer"
+    DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+    # MiniLM scores unrelated short tokens lower than bge-m3 does.
+    DEFAULT_THRESHOLD = 0.75
+
+    def __init__(
+        self,
+        model_name: str | None = None,
+        *,
+        device: str | None = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_length: int = DEFAULT_MAX_LENGTH,
+        use_fp16: bool = True,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        cache_path: str | None = None,
+    ) -> None:
+        super().__init__(
+            model_name,
+            batch_size=batch_size,
+            max_length=max_length,
+            cache_size=cache_size,
+            cache_path=cache_path,
+        )
+        try:
+            from sentence_transformers import SentenceTransformer  # type: ignore[import]
+        except ImportError as exc:  # pragma: no cover - depends on optional deps.
+            raise ImportError(
+                "The sentence-transformer embedding backend requires `sentence-transformers`. "
+                "Install it with `pip install sentence-transformers`."
+            ) from exc
+
+        self._model = SentenceTransformer(self.model_name, device=device)
+        self._model.max_seq_length = min(self._model.max_seq_length or max_length, max_length)
+        if use_fp16 and self._model.device.type == "cuda":
+            self._model = self._model.half()
+
+    def _encode_uncached(self, normalized: Sequence[str], batch_size: int | None = None) -> torch.Tensor:
+        embeddings = self._model.encode(
+            list(normalized),
+            batch_size=batch_size or self._batch_size,
+            convert_to_tensor=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return embeddings.float().cpu()
+
+
+class HashingBackend(EmbeddingBackend):
+    """Static character n-gram hashing vectors; no model, microseconds per text.
+
+    Each text is lowercased, its 3- to 5-grams are hashed (CRC32, so vectors are
+    stable across processes and persisted caches) into ``dim`` signed buckets,
+    and the result is L2-normalized. Similarity is therefore purely lexical.
+    """
+
+    NAME = "hashing"
+    DEFAULT_MODEL_NAME = "char-ngram-3-5"
+    # Near-duplicate Falco values (execve/execveat, adjacent ports) score 0.65-0.8,
+    # unrelated ones stay below 0.3.
+    DEFAULT_THRESHOLD = 0.6
+    DIM = 512
+    NGRAM_SIZES = (3, 4, 5)
+
+    def _encode_uncached(self, normalized: Sequence[str], batch_size: int | None = None) -> torch.Tensor:
+        rows: List[int] = []
+        columns: List[int] = []
+        signs: List[float] = []
+        for row, text in enumerate(normalized):
+            padded = f"<{text.lower()}>"
+            for size in self.NGRAM_SIZES:
+                for start in range(max(1, len(padded) - size + 1)):
+                    digest = zlib.crc32(padded[start:start + size].encode("utf-8"))
+                    rows.append(row)
+                    columns.append(digest % self.DIM)
+                    signs.append(1.0 if digest & 0x80000000 else -1.0)
+
+        embeddings = torch.zeros((len(normalized), self.DIM), dtype=torch.float32)
+        embeddings.index_put_(
+            (torch.tensor(rows), torch.tensor(columns)),
+            torch.tensor(signs),
+            accumulate=True,
+        )
+        return torch.nn.functional.normalize(embeddings, p=2, dim=1)
+
+
+BACKENDS: Dict[str, type] = {
+    backend.NAME: backend
+    for backend in (
+        TransformerBackend,
+        QuantizedTransformerBackend,
+        OnnxBackend,
+        SentenceTransformerBackend,
+        HashingBackend,
+    )
+}
+
+
+def calibrate_threshold(
+    backend: EmbeddingBackend,
+    similar_pairs: Sequence[Tuple[str, str]],
+    dissimilar_pairs: Sequence[Tuple[str, str]],
+) -> float:
+    """Return the cosine cut-off that best separates two labelled pair sets.
+
+    Useful to derive a ``DEFAULT_THRESHOLD`` for a new backend from a handful of
+    Falco field values that should and should not be merged.
+    """
+
+    def _scores(pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        if not pairs:
+            return []
+        left = backend.encode([a for a, _ in pairs])
+        right = backend.encode([b for _, b in pairs])
+        return (left * right).sum(dim=1).tolist()
+
+    positives = _scores(similar_pairs)
+    negatives = _scores(dissimilar_pairs)
+    best_threshold, best_correct = backend.DEFAULT_THRESHOLD, -1
+    for candidate in sorted(set(positives + negatives)):
+        correct = sum(score >= candidate for score in positives) + sum(score < candidate for score in negatives)
+        if correct > best_correct:
+            best_threshold, best_correct = candidate, correct
+    return best_threshold
+
+
+class CandidateMatrix:
+    """Contiguous matrix of normalized candidate embeddings, grown incrementally.
+
+    Keys are queued with :meth:`add` and embedded together on the next
+    :meth:`flush`. Rows follow insertion order and capacity doubles on growth,
+    so scoring every candidate is a single mat-vec.
+    """
+
+    def __init__(self, keys: Iterable[str] = (), initial_capacity: int = 8) -> None:
+        self.keys: List[str] = []
+        self._pending: List[str] = list(keys)
+        self._initial_capacity = max(1, initial_capacity)
+        self._rows: Optional[torch.Tensor] = None
+
+    def __len__(self) -> int:
+        return len(self.keys) + len(self._pending)
+
+    def add(self, key: str) -> None:
+        self._pending.append(key)
+
+    def flush(self, backend: EmbeddingBackend) -> None:
+        """Embed queued keys and append them as rows."""
+
+        if not self._pending:
+            return
+        keys = [key for key in self._pending if key and key.strip()]
+        self._pending = []
+        if not keys:
+            return
+        embeddings = backend.encode(keys)
+
+        start = len(self.keys)
+        needed = start + len(keys)
+        if self._rows is None or self._rows.shape[0] < needed:
+            capacity = self._initial_capacity if self._rows is None else self._rows.shape[0]
+            while capacity < needed:
+                capacity *= 2
+            rows = torch.empty((capacity, embeddings.shape[1]), dtype=torch.float32)
+            if self._rows is not None and start:
+                rows[:start] = self._rows[:start]
+            self._rows = rows
+
+        self._rows[start:needed] = embeddings
+        self.keys.extend(keys)
+
+    def best_match(self, query_embedding: torch.Tensor) -> Tuple[Optional[str], float]:
+        """Return the highest scoring key and its cosine similarity."""
+
+        if not self.keys:
+            return None, 0.0
+        scores = self._rows[: len(self.keys)] @ query_embedding
+        best = int(torch.argmax(scores).item())
+        return self.keys[best], float(scores[best].item())
+
+
+_active_backend: Optional[EmbeddingBackend] = None
+_active_backend_key: Optional[tuple] = None
+_backend_lock = threading.Lock()
+# Vectors handed to import_embeddings() before the backend was loaded.
+_pending_embeddings: List[Tuple[str, List[str], bytes, int]] = []
+_warmup_thread: Optional[threading.Thread] = None
+_warmup_seconds: Optional[float] = None
+
+
 def _get_backend(
-    model_name: str = DEFAULT_MODEL_NAME,
+    model_name: str | None = DEFAULT_BACKEND_MODEL,
     *,
+    backend: str = DEFAULT_BACKEND,
     device: str | None = None,
     batch_size: int = DEFAULT_BATCH_SIZE,
     max_length: int = DEFAULT_MAX_LENGTH,
     use_fp16: bool = True,
-) -> _EmbeddingBackend:
-    return _EmbeddingBackend(
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    cache_path: str | None = DEFAULT_CACHE_PATH,
+) -> EmbeddingBackend:
+    """Return the loaded backend, building it on first use (one backend per process)."""
+
+    global _active_backend, _active_backend_key
+    key = (model_name, backend, device, batch_size, max_length, use_fp16, cache_size, cache_path)
+    if _active_backend_key == key:
+        return _active_backend
+
+    # The lock makes callers wait for an in-flight warm-up instead of loading twice.
+    with _backend_lock:
+        if _active_backend_key == key:
+            return _active_backend
+        try:
+            backend_cls = BACKENDS[backend]
+        except KeyError:
+            raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {sorted(BACKENDS)}.") from None
+        _active_backend = backend_cls(
+            model_name=model_name,
+            device=device,
+            batch_size=batch_size,
+            max_length=max_length,
+            use_fp16=use_fp16,
+            cache_size=cache_size,
+            cache_path=cache_path,
+        )
+        _active_backend_key = key
+        while _pending_embeddings:
+            _seed_cache(_active_backend, *_pending_embeddings.pop(0))
+        return _active_backend
+
+
+def _backend_id(encoder: EmbeddingBackend) -> str:
+    return f"{encoder.NAME}:{encoder.model_name}"
+
+
+def _seed_cache(encoder: EmbeddingBackend, backend_id: str, texts: List[str], data: bytes, dim: int) -> int:
+    if encoder.cache is None or backend_id != _backend_id(encoder):
+        return 0
+    vectors = torch.frombuffer(bytearray(data), dtype=torch.float32).view(len(texts), dim)
+    seeded = 0
+    for text, vector in zip(texts, vectors):
+        if text not in encoder.cache:
+            encoder.cache.put(text, vector)
+            seeded += 1
+    return seeded
+
+
+def export_embeddings(texts: Sequence[str]) -> Tuple[Optional[str], List[int], bytes, int]:
+    """Return the cached vectors of ``texts`` from the loaded backend.
+
+    Returns ``(backend id, positions in texts, float32 rows as bytes, dim)``;
+    the id is ``None`` and nothing is exported while no backend is loaded.
+    """
+
+    encoder = _active_backend
+    if encoder is None or encoder.cache is None:
+        return None, [], b"", 0
+    positions, rows = encoder.cache.peek_many([text.strip() for text in texts])
+    if rows is None:
+        return _backend_id(encoder), [], b"", 0
+    return _backend_id(encoder), positions, rows.contiguous().numpy().tobytes(), int(rows.shape[1])
+
+
+def import_embeddings(backend_id: str, texts: List[str], data: bytes, dim: int) -> int:
+    """Seed the embedding cache with vectors saved by :func:`export_embeddings`.
+
+    Vectors from another backend or model are ignored. If no backend is
+    loaded yet they are applied when it loads; returns the number of vectors
+    added to the cache now.
+    """
+
+    texts = [text.strip() for text in texts]
+    with _backend_lock:
+        if _active_backend is None:
+            _pending_embeddings.append((backend_id, texts, bytes(data), dim))
+            return 0
+    return _seed_cache(_active_backend, backend_id, texts, data, dim)
+
+
+def warm_up(on_ready: Callable[[float], None] | None = None, **backend_options) -> threading.Thread:
+    """Load the embedding backend on a background thread.
+
+    While it loads, :func:`is_backend_loading` is ``True`` so callers can stay
+    on the exact/lexical match path instead of blocking on the model.
+    ``on_ready`` receives the load time in seconds once the backend is usable.
+    """
+
+    global _warmup_thread
+
+    def _load() -> None:
+        global _warmup_seconds
+        started = time.perf_counter()
+        try:
+            _get_backend(**backend_options)
+        except Exception:  # pragma: no cover - depends on optional deps.
+            LOGGER.exception("Embedding backend warm-up failed")
+            return
+        _warmup_seconds = time.perf_counter() - started
+        LOGGER.info("Embedding backend ready after %.2fs", _warmup_seconds)
+        if on_ready is not None:
+            on_ready(_warmup_seconds)
+
+    if _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=_load, name="embedding-warmup", daemon=True)
+        _warmup_thread.start()
+    return _warmup_thread
+
+
+def is_backend_loading() -> bool:
+    """Return ``True`` while a :func:`warm_up` load is still in progress."""
+
+    return _warmup_thread is not None and _warmup_thread.is_alive()
+
+
+def get_warmup_seconds() -> Optional[float]:
+    """Return how long the background warm-up took, or ``None`` if not finished."""
+
+    return _warmup_seconds
+
+
+def get_threshold(backend: str = DEFAULT_BACKEND) -> float:
+    """Return the similarity threshold of the named backend (``HANABI_EMBEDDING_THRESHOLD`` wins)."""
+
+    if THRESHOLD_OVERRIDE:
+        return float(THRESHOLD_OVERRIDE)
+    return BACKENDS[backend].DEFAULT_THRESHOLD
+
+
+def get_cache_stats() -> Dict[str, float]:
+    """Return hit/miss counters of the embedding cache of the loaded backend."""
+
+    if _active_backend is None or _active_backend.cache is None:
+        return {}
+    return _active_backend.cache.stats()
+
+
+def prefetch_embeddings(
+    texts: Iterable[str],
+    *,
+    max_batch: int | None = None,
+    backend: str = DEFAULT_BACKEND,
+    model_name: str | None = DEFAULT_BACKEND_MODEL,
+    device: str | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_length: int = DEFAULT_MAX_LENGTH,
+    use_fp16: bool = True,
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    cache_path: str | None = DEFAULT_CACHE_PATH,
+) -> int:
+    """Encode the not yet cached ``texts`` together so later lookups hit the cache.
+
+    ``max_batch`` overrides the backend's batch size for this call, letting a
+    caller push a whole micro-batch through the model in one padded forward.
+    Returns the number of texts that were sent through the model.
+    """
+
+    encoder = _get_backend(
         model_name=model_name,
+        backend=backend,
         device=device,
         batch_size=batch_size,
         max_length=max_length,
         use_fp16=use_fp16,
+        cache_size=cache_size,
+        cache_path=cache_path,
     )
+    if encoder.cache is None:
+        return 0
+
+    missing = [
+        text
+        for text in dict.fromkeys(text.strip() for text in texts if text and text.strip())
+        if text not in encoder.cache
+    ]
+    if missing:
+        encoder.encode(missing, batch_size=max_batch)
+    return len(missing)
 
 
 def has_semantic_match(
     query: str,
     candidates: Iterable[str],
     *,
-    threshold: float = DEFAULT_THRESHOLD,
-    model_name: str = DEFAULT_MODEL_NAME,
+    threshold: float | None = None,
+    backend: str = DEFAULT_BACKEND,
+    model_name: str | None = DEFAULT_BACKEND_MODEL,
     device: str | None = None,
     batch_size: int = DEFAULT_BATCH_SIZE,
     max_length: int = DEFAULT_MAX_LENGTH,
     use_fp16: bool = True,
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    cache_path: str | None = DEFAULT_CACHE_PATH,
 ) -> bool:
     """Return ``True`` if ``query`` is semantically close to any candidate."""
 
@@ -136,22 +896,91 @@ def has_semantic_match(
         LOGGER.debug("No valid candidates passed to has_semantic_match.")
         return False
 
-    backend = _get_backend(
+    encoder = _get_backend(
         model_name=model_name,
+        backend=backend,
         device=device,
         batch_size=batch_size,
         max_length=max_length,
         use_fp16=use_fp16,
+        cache_size=cache_size,
+        cache_path=cache_path,
     )
 
-    query_embedding = backend.encode([query_text])[0]
-    candidate_embeddings = backend.encode(cleaned_candidates)
+    query_embedding = encoder.encode([query_text])[0]
+    candidate_embeddings = encoder.encode(cleaned_candidates)
 
     scores = candidate_embeddings @ query_embedding
     max_score = float(scores.max().item())
     LOGGER.debug("Max cosine similarity for semantic match: %.4f", max_score)
 
+    if threshold is None:
+        threshold = encoder.DEFAULT_THRESHOLD
     return max_score >= threshold
 
 
-__all__ = ["has_semantic_match"]
+def best_semantic_match(
+    query: str,
+    matrix: CandidateMatrix,
+    *,
+    threshold: float | None = None,
+    backend: str = DEFAULT_BACKEND,
+    model_name: str | None = DEFAULT_BACKEND_MODEL,
+    device: str | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_length: int = DEFAULT_MAX_LENGTH,
+    use_fp16: bool = True,
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    cache_path: str | None = DEFAULT_CACHE_PATH,
+) -> Tuple[Optional[str], float]:
+    """Return the candidate of ``matrix`` closest to ``query`` and its score.
+
+    The key is ``None`` when the best score is below ``threshold``; the score is
+    returned either way so callers can report how close the nearest key was.
+    """
+
+    query_text = query.strip()
+    if not query_text or not len(matrix):
+        return None, 0.0
+
+    encoder = _get_backend(
+        model_name=model_name,
+        backend=backend,
+        device=device,
+        batch_size=batch_size,
+        max_length=max_length,
+        use_fp16=use_fp16,
+        cache_size=cache_size,
+        cache_path=cache_path,
+    )
+
+    if threshold is None:
+        threshold = encoder.DEFAULT_THRESHOLD
+
+    matrix.flush(encoder)
+    key, score = matrix.best_match(encoder.encode([query_text])[0])
+    LOGGER.debug("Best semantic match for %r: %r (%.4f)", query_text, key, score)
+
+    return (key if score >= threshold else None), score
+
+
+__all__ = [
+    "BACKENDS",
+    "CandidateMatrix",
+    "EmbeddingBackend",
+    "EmbeddingCache",
+    "HashingBackend",
+    "OnnxBackend",
+    "QuantizedTransformerBackend",
+    "SentenceTransformerBackend",
+    "TransformerBackend",
+    "best_semantic_match",
+    "calibrate_threshold",
+    "get_cache_stats",
+    "get_threshold",
+    "get_warmup_seconds",
+    "has_semantic_match",
+    "is_backend_loading",
+    "prefetch_embeddings",
+    "warm_up",
+]
@@ -1,5 +1,142 @@
+import gzip
 import json
-from typing import Dict, Any, List, Union
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple, Union
+
+from ..utils.queue import LineFramer, decode_lines
+
+# 分类查找表只构建一次：rule名称（含Falco自定义规则中的简写proc、net）和evt.type -> 事件类别
+RULE_CATEGORIES: Dict[str, str] = {
+    "process": "process",
+    "proc": "process",
+    "network": "network",
+    "net": "network",
+    "file": "file",
+}
+PROCESS_EVT_TYPES = frozenset({"execve", "clone", "fork", "vfork"})
+NETWORK_EVT_TYPES = frozenset({"connect", "accept", "send", "recv", "sendto", "recvfrom"})
+FILE_EVT_TYPES = frozenset({"open", "openat", "close", "read", "write", "unlink", "unlinkat"})
+EVT_TYPE_CATEGORIES: Dict[str, str] = {
+    **dict.fromkeys(PROCESS_EVT_TYPES, "process"),
+    **dict.fromkeys(NETWORK_EVT_TYPES, "network"),
+    **dict.fromkeys(FILE_EVT_TYPES, "file"),
+}
+
+# 流式读取事件文件时每块的字节数
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def _open_zstd(raw):
+    """优先使用Python 3.14的compression.zstd，否则使用zstandard包"""
+    try:
+        from compression import zstd
+        return zstd.ZstdFile(raw)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError as exc:
+        raise ImportError(
+            "Reading zstd-compressed event files requires Python 3.14+ or `zstandard`. "
+            "Install it with `pip install zstandard`."
+        ) from exc
+    return zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+
+
+@contextmanager
+def _open_event_file(file_path: str):
+    """
+    按文件头打开事件文件，产出(解压后的二进制流, 底层文件)，未压缩时两者相同
+    """
+    with open(file_path, "rb") as raw:
+        magic = raw.read(4)
+        raw.seek(0)
+        if magic.startswith(GZIP_MAGIC):
+            with gzip.GzipFile(fileobj=raw) as f:
+                yield f, raw
+        elif magic == ZSTD_MAGIC:
+            with _open_zstd(raw) as f:
+                yield f, raw
+        else:
+            yield raw, raw
+
+
+def _strip_lines(data: bytes) -> List[bytes]:
+    return [line for line in (raw.strip() for raw in data.split(b"\n")) if line]
+
+
+def _iter_mmap_blocks(f, size: int, block_size: int) -> Iterator[Tuple[List[bytes], int]]:
+    """把未压缩文件按行边界切成块，产出(行列表, 已读字节数)"""
+    if size == 0:
+        return
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        can_release = hasattr(mm, "madvise") and hasattr(mmap, "MADV_DONTNEED")
+        if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        position = released = 0
+        while position < size:
+            end = size
+            if position + block_size < size:
+                end = mm.rfind(b"\n", position, position + block_size)
+                if end < 0:
+                    # 单行比块还长时读到该行末尾
+                    end = mm.find(b"\n", position + block_size)
+                    if end < 0:
+                        end = size
+            lines = _strip_lines(mm[position:end])
+            position = end + 1
+            if can_release:
+                # 已读过的整页交还给内核，常驻内存不随文件大小增长
+                boundary = min(position, size) // mmap.PAGESIZE * mmap.PAGESIZE
+                if boundary > released:
+                    mm.madvise(mmap.MADV_DONTNEED, released, boundary - released)
+                    released = boundary
+            yield lines, min(position, size)
+
+
+def _iter_stream_blocks(f, block_size: int) -> Iterator[Tuple[List[bytes], None]]:
+    """把解压流按行切成块，产出(行列表, None)，进度由底层文件位置给出"""
+    framer = LineFramer()
+    while True:
+        chunk = f.read(block_size)
+        if not chunk:
+            break
+        lines = framer.feed(chunk)
+        if lines:
+            yield lines, None
+    lines = framer.flush()
+    if lines:
+        yield lines, None
+
+
+class EventRecord:
+    """
+    解析一次后的事件
+
+    保存分类结果、输出字段和建树时逐层查找用的字段，
+    语义预计算和建树共用同一个记录，热路径上每个事件只解析一次
+    """
+
+    __slots__ = ("category", "fields", "evt_type", "proc_name", "attributes")
+
+    def __init__(self, category: str, fields: Dict[str, Any]):
+        """
+        初始化事件记录
+
+        Args:
+            category: 事件类别 ('process', 'network', 'file', 或 'unknown')
+            fields: 事件的输出字段
+        """
+        self.category = category
+        self.fields = fields
+        self.evt_type = fields.get("evt.type") or ""
+        self.proc_name = fields.get("proc.name") or "unknown"
+        # Attribute Token Bag层级的(名称, 节点类型)列表，由所属分支处理器第一次使用时填充
+        self.attributes: Optional[List[Tuple[str, str]]] = None
 
 
 class EventParser:
@@ -31,44 +168,92 @@ class EventParser:
     def parse_event_file(file_path: str) -> List[Dict[str, Any]]:
         """
         解析事件文件
-        
+
+        会把所有事件读入内存，大文件请使用iter_event_file/iter_event_batches
+
         Args:
             file_path: 事件文件路径
-            
+
         Returns:
             list: 事件字典列表
         """
         events = []
         try:
-            with open(file_path, 'r') as f:
-                content = f.read().strip()
-                # 处理可能包含多个JSON对象的文件
-                for line in content.split('\n'):
-                    if line.strip():
-                        # 尝试解析每一行
-                        try:
-                            event = json.loads(line)
-                            events.append(event)
-                        except json.JSONDecodeError:
-                            # 如果单行解析失败，尝试将整个内容作为JSON处理
-                            pass
-                
-                # 如果按行解析没有结果，尝试将整个文件作为JSON数组处理
-                if not events:
-                    try:
-                        events = json.loads(content)
-                        # 确保返回的是列表
-                        if not isinstance(events, list):
-                            events = [events]
-                    except json.JSONDecodeError:
-                        pass
-                        
+            events = list(EventParser.iter_event_file(file_path))
+            # 如果按行解析没有结果，尝试将整个文件作为JSON处理
+            if not events:
+                events = EventParser.parse_json_document(file_path)
         except FileNotFoundError:
             print(f"Warning: File {file_path} not found.")
         except Exception as e:
             print(f"Error parsing event file {file_path}: {str(e)}")
-            
+
         return events
+
+    @staticmethod
+    def parse_json_document(file_path: str) -> List[Dict[str, Any]]:
+        """
+        将整个文件作为一个JSON文档（对象或数组）解析
+
+        Args:
+            file_path: 事件文件路径
+
+        Returns:
+            list: 事件字典列表，无法解析时为空列表
+        """
+        with _open_event_file(file_path) as (f, _):
+            try:
+                events = json.loads(f.read())
+            except ValueError:
+                return []
+        # 确保返回的是列表
+        return events if isinstance(events, list) else [events]
+
+    @staticmethod
+    def iter_event_batches(file_path: str, block_size: int = DEFAULT_BLOCK_SIZE,
+                           on_progress: Optional[Callable[[int, int], None]] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        流式读取每行一个JSON的事件文件（Falco file_output），按块产出事件
+
+        未压缩的文件通过mmap读取，已读过的页交还给内核；gzip和zstd压缩的文件按文件头自动识别并流式解压。
+        每次只有一个块在内存中，峰值内存与文件大小无关。无法解析或不是JSON对象的行会被跳过
+
+        Args:
+            file_path: 事件文件路径
+            block_size: 每块读取的字节数（按行边界切分）
+            on_progress: 每块之后调用on_progress(已读字节数, 文件总字节数)，压缩文件按压缩后的字节计
+
+        Yields:
+            list: 一个块中的事件字典
+        """
+        with _open_event_file(file_path) as (f, raw):
+            total = os.fstat(raw.fileno()).st_size
+            if f is raw:
+                blocks = _iter_mmap_blocks(raw, total, block_size)
+            else:
+                blocks = _iter_stream_blocks(f, block_size)
+            for lines, position in blocks:
+                events, _ = decode_lines(lines)
+                # 只保留JSON对象；整个文件是一行JSON数组时由调用方按整个文档处理
+                events = [event for event in events if type(event) is dict]
+                if on_progress is not None:
+                    on_progress(raw.tell() if position is None else position, total)
+                if events:
+                    yield events
+
+    @staticmethod
+    def iter_event_file(file_path: str) -> Iterator[Dict[str, Any]]:
+        """
+        流式逐个产出事件文件中的事件，见iter_event_batches
+
+        Args:
+            file_path: 事件文件路径
+
+        Yields:
+            dict: 事件字典
+        """
+        for events in EventParser.iter_event_batches(file_path):
+            yield from events
     
     @staticmethod
     def extract_output_fields(event: Dict[str, Any]) -> Dict[str, Any]:
@@ -99,23 +284,46 @@ class EventParser:
         Returns:
             str: 事件类别 ('process', 'network', 'file', 或 'unknown')
         """
-        # 首先尝试从rule字段判断
-        rule = event.get("rule", "").lower()
-        if rule in ["process", "proc"]:
-            return "process"
-        elif rule in ["network", "net"]:
-            return "network"
-        elif rule in ["file"]:
-            return "file"
+        # 首先尝试从rule字段判断，Falco输出的rule名称通常已是小写，命中时不必转换
+        rule = event.get("rule") or ""
+        category = RULE_CATEGORIES.get(rule) or RULE_CATEGORIES.get(rule.lower())
+        if category is not None:
+            return category
         
         # 如果rule字段不可用，尝试从evt.type判断
-        evt_type = event.get("evt.type", "").lower()
-        if evt_type in ["execve", "clone", "fork", "vfork"]:
-            return "process"
-        elif evt_type in ["connect", "accept", "send", "recv", "sendto", "recvfrom"]:
-            return "network"
-        elif evt_type in ["open", "openat", "close", "read", "write", "unlink", "unlinkat"]:
-            return "file"
-        
+        evt_type = event.get("evt.type") or ""
         # 如果无法确定，返回unknown
-        return "unknown"
\ No newline at end of file
+        return EVT_TYPE_CATEGORIES.get(evt_type) or EVT_TYPE_CATEGORIES.get(evt_type.lower(), "unknown")
+
+    @classmethod
+    def parse_record(cls, event: Union[Dict[str, Any], EventRecord]) -> EventRecord:
+        """
+        一次完成分类和字段提取
+
+        Args:
+            event: 原始事件数据，已经是EventRecord时原样返回
+
+        Returns:
+            EventRecord: 事件记录
+        """
+        if type(event) is EventRecord:
+            return event
+        fields = event["output_fields"] if "output_fields" in event else event
+        category = RULE_CATEGORIES.get(event.get("rule"))
+        if category is None:
+            category = cls.categorize_event(event)
+        return EventRecord(category, fields)
+
+    @classmethod
+    def parse_records(cls, events: List[Union[Dict[str, Any], EventRecord]]) -> List[EventRecord]:
+        """
+        批量解析事件
+
+        Args:
+            events: 原始事件数据列表
+
+        Returns:
+            list: 事件记录列表
+        """
+        parse_record = cls.parse_record
+        return [parse_record(event) for event in events]
@@ -3,17 +3,22 @@
 # hierarchical models that represent the behavior of containers based on
 # system call events and other relevant metrics.
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, TextIO
 from .hbt_builder import HBTBuilder
+from .learning_state import LearningState
 
 
 # 一个容器对应一个 HBT 模型
 # HBT从根节点开始有三个分支，分别为进程分支，网络分支，文件分支，这个对所有的HBTModel都是一样的
 # 对于每个分支进一步细分为不同路径节点
 class HBTModel:
-    def __init__(self, container_id: str):
+    def __init__(self, container_id: str, learning_state: Optional[LearningState] = None, store: str = "object"):
         self.container_id = container_id
-        self.hbt_builder = HBTBuilder(container_id)
+        self.hbt_builder = HBTBuilder(container_id, learning_state, store)
+
+    def add_event(self, event: Dict[str, Any]):
+        # 处理原始Falco事件，由HBTBuilder根据rule分类到对应分支
+        self.hbt_builder.add_event(event)
 
     def add_process_event(self, event: Dict[str, Any]):
         # 处理进程相关事件，更新 process_branch
@@ -28,4 +33,17 @@ class HBTModel:
         self.hbt_builder.add_event({"rule": "file", "output_fields": event})
 
     def get_model(self) -> Dict[str, Any]:
-        return self.hbt_builder.get_model()
\ No newline at end of file
+        return self.hbt_builder.get_model()
+
+    def write_model(self, fp: TextIO, format: str = "json", max_depth: Optional[int] = None,
+                    min_events: int = 0) -> int:
+        # 流式写出模型（JSON或NDJSON），不构建get_model()的字典
+        return self.hbt_builder.write_model(fp, format, max_depth, min_events)
+
+    @classmethod
+    def from_model(cls, model: Dict[str, Any], learning_state: Optional[LearningState] = None,
+                   store: str = "object") -> "HBTModel":
+        # 从get_model()的输出重建模型实例
+        hbt_model = cls(model["container_id"], learning_state, store)
+        hbt_model.hbt_builder.load_model(model)
+        return hbt_model
\ No newline at end of file
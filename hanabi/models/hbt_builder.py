@@ -1,22 +1,35 @@
-from typing import Dict, Any, List
+import sys
+import time
+from typing import Dict, Any, List, Optional, TextIO, Union
 from .tree_node import TreeNode
+from .columnar_store import ColumnarNode, ColumnarStore
 from .branch_handlers import ProcessBranchHandler, NetworkBranchHandler, FileBranchHandler
-from .event_parser import EventParser
-from ..utils.timeCount import EventCounter
+from .event_parser import DEFAULT_BLOCK_SIZE, EventParser, EventRecord
+from .learning_state import LearningState
+from .tree_writer import write_model
+from ..utils.metrics import mark_first_event
+
+# 可选的树存储方式："object"为TreeNode对象图，"columnar"为并行数组的ColumnarStore
+STORES = ("object", "columnar")
 
 
 class HBTBuilder:
     """HBT模型构建器"""
     
-    def __init__(self, container_id: str):
+    def __init__(self, container_id: str, learning_state: Optional[LearningState] = None, store: str = "object"):
         """
         初始化HBT构建器
         
         Args:
             container_id: 容器ID
+            learning_state: 模型的学习/检测状态机，默认使用默认收敛条件新建
+            store: 树的存储方式，"object"（TreeNode）或"columnar"（ColumnarStore）
         """
+        if store not in STORES:
+            raise ValueError(f"Unknown HBT store: {store!r} (expected one of {', '.join(STORES)})")
         self.container_id = container_id
-        self.root = TreeNode("root", "root")
+        self.store = store
+        self.root = ColumnarStore().root if store == "columnar" else TreeNode("root", "root")
         
         # 创建三个主分支
         self.process_branch = self.root.add_child("process_branch", "branch")
@@ -24,55 +37,125 @@ class HBTBuilder:
         self.file_branch = self.root.add_child("file_branch", "branch")
         
         # 初始化分支处理器
-        self.eventCounter = EventCounter()
-        self.process_handler = ProcessBranchHandler(self.process_branch)
-        self.network_handler = NetworkBranchHandler(self.network_branch)
-        self.file_handler = FileBranchHandler(self.file_branch)
+        self.learning_state = learning_state or LearningState()
+        self.process_handler = ProcessBranchHandler(self.process_branch, container_id)
+        self.network_handler = NetworkBranchHandler(self.network_branch, container_id)
+        self.file_handler = FileBranchHandler(self.file_branch, container_id)
+        self.handlers = {
+            "process": self.process_handler,
+            "network": self.network_handler,
+            "file": self.file_handler,
+        }
         
         # 初始化事件解析器
         self.event_parser = EventParser()
+        # 检测阶段发现的异常事件数
+        self.anomaly_count = 0
     
-    def add_event(self, event: Dict[str, Any]):
+    def add_event(self, event: Union[Dict[str, Any], EventRecord]):
         """
         添加单个事件到HBT模型
         
         Args:
-            event: 事件数据
+            event: 事件数据或已解析的事件记录
         """
-        # 提取输出字段
-        output_fields = self.event_parser.extract_output_fields(event)
+        # 一次完成分类和输出字段提取
+        record = self.event_parser.parse_record(event)
         
-        # 对事件进行分类
-        category = self.event_parser.categorize_event(event)
-        
-        # 根据分类将事件发送到相应的处理器
-        if category == "process":
-            self.process_handler.handle_event(output_fields,self.eventCounter)
-        elif category == "network":
-            self.network_handler.handle_event(output_fields,self.eventCounter)
-        elif category == "file":
-            self.file_handler.handle_event(output_fields,self.eventCounter)
-        # 忽略未知类型的事件
+        # 根据分类将事件发送到相应的处理器，忽略未知类型的事件
+        handler = self.handlers.get(record.category)
+        if handler is not None:
+            if handler.handle_event(record, self.learning_state):
+                self.anomaly_count += 1
+            mark_first_event()
     
-    def add_events(self, events: List[Dict[str, Any]]):
+    def semantic_queries(self, event: Union[Dict[str, Any], EventRecord]) -> List[str]:
+        """
+        返回添加该事件时需要语义模型才能确定的查找字符串（精确和词法层级能确定的不返回）
+
+        Args:
+            event: 事件数据或已解析的事件记录（提取的属性会保留在记录中供建树复用）
+
+        Returns:
+            list: 查找字符串列表，未知类型的事件返回空列表
+        """
+        record = self.event_parser.parse_record(event)
+        handler = self.handlers.get(record.category)
+        if handler is None:
+            return []
+        return handler.semantic_queries(record)
+
+    def add_events(self, events: List[Union[Dict[str, Any], EventRecord]]) -> int:
         """
         批量添加事件到HBT模型
         
         Args:
-            events: 事件数据列表
+            events: 事件数据或已解析的事件记录列表
+
+        Returns:
+            int: 这批事件中检测到的异常事件数
         """
+        parse_record = self.event_parser.parse_record
+        handlers = self.handlers
+        state = self.learning_state
+        handled = False
+        anomalies = 0
         for event in events:
-            self.add_event(event)
+            record = parse_record(event)
+            handler = handlers.get(record.category)
+            if handler is not None:
+                if handler.handle_event(record, state):
+                    anomalies += 1
+                handled = True
+        if handled:
+            mark_first_event()
+        self.anomaly_count += anomalies
+        return anomalies
     
-    def build_from_file(self, file_path: str):
+    def build_from_file(self, file_path: str, block_size: int = DEFAULT_BLOCK_SIZE,
+                        progress_interval: Optional[float] = 5.0) -> int:
         """
         从文件构建HBT模型
+
+        事件文件（可以是gzip/zstd压缩的）按块流式读取并逐块加入模型，内存占用与文件大小无关
         
         Args:
             file_path: 事件文件路径
+            block_size: 每块读取的字节数
+            progress_interval: 每隔多少秒向stderr报告一次进度，None表示不报告
+
+        Returns:
+            int: 加入模型的事件数
         """
-        events = self.event_parser.parse_event_file(file_path)
-        self.add_events(events)
+        start = last_report = time.monotonic()
+        count = 0
+
+        def report(position: int, total: int):
+            nonlocal last_report
+            now = time.monotonic()
+            if progress_interval is None or now - last_report < progress_interval:
+                return
+            last_report = now
+            percent = position / total * 100 if total else 100.0
+            print(f"{file_path}: {count:,} events, {percent:.1f}% of {total / 2**20:,.0f} MiB, "
+                  f"{count / (now - start):,.0f} events/s", file=sys.stderr)
+
+        try:
+            for events in self.event_parser.iter_event_batches(file_path, block_size, report):
+                self.add_events(events)
+                count += len(events)
+            # 不是每行一个JSON时，尝试将整个文件作为JSON处理
+            if count == 0:
+                events = self.event_parser.parse_json_document(file_path)
+                self.add_events(events)
+                count = len(events)
+        except FileNotFoundError:
+            print(f"Warning: File {file_path} not found.")
+            return count
+
+        if progress_interval is not None:
+            print(f"{file_path}: loaded {count:,} events in {time.monotonic() - start:.1f}s", file=sys.stderr)
+        return count
     
     def get_model(self) -> Dict[str, Any]:
         """
@@ -83,9 +166,79 @@ class HBTBuilder:
         """
         return {
             "container_id": self.container_id,
+            "learning_phase": self.learning_state.phase.value,
             "hbt_structure": self.root.to_dict()
         }
+
+    def write_model(self, fp: TextIO, format: str = "json", max_depth: Optional[int] = None,
+                    min_events: int = 0) -> int:
+        """
+        把模型流式写出，不构建get_model()的字典（见tree_writer.write_model）
+
+        Args:
+            fp: 文本输出流（文件或socket.makefile("w")）
+            format: "json"（与get_model()相同的结构）或"ndjson"（每行一个节点）
+            max_depth: 最大深度（根节点为0，None表示不限制）
+            min_events: 子树的事件总数低于该值的节点连同子树一起省略
+
+        Returns:
+            int: 写出的节点数
+        """
+        return write_model(fp, self.container_id, self.learning_state.phase.value, self.root,
+                           format, max_depth, min_events)
     
+    def load_model(self, model: Dict[str, Any]):
+        """
+        从get_model()的输出恢复HBT模型
+
+        Args:
+            model: HBT模型的字典表示
+        """
+        if self.store == "columnar":
+            root = ColumnarStore.from_dict(model["hbt_structure"]).root
+        else:
+            root = TreeNode.from_dict(model["hbt_structure"])
+        self.load_root(model["container_id"], root, model.get("learning_phase"))
+
+    def load_root(self, container_id: str, root: Union[TreeNode, ColumnarNode], learning_phase: Optional[str] = None):
+        """
+        用已经构建好的树替换模型（供get_model()格式和二进制快照共用）
+
+        Args:
+            container_id: 容器ID
+            root: 根节点，类型须与store一致
+            learning_phase: 恢复的学习阶段（LearningPhase的值），None时不改变
+        """
+        self.container_id = container_id
+        self.root = root
+        self.process_branch = self.root.add_child("process_branch", "branch")
+        self.network_branch = self.root.add_child("network_branch", "branch")
+        self.file_branch = self.root.add_child("file_branch", "branch")
+        for handler, branch in ((self.process_handler, self.process_branch),
+                                (self.network_handler, self.network_branch),
+                                (self.file_handler, self.file_branch)):
+            handler.bind(branch, self.container_id)
+        if learning_phase is not None:
+            self.learning_state.restore(learning_phase)
+
+    def branch_node_counts(self) -> Dict[str, int]:
+        """
+        每个分支的节点数（由分支处理器在新建节点时维护，不遍历树）
+
+        Returns:
+            dict: 分支名 -> 节点数（包括分支根节点）
+        """
+        return {name: handler.node_count for name, handler in self.handlers.items()}
+
+    def count_nodes(self) -> int:
+        """
+        模型中的节点总数（包括根节点），不遍历树
+
+        Returns:
+            int: 节点数
+        """
+        return 1 + sum(handler.node_count for handler in self.handlers.values())
+
     def get_statistics(self) -> Dict[str, Any]:
         """
         获取模型统计信息
@@ -102,5 +255,6 @@ class HBTBuilder:
             ),
             "process_events": self.process_branch.events_count,
             "network_events": self.network_branch.events_count,
-            "file_events": self.file_branch.events_count
+            "file_events": self.file_branch.events_count,
+            "anomalies": self.anomaly_count,
         }
\ No newline at end of file
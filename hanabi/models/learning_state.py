@@ -0,0 +1,206 @@
+import logging
+import os
+import time
+from collections import deque
+from enum import Enum
+from typing import Dict, Any, Optional
+
+from ..utils.metrics import record_learning_transition
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_WARMUP_SECONDS = 45
+DEFAULT_WINDOW_SECONDS = 10
+# 窗口内每秒新增节点数低于该值视为收敛（10秒窗口时即原先的10秒内少于2个新节点）
+DEFAULT_MAX_NEW_NODE_RATE = 0.2
+# 检测阶段窗口内每秒异常事件数达到该值时自动重新学习（未设置时只能通过start_relearning()触发）
+DEFAULT_MAX_ANOMALY_RATE = float(os.getenv("HANABI_RELEARN_ANOMALY_RATE", "0")) or None
+
+
+class LearningPhase(Enum):
+    """HBT模型所处的阶段"""
+    WARMUP = "warmup"
+    LEARNING = "learning"
+    DETECTING = "detecting"
+    RELEARNING = "relearning"
+
+
+class LearningState:
+    """
+    单个HBT模型的学习/检测状态机
+
+    warmup -> learning -> detecting，检测阶段的异常事件速率达到max_anomaly_rate时
+    （或调用start_relearning()、HBTRegistry.relearn()）进入relearning，重新收敛后回到detecting。
+    收敛条件基于滑动窗口内新增节点的速率：
+    每秒新增节点数低于max_new_node_rate，且（可选）新增节点数/事件数不超过max_novelty_ratio
+    """
+
+    def __init__(
+        self,
+        warmup_seconds: float = DEFAULT_WARMUP_SECONDS,
+        window_seconds: float = DEFAULT_WINDOW_SECONDS,
+        max_new_node_rate: float = DEFAULT_MAX_NEW_NODE_RATE,
+        max_novelty_ratio: Optional[float] = None,
+        min_window_events: int = 0,
+        converge: bool = True,
+        max_anomaly_rate: Optional[float] = DEFAULT_MAX_ANOMALY_RATE,
+    ):
+        """
+        初始化状态机
+
+        Args:
+            warmup_seconds: 预热时长（秒），预热期间只学习不判断收敛
+            window_seconds: 统计新增节点速率的滑动窗口长度（秒）
+            max_new_node_rate: 收敛要求每秒新增节点数低于该值
+            max_novelty_ratio: 收敛时允许的新增节点数/事件数上限（None表示不检查）
+            min_window_events: 窗口内至少要有多少事件才判断收敛
+            converge: 是否自动切换到检测阶段（离线训练时关闭，始终学习）
+            max_anomaly_rate: 检测阶段窗口内每秒异常事件数达到该值时重新学习（None表示不自动重新学习）
+        """
+        self.warmup_seconds = warmup_seconds
+        self.window_seconds = window_seconds
+        self.max_new_node_rate = max_new_node_rate
+        self.max_novelty_ratio = max_novelty_ratio
+        self.min_window_events = min_window_events
+        self.converge = converge
+        self.max_anomaly_rate = max_anomaly_rate
+
+        self.phase = LearningPhase.WARMUP if warmup_seconds > 0 else LearningPhase.LEARNING
+        self.phase_started = time.monotonic()
+        # 每秒一个桶：[秒, 新增节点数, 事件数, 异常事件数]
+        self.buckets: deque = deque()
+        self.window_new_nodes = 0
+        self.window_events = 0
+        self.window_anomalies = 0
+        self.total_new_nodes = 0
+        self.total_events = 0
+
+    @property
+    def learning(self) -> bool:
+        """是否处于会修改树结构的阶段"""
+        return self.phase is not LearningPhase.DETECTING
+
+    def _bucket(self, now: float) -> list:
+        second = int(now)
+        if not self.buckets or self.buckets[-1][0] != second:
+            self.buckets.append([second, 0, 0, 0])
+        return self.buckets[-1]
+
+    def _expire(self, now: float):
+        horizon = now - self.window_seconds
+        while self.buckets and self.buckets[0][0] < horizon:
+            _, new_nodes, events, anomalies = self.buckets.popleft()
+            self.window_new_nodes -= new_nodes
+            self.window_events -= events
+            self.window_anomalies -= anomalies
+
+    def on_event(self, now: Optional[float] = None):
+        """记录学习阶段处理的一个事件"""
+        now = time.monotonic() if now is None else now
+        self._bucket(now)[2] += 1
+        self.window_events += 1
+        self.total_events += 1
+
+    def on_new_node(self, now: Optional[float] = None):
+        """记录学习阶段新增的一个节点"""
+        now = time.monotonic() if now is None else now
+        self._bucket(now)[1] += 1
+        self.window_new_nodes += 1
+        self.total_new_nodes += 1
+
+    def on_anomaly(self, now: Optional[float] = None):
+        """记录检测阶段的一个异常事件"""
+        now = time.monotonic() if now is None else now
+        self._bucket(now)[3] += 1
+        self.window_anomalies += 1
+
+    def _set_phase(self, phase: LearningPhase, now: float):
+        self.phase = phase
+        self.phase_started = now
+        self.buckets.clear()
+        self.window_new_nodes = 0
+        self.window_events = 0
+        self.window_anomalies = 0
+
+    def _transition(self, phase: LearningPhase, now: float):
+        # 阶段切换计入hanabi_learning_transitions_total，日志为debug级别，容器很多时不会刷屏
+        LOGGER.debug("HBT model: %s -> %s after %.0fs", self.phase.value, phase.value, now - self.phase_started)
+        self._set_phase(phase, now)
+        record_learning_transition(phase.value)
+
+    def is_converged(self, now: Optional[float] = None) -> bool:
+        """
+        判断当前窗口内的新增节点速率是否满足收敛条件
+
+        Returns:
+            bool: 是否收敛
+        """
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        if now - self.phase_started < self.window_seconds:
+            return False
+        if self.window_events < self.min_window_events:
+            return False
+        if self.window_new_nodes / self.window_seconds >= self.max_new_node_rate:
+            return False
+        if self.max_novelty_ratio is not None and self.window_events:
+            return self.window_new_nodes / self.window_events <= self.max_novelty_ratio
+        return True
+
+    def is_drifting(self, now: Optional[float] = None) -> bool:
+        """
+        判断检测阶段窗口内的异常事件速率是否达到重新学习的条件
+
+        Returns:
+            bool: 是否应该重新学习
+        """
+        if self.max_anomaly_rate is None:
+            return False
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        if now - self.phase_started < self.window_seconds:
+            return False
+        return self.window_anomalies / self.window_seconds >= self.max_anomaly_rate
+
+    def update(self, now: Optional[float] = None) -> LearningPhase:
+        """
+        根据预热时长和收敛条件推进状态
+
+        Returns:
+            LearningPhase: 更新后的阶段
+        """
+        now = time.monotonic() if now is None else now
+        if self.phase is LearningPhase.WARMUP:
+            if now - self.phase_started >= self.warmup_seconds:
+                self._transition(LearningPhase.LEARNING, now)
+        elif self.phase in (LearningPhase.LEARNING, LearningPhase.RELEARNING):
+            if self.converge and self.is_converged(now):
+                self._transition(LearningPhase.DETECTING, now)
+        elif self.is_drifting(now):
+            self._transition(LearningPhase.RELEARNING, now)
+        return self.phase
+
+    def start_relearning(self):
+        """从检测阶段重新进入学习，直到再次收敛"""
+        self._transition(LearningPhase.RELEARNING, time.monotonic())
+
+    def restore(self, phase: str):
+        """
+        恢复保存的阶段，学习类阶段的窗口统计重新开始
+
+        Args:
+            phase: LearningPhase的值
+        """
+        self._set_phase(LearningPhase(phase), time.monotonic())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取状态机统计信息"""
+        self._expire(time.monotonic())
+        return {
+            "phase": self.phase.value,
+            "phase_seconds": time.monotonic() - self.phase_started,
+            "window_new_nodes": self.window_new_nodes,
+            "window_events": self.window_events,
+            "window_anomalies": self.window_anomalies,
+            "total_new_nodes": self.total_new_nodes,
+        }
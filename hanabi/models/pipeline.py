@@ -0,0 +1,268 @@
+import os
+import signal
+import sys
+import zlib
+from multiprocessing import get_context
+from threading import Lock
+from typing import Dict, Any, Iterable, List, Optional
+
+from .child_index import MATCH_STATS, TIERS
+
+DEFAULT_START_METHOD = "spawn"
+
+
+def _worker_main(conn, registry_options: Dict[str, Any], semantic: bool):
+    """
+    工作进程入口：持有自己的HBTRegistry，按顺序处理主进程发来的消息
+
+    消息格式为(命令, 参数)：
+        ("events", 事件列表)   加入模型，不回复（处理失败的批次计入统计中的errors和failed_events）
+        ("stats", None)        回复统计信息
+        ("snapshot", key)      回复模型快照（key为None时回复全部常驻模型）
+        ("stop", None)         回复最终统计信息后退出
+    """
+    # Ctrl-C由主进程处理，工作进程在收到stop后处理完剩余事件再退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 在工作进程中导入，避免主进程加载模型相关模块
+    from .anomaly import DEFAULT_ANOMALY_LOG, AnomalySink, get_anomaly_sink, set_anomaly_sink
+    from .batch_matcher import MicroBatchMatcher
+    from .embedding import warm_up
+    from .registry import HBTRegistry
+
+    if DEFAULT_ANOMALY_LOG:
+        # 每个工作进程写自己的异常文件，轮转不会在进程之间冲突
+        set_anomaly_sink(AnomalySink(log_path=f"{DEFAULT_ANOMALY_LOG}.{os.getpid()}"))
+    if semantic:
+        warm_up()
+    registry = HBTRegistry(**registry_options)
+    # 只使用process_batch做同步的批量预计算+加入模型，不启动后台线程
+    matcher = MicroBatchMatcher(registry)
+    errors = 0
+    failed_events = 0
+
+    def stats():
+        return {
+            "pid": os.getpid(),
+            "errors": errors,
+            "failed_events": failed_events,
+            "batches": matcher.batch_count,
+            "events": matcher.event_count,
+            "strings_encoded": matcher.encoded_count,
+            "registry": registry.get_statistics(),
+            "match_counts": dict(MATCH_STATS.counts),
+        }
+
+    while True:
+        try:
+            command, arg = conn.recv()
+        except EOFError:
+            break
+        if command == "events":
+            try:
+                matcher.process_batch(arg)
+            except Exception as e:
+                errors += 1
+                failed_events += len(arg)
+                print(f"Worker {os.getpid()} failed to process a batch: {e}", file=sys.stderr)
+        elif command == "stats":
+            conn.send(stats())
+        elif command == "snapshot":
+            if arg is None:
+                conn.send({key: model.get_model() for key, model in registry.models()})
+            elif arg in registry.resident or arg in registry.spilled:
+                conn.send({arg: registry.get_model(arg).get_model()})
+            else:
+                conn.send({})
+        elif command == "stop":
+            # 停止前把有变化的模型写入快照目录（设置了HANABI_SNAPSHOT_DIR时）
+            registry.snapshot()
+            conn.send(stats())
+            break
+    # 工作进程退出时不执行atexit，在这里写出剩余的异常记录
+    get_anomaly_sink().stop()
+    conn.close()
+
+
+class ShardedPipeline:
+    """
+    多进程HBT构建流水线
+
+    按container.id（或其他key字段）把事件分片到固定的工作进程，每个工作进程持有
+    自己容器的HBT模型（HBTRegistry），并在进程内完成分类、命令行切分、语义匹配和建树，
+    从而可以使用多个CPU核心。事件按批通过管道发送，管道写满时submit会阻塞，形成反压。
+    主进程汇总各工作进程的统计信息并提供模型快照
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        key_field: str = "container.id",
+        registry_options: Optional[Dict[str, Any]] = None,
+        semantic: bool = True,
+        start_method: str = DEFAULT_START_METHOD,
+    ):
+        """
+        初始化流水线
+
+        Args:
+            workers: 工作进程数量，默认为CPU核心数
+            key_field: 用于分片和区分模型的输出字段
+            registry_options: 传给每个工作进程HBTRegistry的其他参数
+            semantic: 工作进程是否在后台加载语义模型（每个进程各加载一份）
+            start_method: multiprocessing的启动方式，默认spawn（主进程有后台线程时fork不安全）
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.key_field = key_field
+        self.registry_options = dict(registry_options or {}, key_field=key_field)
+        self.semantic = semantic
+        self.context = get_context(start_method)
+        self.processes = []
+        self.connections = []
+        self.locks: List[Lock] = []
+        self.submitted = [0] * self.workers
+        # 工作进程报告的处理失败的批次数
+        self.failed_batches = 0
+
+    def start(self):
+        """启动工作进程"""
+        for _ in range(self.workers):
+            parent_conn, child_conn = self.context.Pipe()
+            process = self.context.Process(
+                target=_worker_main,
+                args=(child_conn, self.registry_options, self.semantic),
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            self.processes.append(process)
+            self.connections.append(parent_conn)
+            self.locks.append(Lock())
+
+    def shard(self, key: str) -> int:
+        """
+        返回key所属的工作进程编号（跨进程、跨重启稳定）
+
+        Args:
+            key: 模型key
+
+        Returns:
+            int: 工作进程编号
+        """
+        return zlib.crc32(key.encode("utf-8", "surrogatepass")) % self.workers
+
+    def _key(self, event: Dict[str, Any]) -> str:
+        output_fields = event.get("output_fields", event)
+        return output_fields.get(self.key_field) or "unknown"
+
+    def submit_batch(self, events: Iterable[Dict[str, Any]]):
+        """
+        把一批事件按key分片后发送给对应的工作进程
+
+        Args:
+            events: 原始Falco事件
+        """
+        shards: Dict[int, List[Dict[str, Any]]] = {}
+        for event in events:
+            shards.setdefault(self.shard(self._key(event)), []).append(event)
+        for index, shard_events in shards.items():
+            with self.locks[index]:
+                self.connections[index].send(("events", shard_events))
+            self.submitted[index] += len(shard_events)
+
+    def _request(self, index: int, command: str, arg: Any = None) -> Any:
+        with self.locks[index]:
+            self.connections[index].send((command, arg))
+            return self.connections[index].recv()
+
+    def get_worker_stats(self) -> List[Dict[str, Any]]:
+        """获取每个工作进程的统计信息（会等待此前发送的事件处理完）"""
+        worker_stats = [self._request(index, "stats") for index in range(self.workers)]
+        self._record_failures(worker_stats)
+        return worker_stats
+
+    def _record_failures(self, worker_stats: List[Dict[str, Any]]):
+        self.failed_batches = max(self.failed_batches, sum(stats["errors"] for stats in worker_stats))
+
+    def wait_processed(self) -> bool:
+        """
+        等待工作进程处理完此前发送的事件
+
+        Returns:
+            bool: 此前发送的事件是否都已加入模型（有批次处理失败后一直为False）
+        """
+        self.get_worker_stats()
+        return not self.failed_batches
+
+    @staticmethod
+    def aggregate(worker_stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        汇总工作进程的统计信息
+
+        Args:
+            worker_stats: get_worker_stats()或stop()的返回值
+
+        Returns:
+            dict: 汇总后的统计信息和各匹配层级的报告
+        """
+        totals: Dict[str, Any] = {"workers": len(worker_stats)}
+        for key in ("errors", "failed_events", "batches", "events", "strings_encoded"):
+            totals[key] = sum(stats[key] for stats in worker_stats)
+        registry: Dict[str, int] = {}
+        for stats in worker_stats:
+            for key, value in stats["registry"].items():
+                registry[key] = registry.get(key, 0) + value
+        totals["registry"] = registry
+
+        counts = {tier: sum(stats["match_counts"].get(tier, 0) for stats in worker_stats) for tier in TIERS}
+        total = sum(counts.values())
+        totals["match_report"] = {
+            tier: {"lookups": count, "ratio": count / total if total else 0.0}
+            for tier, count in counts.items()
+        }
+        return totals
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取所有工作进程汇总后的统计信息"""
+        return dict(self.aggregate(self.get_worker_stats()), submitted=sum(self.submitted))
+
+    def snapshot(self, key: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        获取模型快照
+
+        Args:
+            key: 只获取该key的模型；为None时获取所有工作进程中的常驻模型
+
+        Returns:
+            dict: key -> get_model()的输出
+        """
+        if key is not None:
+            return self._request(self.shard(key), "snapshot", key)
+        models: Dict[str, Dict[str, Any]] = {}
+        for index in range(self.workers):
+            models.update(self._request(index, "snapshot"))
+        return models
+
+    def stop(self, timeout: float = 10) -> List[Dict[str, Any]]:
+        """
+        处理完已发送的事件后停止工作进程
+
+        Args:
+            timeout: 等待每个工作进程退出的秒数
+
+        Returns:
+            list: 每个工作进程的最终统计信息
+        """
+        final_stats = []
+        for index, process in enumerate(self.processes):
+            try:
+                final_stats.append(self._request(index, "stop"))
+            except (EOFError, OSError):
+                print(f"Worker {process.pid} exited unexpectedly", file=sys.stderr)
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+            self.connections[index].close()
+        self.processes = []
+        self._record_failures(final_stats)
+        return final_stats
+
@@ -0,0 +1,337 @@
+import hashlib
+import os
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from urllib.parse import quote
+from typing import Dict, Any, List, Iterator, Optional, Tuple, Union
+
+from .event_parser import EventParser, EventRecord
+from .hbt import HBTModel
+from .learning_state import LearningState
+from .snapshot import SNAPSHOT_SUFFIX, find_snapshots, read_snapshot, write_snapshot
+
+DEFAULT_KEY_FIELD = "container.id"
+DEFAULT_IDLE_SECONDS = 600
+DEFAULT_MAX_RESIDENT_MODELS = 256
+DEFAULT_MAINTAIN_INTERVAL = 30
+# 持久化快照的目录：启动时从中加载已学习的模型，定期把有变化的模型写回
+DEFAULT_SNAPSHOT_DIR = os.getenv("HANABI_SNAPSHOT_DIR")
+DEFAULT_SNAPSHOT_INTERVAL = float(os.getenv("HANABI_SNAPSHOT_INTERVAL", "300"))
+
+# 文件名中转义后的key超过该长度时截断并附加摘要
+MAX_FILENAME_KEY_LENGTH = 200
+
+
+def model_filename(key: str, suffix: str = SNAPSHOT_SUFFIX) -> str:
+    """
+    返回key对应的模型文件名
+
+    key按百分号编码转义，不同的key（如"a/b"和"a_b"）不会得到相同的文件名；
+    转义后过长时截断，并附加key的SHA-1摘要保持唯一
+
+    Args:
+        key: 模型key
+        suffix: 文件扩展名
+
+    Returns:
+        str: 不含目录的文件名
+    """
+    name = quote(key, safe="")
+    if len(name) > MAX_FILENAME_KEY_LENGTH:
+        digest = hashlib.sha1(key.encode("utf-8", "surrogatepass")).hexdigest()
+        name = f"{name[:MAX_FILENAME_KEY_LENGTH - len(digest) - 1].rstrip('%')}-{digest}"
+    return name + suffix
+
+
+class HBTRegistry:
+    """
+    多容器HBT模型注册表
+
+    按事件中的container.id（或镜像仓库等其他字段）为每个容器惰性创建一个HBTModel，
+    每个模型有独立的学习状态。长时间没有事件的模型会被换出到磁盘，
+    常驻模型数量和节点总数超过上限时按最近最少使用的顺序换出，下次收到该容器的事件时再加载。
+
+    换出的模型保存为二进制快照（见snapshot.py）。设置snapshot_dir后快照目录即为换出目录：
+    启动时目录中的快照都登记为已换出（收到事件时才加载，检测阶段的模型直接进入检测），
+    常驻模型每隔snapshot_interval秒在有变化时重新写入快照
+    """
+
+    def __init__(
+        self,
+        key_field: str = DEFAULT_KEY_FIELD,
+        spill_dir: Optional[str] = None,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS,
+        max_resident_models: int = DEFAULT_MAX_RESIDENT_MODELS,
+        max_total_nodes: Optional[int] = None,
+        maintain_interval: float = DEFAULT_MAINTAIN_INTERVAL,
+        learning_options: Optional[Dict[str, Any]] = None,
+        store: str = "object",
+        snapshot_dir: Optional[str] = DEFAULT_SNAPSHOT_DIR,
+        snapshot_interval: float = DEFAULT_SNAPSHOT_INTERVAL,
+    ):
+        """
+        初始化注册表
+
+        Args:
+            key_field: 用于区分模型的输出字段，如"container.id"或"container.image.repository"
+            spill_dir: 换出模型的保存目录，默认使用临时目录（设置snapshot_dir时使用snapshot_dir）
+            idle_seconds: 模型空闲多久后换出到磁盘
+            max_resident_models: 内存中最多保留的模型数量
+            max_total_nodes: 内存中所有模型的节点总数上限（None表示不限制）
+            maintain_interval: 两次空闲检查之间的最小间隔（秒）
+            learning_options: 每个模型LearningState的参数（预热时长、收敛条件等）
+            store: 模型树的存储方式，"object"或"columnar"
+            snapshot_dir: 持久化快照的目录（None表示不持久化，换出的模型只在本进程内有效）
+            snapshot_interval: 两次定期快照之间的最小间隔（秒，0表示不定期写快照）
+        """
+        self.key_field = key_field
+        self.snapshot_dir = snapshot_dir
+        self.spill_dir = snapshot_dir or spill_dir or tempfile.mkdtemp(prefix="hbt-spill-")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.snapshot_interval = snapshot_interval
+        self.idle_seconds = idle_seconds
+        self.max_resident_models = max_resident_models
+        self.max_total_nodes = max_total_nodes
+        self.maintain_interval = maintain_interval
+        self.learning_options = learning_options or {}
+        self.store = store
+
+        # 按最近使用顺序排列的常驻模型：key -> (模型, 最后一次事件的时间)
+        self.resident: "OrderedDict[str, Tuple[HBTModel, float]]" = OrderedDict()
+        self.spilled: Dict[str, str] = find_snapshots(self.spill_dir) if snapshot_dir else {}
+        # 上次写快照时每个模型的(学习阶段, 学习的事件数)，没有变化的模型不重复写入
+        self.snapshot_marks: Dict[str, Tuple[str, int]] = {}
+        # 每个key检测到的异常事件数，模型换出后保留
+        self.anomaly_counts: Dict[str, int] = {}
+        self.last_maintain = time.monotonic()
+        self.last_snapshot = self.last_maintain
+        self.created_count = 0
+        self.evicted_count = 0
+        self.loaded_count = 0
+        self.snapshot_count = 0
+
+    def model_key(self, event: Union[Dict[str, Any], EventRecord]) -> str:
+        """
+        获取事件所属模型的key
+
+        Args:
+            event: 原始Falco事件或已解析的事件记录
+
+        Returns:
+            str: 模型key，字段缺失时为"unknown"
+        """
+        if type(event) is EventRecord:
+            output_fields = event.fields
+        else:
+            output_fields = event.get("output_fields", event)
+        return output_fields.get(self.key_field) or "unknown"
+
+    def get_model(self, key: str) -> HBTModel:
+        """
+        获取key对应的模型，必要时从磁盘加载或新建
+
+        Args:
+            key: 模型key
+
+        Returns:
+            HBTModel: 对应的模型
+        """
+        entry = self.resident.get(key)
+        if entry is not None:
+            model = entry[0]
+            self.resident[key] = (model, time.monotonic())
+            self.resident.move_to_end(key)
+            return model
+
+        path = self.spilled.pop(key, None)
+        model = None
+        if path is not None:
+            try:
+                model = read_snapshot(path, LearningState(**self.learning_options), self.store)
+            except (OSError, ValueError) as e:
+                # 损坏的快照不影响其他模型，该容器重新学习
+                print(f"Failed to load snapshot {path}, relearning {key}: {e}", file=sys.stderr)
+            else:
+                self.loaded_count += 1
+                self.snapshot_marks[key] = _snapshot_mark(model)
+            if self.snapshot_dir is None:
+                os.remove(path)
+        if model is None:
+            model = HBTModel(key, LearningState(**self.learning_options), self.store)
+            self.created_count += 1
+
+        self.resident[key] = (model, time.monotonic())
+        if len(self.resident) > self.max_resident_models:
+            self.evict(next(iter(self.resident)))
+        return model
+
+    def add_event(self, event: Dict[str, Any]):
+        """
+        将事件路由到所属容器的模型
+
+        Args:
+            event: 原始Falco事件
+        """
+        key = self.model_key(event)
+        builder = self.get_model(key).hbt_builder
+        before = builder.anomaly_count
+        builder.add_event(event)
+        if builder.anomaly_count != before:
+            self.anomaly_counts[key] = self.anomaly_counts.get(key, 0) + builder.anomaly_count - before
+        self._periodic()
+
+    def add_events(self, events: List[Union[Dict[str, Any], EventRecord]]) -> int:
+        """
+        批量路由事件
+
+        Args:
+            events: 原始Falco事件或已解析的事件记录列表
+
+        Returns:
+            int: 这批事件中检测到的异常事件数
+        """
+        # 按模型分组，每个模型每批只查找一次；事件只解析一次，分组和建树共用记录
+        key_field = self.key_field
+        groups: Dict[str, List[EventRecord]] = {}
+        for record in EventParser.parse_records(events):
+            groups.setdefault(record.fields.get(key_field) or "unknown", []).append(record)
+        total = 0
+        for key, group in groups.items():
+            anomalies = self.get_model(key).hbt_builder.add_events(group)
+            if anomalies:
+                self.anomaly_counts[key] = self.anomaly_counts.get(key, 0) + anomalies
+                total += anomalies
+        self._periodic()
+        return total
+
+    def _periodic(self):
+        now = time.monotonic()
+        if now - self.last_maintain >= self.maintain_interval:
+            self.maintain(now)
+        if self.snapshot_dir and self.snapshot_interval > 0 and now - self.last_snapshot >= self.snapshot_interval:
+            self.snapshot()
+
+    def semantic_queries(self, event: Union[Dict[str, Any], EventRecord]) -> List[str]:
+        """返回该事件在所属模型中需要语义模型才能确定的查找字符串"""
+        return self.get_model(self.model_key(event)).hbt_builder.semantic_queries(event)
+
+    def evict(self, key: str):
+        """
+        将常驻模型换出到磁盘
+
+        Args:
+            key: 模型key
+        """
+        model, _ = self.resident.pop(key)
+        mark = _snapshot_mark(model)
+        path = self.snapshot_path(key)
+        # 持久化目录中没有变化的快照不必重写
+        if self.snapshot_marks.get(key) != mark or not os.path.exists(path):
+            # 临时换出目录中的文件不需要在断电后保留
+            durable = self.snapshot_dir is not None
+            write_snapshot(model, path, embeddings=durable, durable=durable)
+            self.snapshot_marks[key] = mark
+        self.spilled[key] = path
+        self.evicted_count += 1
+
+    def snapshot_path(self, key: str) -> str:
+        """返回key对应的快照文件路径"""
+        return os.path.join(self.spill_dir, model_filename(key))
+
+    def snapshot(self) -> int:
+        """
+        把上次快照之后有变化的常驻模型写入快照目录（未设置snapshot_dir时不做任何事）
+
+        Returns:
+            int: 写入的快照数
+        """
+        self.last_snapshot = time.monotonic()
+        if not self.snapshot_dir:
+            return 0
+        written = 0
+        for key, (model, _) in self.resident.items():
+            mark = _snapshot_mark(model)
+            if self.snapshot_marks.get(key) == mark:
+                continue
+            try:
+                write_snapshot(model, self.snapshot_path(key))
+            except OSError as e:
+                print(f"Failed to write snapshot for {key}: {e}", file=sys.stderr)
+                continue
+            self.snapshot_marks[key] = mark
+            written += 1
+        self.snapshot_count += written
+        return written
+
+    def maintain(self, now: Optional[float] = None):
+        """
+        换出空闲模型，并在节点总数超限时换出最近最少使用的模型
+
+        Args:
+            now: 当前的monotonic时间，默认取当前时间
+        """
+        now = time.monotonic() if now is None else now
+        self.last_maintain = now
+        for key, (_, last_seen) in list(self.resident.items()):
+            if now - last_seen >= self.idle_seconds:
+                self.evict(key)
+
+        if self.max_total_nodes is not None:
+            node_counts = {key: model.hbt_builder.count_nodes() for key, (model, _) in self.resident.items()}
+            total = sum(node_counts.values())
+            for key in list(self.resident):
+                if total <= self.max_total_nodes or len(self.resident) == 1:
+                    break
+                total -= node_counts[key]
+                self.evict(key)
+
+    def relearn(self, key: str) -> bool:
+        """
+        让处于检测阶段的模型重新学习，直到再次收敛
+
+        Args:
+            key: 模型key
+
+        Returns:
+            bool: 是否切换（模型不存在或不在检测阶段时为False）
+        """
+        if key not in self.resident and key not in self.spilled:
+            return False
+        state = self.get_model(key).hbt_builder.learning_state
+        if state.learning:
+            return False
+        state.start_relearning()
+        return True
+
+    def models(self) -> Iterator[Tuple[str, HBTModel]]:
+        """遍历内存中的常驻模型"""
+        for key, (model, _) in self.resident.items():
+            yield key, model
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        获取注册表统计信息
+
+        Returns:
+            dict: 统计信息
+        """
+        return {
+            "resident_models": len(self.resident),
+            "spilled_models": len(self.spilled),
+            "created": self.created_count,
+            "evicted": self.evicted_count,
+            "loaded": self.loaded_count,
+            "snapshots": self.snapshot_count,
+            "anomalies": sum(self.anomaly_counts.values()),
+            "learning_models": sum(
+                1 for model, _ in self.resident.values() if model.hbt_builder.learning_state.learning
+            ),
+        }
+
+
+def _snapshot_mark(model: HBTModel) -> Tuple[str, int]:
+    # 只有学习阶段会修改树，学习的事件数和阶段都没变时模型与上次快照相同
+    state = model.hbt_builder.learning_state
+    return state.phase.value, state.total_events
@@ -0,0 +1,303 @@
+"""
+HBT模型的二进制快照
+
+文件格式（小端序）：
+    magic b"HBTS" | u16 版本 | u16 保留
+    u32 长度 + JSON头部（container_id、learning_phase、节点数、字符串数、语义向量的后端和维度等）
+    字符串表：u32[字符串数+1] UTF-8字节偏移 + 拼接的字节
+    节点数组（父节点在前、兄弟节点按插入顺序）：i32 parent | i32 name_id | i32 type_id | i64 events_count | i64 updated_ns（墙上时间纳秒）
+    u32 长度 + JSON元数据（节点下标 -> 元数据，只含有元数据的节点）
+    语义向量：i32[个数] 字符串ID + f32[个数 * 维度]
+    u32 之前所有字节的CRC32
+
+节点数组可以直接交给ColumnarStore，或者一次线性扫描重建TreeNode对象树，不需要解析JSON或递归
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from .columnar_store import ColumnarNode, ColumnarStore, NO_NODE
+from .embedding import export_embeddings, import_embeddings
+from .hbt import HBTModel
+from .learning_state import LearningState
+from .tree_node import TreeNode, _WALL_CLOCK_OFFSET_NS
+from ..utils.checkpoint import fsync_directory
+
+MAGIC = b"HBTS"
+VERSION = 1
+SNAPSHOT_SUFFIX = ".hbts"
+
+_PREAMBLE = struct.Struct("<4sHHI")
+_U32 = struct.Struct("<I")
+# 各节点数组的名称和类型码
+_NODE_COLUMNS = (("parent", "i"), ("name_id", "i"), ("type_id", "i"), ("events_count", "q"), ("updated_ns", "q"))
+
+
+def _to_le(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode: str, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def _flatten(root) -> Tuple[List[str], Dict[str, array], Dict[int, Dict[str, Any]]]:
+    """把树展开为(字符串表, 节点数组, 元数据)，updated_ns换算为墙上时间"""
+    if isinstance(root, ColumnarNode):
+        # 列式存储的下标顺序本身就满足父节点在前、兄弟节点按插入顺序
+        store = root.store
+        columns = {
+            "parent": array("i", store.parent),
+            "name_id": array("i", store.name_id),
+            "type_id": array("i", store.type_id),
+            "events_count": array("q", store.events_count),
+            "updated_ns": array("q", (value + _WALL_CLOCK_OFFSET_NS for value in store.updated_ns)),
+        }
+        metadata = {node: value for node, value in store.metadata.items() if value}
+        return list(store.strings), columns, metadata
+
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+
+    def intern(text: str) -> int:
+        string_id = string_ids.get(text)
+        if string_id is None:
+            string_id = string_ids[text] = len(strings)
+            strings.append(text)
+        return string_id
+
+    columns = {name: array(typecode) for name, typecode in _NODE_COLUMNS}
+    metadata: Dict[int, Dict[str, Any]] = {}
+    # 广度优先展开，列表在遍历时增长
+    nodes = [root]
+    parents = [NO_NODE]
+    for index, node in enumerate(nodes):
+        columns["parent"].append(parents[index])
+        columns["name_id"].append(intern(node.name))
+        columns["type_id"].append(intern(node.node_type))
+        columns["events_count"].append(node.events_count)
+        columns["updated_ns"].append(node._updated_ns + _WALL_CLOCK_OFFSET_NS)
+        if node._metadata:
+            metadata[index] = node._metadata
+        if node._children:
+            nodes.extend(node._children.values())
+            parents.extend([index] * len(node._children))
+    return strings, columns, metadata
+
+
+def write_snapshot(model: HBTModel, path: str, embeddings: bool = True, durable: bool = True) -> int:
+    """
+    把模型原子地写成二进制快照（先写临时文件再重命名）
+
+    Args:
+        model: HBT模型
+        path: 快照文件路径
+        embeddings: 是否保存语义模型缓存中节点名称的向量
+        durable: 是否在重命名前把临时文件、重命名后把目录同步到磁盘，断电后不会留下空的或旧的快照
+
+    Returns:
+        int: 写入的字节数
+    """
+    builder = model.hbt_builder
+    strings, columns, metadata = _flatten(builder.root)
+    backend_id, positions, vectors, dim = export_embeddings(strings) if embeddings else (None, [], b"", 0)
+    header = {
+        "container_id": builder.container_id,
+        "learning_phase": builder.learning_state.phase.value,
+        "created_at": time.time(),
+        "nodes": len(columns["parent"]),
+        "strings": len(strings),
+        "embedding_backend": backend_id if positions else None,
+        "embedding_dim": dim,
+        "embeddings": len(positions),
+    }
+
+    encoded = [text.encode("utf-8", "surrogatepass") for text in strings]
+    offsets = array("I", [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    metadata_bytes = json.dumps(
+        {str(node): value for node, value in metadata.items()}, ensure_ascii=False, default=str
+    ).encode("utf-8")
+    parts = [
+        _PREAMBLE.pack(MAGIC, VERSION, 0, len(header_bytes)), header_bytes,
+        _to_le(offsets), b"".join(encoded),
+        *(_to_le(columns[name]) for name, _ in _NODE_COLUMNS),
+        _U32.pack(len(metadata_bytes)), metadata_bytes,
+        _to_le(array("i", positions)), vectors,
+    ]
+
+    tmp_path = path + ".tmp"
+    checksum = 0
+    size = 0
+    with open(tmp_path, "wb") as f:
+        for part in parts:
+            f.write(part)
+            checksum = zlib.crc32(part, checksum)
+            size += len(part)
+        f.write(_U32.pack(checksum))
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if durable:
+        fsync_directory(os.path.dirname(path))
+    return size + _U32.size
+
+
+def read_snapshot_header(path: str) -> Dict[str, Any]:
+    """
+    只读取快照的头部
+
+    Args:
+        path: 快照文件路径
+
+    Returns:
+        dict: 头部信息（包括version）
+    """
+    with open(path, "rb") as f:
+        preamble = f.read(_PREAMBLE.size)
+        header = _check_preamble(path, preamble)
+        header.update(json.loads(f.read(_PREAMBLE.unpack(preamble)[3])))
+    return header
+
+
+def _check_preamble(path: str, preamble: bytes) -> Dict[str, Any]:
+    if len(preamble) < _PREAMBLE.size:
+        raise ValueError(f"{path} is too short to be an HBT snapshot")
+    magic, version, _, _ = _PREAMBLE.unpack(preamble)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not an HBT snapshot")
+    if version > VERSION:
+        raise ValueError(f"{path} has snapshot version {version}, this build reads up to {VERSION}")
+    return {"version": version}
+
+
+def read_snapshot(path: str, learning_state: Optional[LearningState] = None, store: str = "object",
+                  embeddings: bool = True) -> HBTModel:
+    """
+    从二进制快照加载模型，并恢复保存时的学习阶段（检测阶段的模型直接进入检测）
+
+    Args:
+        path: 快照文件路径
+        learning_state: 模型的学习状态机，默认新建
+        store: 树的存储方式，"object"或"columnar"
+        embeddings: 是否把保存的语义向量放入语义模型的缓存
+
+    Returns:
+        HBTModel: 加载的模型
+    """
+    with open(path, "rb") as f:
+        data = memoryview(f.read())
+    _check_preamble(path, data[:_PREAMBLE.size].tobytes())
+    if len(data) < _PREAMBLE.size + _U32.size or \
+            zlib.crc32(data[:-_U32.size]) != _U32.unpack_from(data, len(data) - _U32.size)[0]:
+        raise ValueError(f"{path} is truncated or corrupt (checksum mismatch)")
+
+    position = _PREAMBLE.size
+    header_size = _PREAMBLE.unpack_from(data)[3]
+    header = json.loads(data[position:position + header_size].tobytes())
+    position += header_size
+
+    node_count = header["nodes"]
+    string_count = header["strings"]
+    offsets = _from_le("I", data[position:position + (string_count + 1) * 4])
+    position += len(offsets) * 4
+    blob = data[position:position + offsets[-1]].tobytes()
+    position += offsets[-1]
+    strings = [blob[offsets[i]:offsets[i + 1]].decode("utf-8", "surrogatepass") for i in range(string_count)]
+
+    columns = {}
+    for name, typecode in _NODE_COLUMNS:
+        width = array(typecode).itemsize
+        columns[name] = _from_le(typecode, data[position:position + node_count * width])
+        position += node_count * width
+
+    metadata_size = _U32.unpack_from(data, position)[0]
+    position += _U32.size
+    metadata = {int(node): value for node, value in json.loads(data[position:position + metadata_size].tobytes()).items()}
+    position += metadata_size
+
+    embedding_count = header["embeddings"]
+    if embeddings and embedding_count:
+        positions = _from_le("i", data[position:position + embedding_count * 4])
+        position += embedding_count * 4
+        vectors = data[position:position + embedding_count * header["embedding_dim"] * 4]
+        import_embeddings(header["embedding_backend"], [strings[string_id] for string_id in positions],
+                          vectors, header["embedding_dim"])
+
+    updated_ns = columns["updated_ns"]
+    if store == "columnar":
+        for index in range(node_count):
+            updated_ns[index] -= _WALL_CLOCK_OFFSET_NS
+        columnar = ColumnarStore.from_arrays(strings, columns["parent"], columns["name_id"], columns["type_id"],
+                                             columns["events_count"], updated_ns)
+        columnar.metadata = metadata
+        root = columnar.root
+    else:
+        root = _build_tree(strings, columns, metadata)
+
+    model = HBTModel(header["container_id"], learning_state, store)
+    model.hbt_builder.load_root(header["container_id"], root, header["learning_phase"])
+    return model
+
+
+def _build_tree(strings: List[str], columns: Dict[str, array], metadata: Dict[int, Dict[str, Any]]) -> TreeNode:
+    """按节点数组的顺序一次扫描重建TreeNode对象树"""
+    parent, name_id, type_id = columns["parent"], columns["name_id"], columns["type_id"]
+    events_count, updated_ns = columns["events_count"], columns["updated_ns"]
+    nodes: List[TreeNode] = []
+    for index in range(len(parent)):
+        node = TreeNode(strings[name_id[index]], strings[type_id[index]])
+        if index:
+            owner = nodes[parent[index]]
+            if owner._children is None:
+                owner._children = {}
+            owner._children[node.name] = node
+        node.events_count = events_count[index]
+        node._updated_ns = updated_ns[index] - _WALL_CLOCK_OFFSET_NS
+        nodes.append(node)
+    for index, value in metadata.items():
+        nodes[index].metadata = value
+    return nodes[0]
+
+
+def find_snapshots(directory: str) -> Dict[str, str]:
+    """
+    查找目录中的快照，无法读取的文件被跳过
+
+    Args:
+        directory: 快照目录
+
+    Returns:
+        dict: 模型key（头部中的container_id） -> 快照路径
+    """
+    snapshots = {}
+    for path in _iter_snapshot_files(directory):
+        try:
+            snapshots[read_snapshot_header(path)["container_id"]] = path
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Skipping unreadable snapshot {path}: {e}", file=sys.stderr)
+    return snapshots
+
+
+def _iter_snapshot_files(directory: str) -> Iterator[str]:
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(SNAPSHOT_SUFFIX):
+            yield os.path.join(directory, name)
@@ -1,9 +1,24 @@
-from typing import Dict, Any, Optional
+import sys
+import time
+from types import MappingProxyType
+from typing import Dict, Any, Iterable, Mapping, Optional
 from datetime import datetime
 
+# monotonic时间与墙上时间的差值，用于在读取last_updated时换算成datetime
+_WALL_CLOCK_OFFSET_NS = time.time_ns() - time.monotonic_ns()
+# 没有子节点时共享的只读空映射
+_NO_CHILDREN: Mapping[str, 'TreeNode'] = MappingProxyType({})
+
 
 class TreeNode:
-    """树节点类，用于表示HBT模型中的节点"""
+    """
+    树节点类，用于表示HBT模型中的节点
+
+    使用__slots__并驻留name/node_type字符串，children和metadata字典在第一次写入时才分配，
+    更新时间以monotonic纳秒整数保存，读取last_updated时才换算成datetime
+    """
+
+    __slots__ = ("name", "node_type", "_children", "events_count", "_metadata", "_updated_ns", "child_index")
     
     def __init__(self, name: str, node_type: str):
         """
@@ -13,12 +28,39 @@ class TreeNode:
             name: 节点名称
             node_type: 节点类型 ('process', 'network', 'file')
         """
-        self.name = name
-        self.node_type = node_type
-        self.children: Dict[str, TreeNode] = {}
+        self.name = sys.intern(name)
+        self.node_type = sys.intern(node_type)
+        self._children: Optional[Dict[str, TreeNode]] = None
         self.events_count = 0
-        self.metadata: Dict[str, Any] = {}
-        self.last_updated = datetime.now()
+        self._metadata: Optional[Dict[str, Any]] = None
+        self._updated_ns = time.monotonic_ns()
+        # 子节点的匹配索引（如语义向量矩阵），首次查找时由分支处理器创建
+        self.child_index: Optional[Any] = None
+
+    @property
+    def children(self) -> Mapping[str, 'TreeNode']:
+        """子节点映射（只读），通过add_child添加子节点"""
+        return MappingProxyType(self._children) if self._children is not None else _NO_CHILDREN
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        """节点元数据，第一次访问时才分配字典"""
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value: Dict[str, Any]):
+        self._metadata = value or None
+
+    @property
+    def last_updated(self) -> datetime:
+        """最后一次更新的时间"""
+        return datetime.fromtimestamp((self._updated_ns + _WALL_CLOCK_OFFSET_NS) / 1e9)
+
+    @last_updated.setter
+    def last_updated(self, value: datetime):
+        self._updated_ns = int(value.timestamp() * 1e9) - _WALL_CLOCK_OFFSET_NS
     
     def add_child(self, child_name: str, child_type: str) -> 'TreeNode':
         """
@@ -31,9 +73,15 @@ class TreeNode:
         Returns:
             TreeNode: 创建或已存在的子节点
         """
-        if child_name not in self.children:
-            self.children[child_name] = TreeNode(child_name, child_type)
-        return self.children[child_name]
+        if self._children is None:
+            self._children = {}
+        child = self._children.get(child_name)
+        if child is None:
+            child = TreeNode(child_name, child_type)
+            self._children[child.name] = child
+            if self.child_index is not None:
+                self.child_index.add(child.name)
+        return child
     
     def get_child(self, child_name: str) -> Optional['TreeNode']:
         """
@@ -45,7 +93,22 @@ class TreeNode:
         Returns:
             TreeNode: 子节点对象，如果不存在返回None
         """
-        return self.children.get(child_name)
+        if self._children is None:
+            return None
+        return self._children.get(child_name)
+
+    def has_children(self) -> bool:
+        """是否有子节点（不创建children视图，供匹配等热路径使用）"""
+        return bool(self._children)
+
+    def child_names(self) -> Iterable[str]:
+        """
+        子节点名称，按插入顺序
+
+        Returns:
+            子节点字典的键视图，没有子节点时为空元组
+        """
+        return self._children.keys() if self._children else ()
     
     def increment_events_count(self, count: int = 1):
         """
@@ -55,7 +118,7 @@ class TreeNode:
             count: 增加的数量，默认为1
         """
         self.events_count += count
-        self.last_updated = datetime.now()
+        self._updated_ns = time.monotonic_ns()
     
     def update_metadata(self, key: str, value: Any):
         """
@@ -66,7 +129,7 @@ class TreeNode:
             value: 元数据值
         """
         self.metadata[key] = value
-        self.last_updated = datetime.now()
+        self._updated_ns = time.monotonic_ns()
     
     def to_dict(self) -> Dict[str, Any]:
         """
@@ -79,6 +142,74 @@ class TreeNode:
             "name": self.name,
             "type": self.node_type,
             "events_count": self.events_count,
-            "metadata": self.metadata,
-            "children": {name: child.to_dict() for name, child in self.children.items()}
-        }
\ No newline at end of file
+            "metadata": self._metadata or {},
+            "children": {name: child.to_dict() for name, child in self._children.items()} if self._children else {}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'TreeNode':
+        """
+        从字典格式重建节点及其子树（to_dict的逆操作）
+
+        Args:
+            data: 节点的字典表示
+
+        Returns:
+            TreeNode: 重建的节点
+        """
+        root = cls(data["name"], data["type"])
+        stack = [(root, data)]
+        while stack:
+            node, node_dict = stack.pop()
+            node.events_count = node_dict["events_count"]
+            node.metadata = node_dict["metadata"]
+            for child_name, child_dict in node_dict["children"].items():
+                stack.append((node.add_child(child_name, child_dict["type"]), child_dict))
+        return root
+
+    def merge(self, other: 'TreeNode'):
+        """
+        把另一棵同根的树合并进来：按名称对齐子节点，events_count相加，
+        只在一侧存在的子树整体加入，元数据缺失的键用另一侧的值补上
+
+        结果只取决于合并顺序：新加入的子节点排在已有子节点之后，保持other中的顺序
+
+        Args:
+            other: 要合并的节点，不会被修改
+
+        Returns:
+            int: 新加入的节点数，调用方据此更新节点计数而不必重新遍历
+        """
+        added = 0
+        stack = [(self, other)]
+        while stack:
+            node, source = stack.pop()
+            node.events_count += source.events_count
+            if source._updated_ns > node._updated_ns:
+                node._updated_ns = source._updated_ns
+            if source._metadata:
+                metadata = node.metadata
+                for key, value in source._metadata.items():
+                    metadata.setdefault(key, value)
+            if source._children:
+                before = len(node._children) if node._children else 0
+                for name, child in source._children.items():
+                    stack.append((node.add_child(name, child.node_type), child))
+                added += len(node._children) - before
+        return added
+
+    def count_nodes(self) -> int:
+        """
+        统计以该节点为根的子树中的节点数量（包括自身）
+
+        Returns:
+            int: 节点数量
+        """
+        count = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            count += 1
+            if node._children:
+                stack.extend(node._children.values())
+        return count
@@ -0,0 +1,213 @@
+"""
+HBT的非递归遍历和流式序列化
+
+write_tree()/write_model()边遍历边把节点写到文件或socket（任何有write(str)方法的对象，
+socket可以用sock.makefile("w", encoding="utf-8")），不构建to_dict()那样的嵌套字典，也不拼接整个JSON字符串。
+两种格式：
+    json    与to_dict()/get_model()相同的嵌套结构，可以用TreeNode.from_dict()/HBTModel.from_model()加载
+    ndjson  每行一个节点：id、parent、depth、name、type、events_count、metadata，按先序排列（父节点在前）
+"""
+
+import json
+from typing import Dict, Any, Iterator, Optional, TextIO, Tuple, Union
+
+from .columnar_store import ColumnarNode
+from .tree_node import TreeNode
+
+FORMATS = ("json", "ndjson")
+# 缓冲的字符数超过该值后写出一次
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+_encode = json.JSONEncoder(ensure_ascii=False, default=str).encode
+
+Node = Union[TreeNode, ColumnarNode]
+
+
+def _iter_children(node: Node) -> Iterator[Node]:
+    if isinstance(node, ColumnarNode):
+        store = node.store
+        return (ColumnarNode(store, child) for child in store.iter_children(node.node))
+    return iter(node._children.values()) if node._children else iter(())
+
+
+def _node_metadata(node: Node) -> Dict[str, Any]:
+    # 不通过metadata属性读取，避免为没有元数据的节点分配空字典
+    if isinstance(node, ColumnarNode):
+        return node.store.metadata.get(node.node) or {}
+    return node._metadata or {}
+
+
+def _node_key(node: Node) -> int:
+    # ColumnarNode是每次新建的视图，用下标区分节点
+    return node.node if isinstance(node, ColumnarNode) else id(node)
+
+
+def subtree_events(root: Node) -> Dict[int, int]:
+    """
+    统计每个子树（包括自身）的事件总数
+
+    只有叶子层的节点计数，中间节点的events_count为0，按子树总数剪枝才能保留有事件的路径
+
+    Args:
+        root: 根节点
+
+    Returns:
+        dict: 节点key（TreeNode为id()，ColumnarNode为下标） -> 子树的事件总数
+    """
+    totals: Dict[int, int] = {}
+    order = []
+    stack = [(root, None)]
+    while stack:
+        node, parent = stack.pop()
+        key = _node_key(node)
+        totals[key] = node.events_count
+        order.append((key, parent))
+        stack.extend((child, key) for child in _iter_children(node))
+    # 先序的逆序中子节点总在父节点之前
+    for key, parent in reversed(order):
+        if parent is not None:
+            totals[parent] += totals[key]
+    return totals
+
+
+def walk(root: Node, max_depth: Optional[int] = None, min_events: int = 0) -> Iterator[Tuple[int, int, int, Node]]:
+    """
+    用显式栈按先序遍历树，兄弟节点保持插入顺序
+
+    被剪枝的节点连同其子树一起跳过，根节点总是保留
+
+    Args:
+        root: 根节点（TreeNode或ColumnarNode）
+        max_depth: 最大深度（根节点为0，None表示不限制）
+        min_events: 子树（包括自身）的事件总数低于该值时剪枝
+
+    Yields:
+        tuple: (节点序号, 父节点序号（根节点为-1）, 深度, 节点)，序号按输出顺序从0开始
+    """
+    totals = subtree_events(root) if min_events > 0 else None
+    index = 0
+    stack = [(root, -1, 0)]
+    while stack:
+        node, parent, depth = stack.pop()
+        yield index, parent, depth, node
+        if max_depth is None or depth < max_depth:
+            children = list(_iter_children(node))
+            if totals is not None:
+                children = [child for child in children if totals[_node_key(child)] >= min_events]
+            # 逆序入栈，出栈时保持插入顺序
+            stack.extend((child, index, depth + 1) for child in reversed(children))
+        index += 1
+
+
+class _BufferedWriter:
+    """把小片段攒成块后再写出，减少对文件或socket的write调用"""
+
+    def __init__(self, fp: TextIO, chunk_size: int):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text: str):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.fp.write("".join(self.parts))
+            self.parts = []
+            self.size = 0
+
+
+def _write_json(out: _BufferedWriter, root: Node, max_depth: Optional[int], min_events: int) -> int:
+    # 每个节点写成 {"name":..,"type":..,"events_count":..,"metadata":..,"children":{ ，
+    # 深度回落时补上对应层数的 }}；first[d]表示深度d的节点是否还没有写出子节点
+    first = []
+    count = 0
+    for _, _, depth, node in walk(root, max_depth, min_events):
+        while len(first) > depth:
+            first.pop()
+            out.write("}}")
+        if depth:
+            if not first[-1]:
+                out.write(",")
+            first[-1] = False
+            out.write(_encode(node.name))
+            out.write(":")
+        out.write(f'{{"name":{_encode(node.name)},"type":{_encode(node.node_type)},'
+                  f'"events_count":{node.events_count},"metadata":{_encode(_node_metadata(node))},"children":{{')
+        first.append(True)
+        count += 1
+    out.write("}}" * len(first))
+    return count
+
+
+def _write_ndjson(out: _BufferedWriter, root: Node, max_depth: Optional[int], min_events: int) -> int:
+    count = 0
+    for index, parent, depth, node in walk(root, max_depth, min_events):
+        out.write(f'{{"id":{index},"parent":{parent},"depth":{depth},"name":{_encode(node.name)},'
+                  f'"type":{_encode(node.node_type)},"events_count":{node.events_count},'
+                  f'"metadata":{_encode(_node_metadata(node))}}}\n')
+        count += 1
+    return count
+
+
+def write_tree(root: Node, fp: TextIO, format: str = "json", max_depth: Optional[int] = None,
+               min_events: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    把树流式写出
+
+    Args:
+        root: 根节点（TreeNode或ColumnarNode）
+        fp: 文本输出流
+        format: "json"（与to_dict()相同的结构）或"ndjson"（每行一个节点）
+        max_depth: 最大深度（根节点为0，None表示不限制）
+        min_events: 子树的事件总数低于该值的节点连同子树一起省略
+        chunk_size: 缓冲的字符数
+
+    Returns:
+        int: 写出的节点数
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format: {format!r} (expected one of {', '.join(FORMATS)})")
+    out = _BufferedWriter(fp, chunk_size)
+    if format == "json":
+        count = _write_json(out, root, max_depth, min_events)
+    else:
+        count = _write_ndjson(out, root, max_depth, min_events)
+    out.flush()
+    return count
+
+
+def write_model(fp: TextIO, container_id: str, learning_phase: str, root: Node, format: str = "json",
+                max_depth: Optional[int] = None, min_events: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    把模型流式写出
+
+    json格式与get_model()的输出相同；ndjson格式第一行是{"container_id":..,"learning_phase":..}，之后每行一个节点
+
+    Args:
+        fp: 文本输出流
+        container_id: 容器ID
+        learning_phase: 学习阶段（LearningPhase的值）
+        root: HBT根节点
+        format: "json"或"ndjson"
+        max_depth: 最大深度（根节点为0，None表示不限制）
+        min_events: 子树的事件总数低于该值的节点连同子树一起省略
+        chunk_size: 缓冲的字符数
+
+    Returns:
+        int: 写出的节点数
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format: {format!r} (expected one of {', '.join(FORMATS)})")
+    if format == "json":
+        fp.write(f'{{"container_id":{_encode(container_id)},"learning_phase":{_encode(learning_phase)},'
+                 f'"hbt_structure":')
+        count = write_tree(root, fp, format, max_depth, min_events, chunk_size)
+        fp.write("}")
+        return count
+    fp.write(_encode({"container_id": container_id, "learning_phase": learning_phase}) + "\n")
+    return write_tree(root, fp, format, max_depth, min_events, chunk_size)
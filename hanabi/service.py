@@ -0,0 +1,412 @@
+"""
+统一的事件处理服务：事件只读取和解码一次，按批分发给多个汇（sink）
+
+用法：
+    python -m hanabi.service [--sinks prometheus,profiler] [--port 9876]
+
+事件来源由HANABI_EVENT_SOURCE选择（见hanabi.utils.sources）。每个汇有自己的有界缓冲区和线程，
+缓冲区满时按溢出策略（默认drop_oldest）丢弃该汇的事件，慢的汇不会拖慢读取和其他汇。
+所有汇共用同一批事件对象，汇不能修改事件
+"""
+
+import argparse
+import os
+import sys
+from collections import OrderedDict
+from functools import partial
+from threading import Event, Lock, Thread
+from typing import Dict, Any, List, Optional
+
+from prometheus_client import REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from .models.anomaly import get_anomaly_sink
+from .models.batch_matcher import DEFAULT_MAX_BATCH_SIZE, MicroBatchMatcher
+from .models.embedding import warm_up
+from .models.registry import HBTRegistry
+from .utils import event_metrics
+from .utils.metrics import mark_startup, record_sink_dropped_events, set_embedding_warmup_seconds, track_queue_depth
+from .utils.queue import EventBuffer
+from .utils.sources import create_event_queue
+
+DEFAULT_SINKS = os.getenv("HANABI_SINKS", "prometheus,profiler")
+DEFAULT_SINK_BUFFER = int(os.getenv("HANABI_SINK_BUFFER", "10000"))
+DEFAULT_SINK_OVERFLOW_POLICY = os.getenv("HANABI_SINK_OVERFLOW_POLICY", "drop_oldest")
+DEFAULT_SINK_BATCH_SIZE = 500
+DEFAULT_METRICS_PORT = 9876
+
+
+class _SinkBuffer(EventBuffer):
+    """汇的缓冲区：被溢出策略丢弃的事件通知所属的汇"""
+
+    def __init__(self, sink: "Sink", *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sink = sink
+
+    def _drop(self, events):
+        super()._drop(events)
+        self.sink._release(events)
+
+
+class Sink:
+    """
+    事件汇的基类
+
+    子类实现handle_batch()。submit()把事件放入汇自己的有界缓冲区，由汇的线程按批取出处理，
+    除非溢出策略是block，submit()不会等待
+    """
+
+    name = "sink"
+
+    def __init__(
+        self,
+        max_buffer: int = DEFAULT_SINK_BUFFER,
+        overflow_policy: str = DEFAULT_SINK_OVERFLOW_POLICY,
+        batch_size: int = DEFAULT_SINK_BATCH_SIZE,
+    ):
+        """
+        初始化事件汇
+
+        Args:
+            max_buffer: 缓冲区最多容纳的事件数
+            overflow_policy: 缓冲区满时的溢出策略（block会让这个汇反压整个服务）
+            batch_size: 每次交给handle_batch的最大事件数
+        """
+        self.buffer = _SinkBuffer(
+            self, max_buffer, overflow_policy, on_drop=partial(record_sink_dropped_events, self.name)
+        )
+        self.batch_size = batch_size
+        # 还在汇中（缓冲区或正在处理）的事件：id(事件) -> 提交顺序中的位置（从1开始），按提交顺序排列
+        self.positions: "OrderedDict[int, int]" = OrderedDict()
+        self.positions_lock = Lock()
+        self.submitted_count = 0
+        self.stop_event = Event()
+        self.thread = None
+        self.batch_count = 0
+        self.event_count = 0
+        self.error_count = 0
+
+    def handle_batch(self, events: List[Dict[str, Any]]):
+        """
+        处理一批事件，由子类实现
+
+        Args:
+            events: 原始Falco事件列表
+        """
+        raise NotImplementedError
+
+    def start(self):
+        """启动汇的处理线程"""
+        track_queue_depth(f"sink_{self.name}", self.buffer.__len__)
+        self.thread = Thread(target=self._run, name=f"sink-{self.name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, events: List[Dict[str, Any]]) -> bool:
+        """
+        把一批事件放入缓冲区
+
+        Args:
+            events: 原始Falco事件列表
+
+        Returns:
+            bool: 是否放入（缓冲区满时按溢出策略丢弃的事件单独计数）
+        """
+        with self.positions_lock:
+            for event in events:
+                self.submitted_count += 1
+                self.positions[id(event)] = self.submitted_count
+        if self.buffer.put_batch(events):
+            return True
+        self._release(events)
+        return False
+
+    def _release(self, events: List[Dict[str, Any]]):
+        """事件处理完或被丢弃后离开汇"""
+        with self.positions_lock:
+            for event in events:
+                self.positions.pop(id(event), None)
+
+    @property
+    def completed(self) -> int:
+        """
+        按提交顺序，前completed个事件都已离开汇（处理完、处理失败或被溢出策略丢弃）
+
+        drop_newest和sample丢弃的是较新的事件，所以不能用处理数加丢弃数，
+        而是取仍在汇中最早的事件的位置
+        """
+        with self.positions_lock:
+            oldest = next(iter(self.positions.values()), self.submitted_count + 1)
+        return oldest - 1
+
+    def _handle(self, events: List[Dict[str, Any]]):
+        try:
+            self.handle_batch(events)
+        except Exception as e:
+            # 一批事件处理失败不影响后续批次和其他汇
+            self.error_count += 1
+            print(f"Sink {self.name} failed on a batch of {len(events)} events: {e}", file=sys.stderr)
+        self._release(events)
+        self.batch_count += 1
+        self.event_count += len(events)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            batch = self.buffer.get_batch(self.batch_size, timeout=0.1)
+            if batch:
+                self._handle(batch)
+
+    def stop(self, drain: bool = True):
+        """
+        停止处理线程
+
+        Args:
+            drain: 是否先处理完缓冲区中的事件
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+        if drain:
+            while True:
+                batch = self.buffer.get_batch(self.batch_size, timeout=0)
+                if not batch:
+                    break
+                self._handle(batch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取汇的统计信息（包括缓冲区丢弃数）"""
+        return {
+            "batches": self.batch_count,
+            "events": self.event_count,
+            "errors": self.error_count,
+            "pending": len(self.buffer),
+            **self.buffer.get_stats(),
+        }
+
+
+class PrometheusSink(Sink):
+    """按标签统计事件数和每个容器的最新事件时间，与prometheus/exporter.py导出相同的指标"""
+
+    name = "prometheus"
+
+    def handle_batch(self, events: List[Dict[str, Any]]):
+        event_metrics.process_events(events)
+
+
+class ProfilerSink(Sink):
+    """
+    HBT行为建模：按container.id把事件交给各容器的HBT模型学习或检测
+
+    模型状态（每个分支的节点数、学习阶段、异常事件数）在抓取时通过HBTStateCollector导出
+    """
+
+    name = "profiler"
+
+    def __init__(self, registry: Optional[HBTRegistry] = None, export_state: bool = True, **options):
+        """
+        初始化HBT建模汇
+
+        Args:
+            registry: 多容器HBT注册表，默认新建
+            export_state: 是否把模型状态注册为Prometheus指标
+            **options: Sink的参数，batch_size默认为微批匹配器的批大小
+        """
+        options.setdefault("batch_size", DEFAULT_MAX_BATCH_SIZE)
+        super().__init__(**options)
+        self.registry = registry or HBTRegistry()
+        # 在汇的线程中同步调用process_batch，不启动匹配器自己的线程
+        self.matcher = MicroBatchMatcher(self.registry, max_batch_size=self.batch_size)
+        # 保护注册表，抓取指标的线程读取模型状态时不与建树并发
+        self.lock = Lock()
+        self.collector = HBTStateCollector(self) if export_state else None
+
+    def start(self):
+        # 在后台线程加载语义模型，加载完成前事件只走精确/词法匹配
+        warm_up(on_ready=set_embedding_warmup_seconds)
+        if self.collector is not None:
+            REGISTRY.register(self.collector)
+        super().start()
+
+    def handle_batch(self, events: List[Dict[str, Any]]):
+        with self.lock:
+            self.matcher.process_batch(events)
+
+    def stop(self, drain: bool = True):
+        super().stop(drain)
+        with self.lock:
+            self.registry.snapshot()
+        if self.collector is not None:
+            REGISTRY.unregister(self.collector)
+
+    def snapshot_state(self) -> Dict[str, Any]:
+        """
+        获取模型状态快照
+
+        Returns:
+            dict: models为key -> (学习阶段, 分支名 -> 节点数)，另有spilled（换出的模型数）和anomalies（key -> 异常事件数）
+        """
+        with self.lock:
+            models = {}
+            for key, model in self.registry.models():
+                builder = model.hbt_builder
+                models[key] = (builder.learning_state.phase.value, builder.branch_node_counts())
+            return {
+                "models": models,
+                "spilled": len(self.registry.spilled),
+                "anomalies": dict(self.registry.anomaly_counts),
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        with self.lock:
+            stats["registry"] = self.registry.get_statistics()
+        stats["strings_encoded"] = self.matcher.encoded_count
+        stats["anomaly_sink"] = get_anomaly_sink().get_stats()
+        return stats
+
+
+class HBTStateCollector:
+    """在抓取时把ProfilerSink中的HBT模型状态转换为Prometheus指标"""
+
+    def __init__(self, sink: ProfilerSink):
+        self.sink = sink
+
+    def describe(self):
+        # 不在注册时调用collect()
+        return []
+
+    def collect(self):
+        state = self.sink.snapshot_state()
+        nodes = GaugeMetricFamily(
+            "hanabi_hbt_nodes", "Nodes in each branch of the resident HBT models.", labels=["container", "branch"]
+        )
+        phases = GaugeMetricFamily(
+            "hanabi_hbt_learning_phase", "Current learning phase of each resident HBT model (always 1).",
+            labels=["container", "phase"]
+        )
+        for key, (phase, branches) in state["models"].items():
+            phases.add_metric([key, phase], 1)
+            for branch, count in branches.items():
+                nodes.add_metric([key, branch], count)
+        models = GaugeMetricFamily("hanabi_hbt_models", "HBT models in memory and spilled to disk.", labels=["state"])
+        models.add_metric(["resident"], len(state["models"]))
+        models.add_metric(["spilled"], state["spilled"])
+        anomalies = CounterMetricFamily(
+            "hanabi_hbt_anomalies", "Events that did not match their container's HBT model in detection.",
+            labels=["container"]
+        )
+        for key, count in state["anomalies"].items():
+            anomalies.add_metric([key], count)
+        yield from (nodes, phases, models, anomalies)
+
+
+# 汇名称 -> 类
+SINKS = {
+    "prometheus": PrometheusSink,
+    "profiler": ProfilerSink,
+}
+
+
+def create_sinks(names: str = DEFAULT_SINKS, **options) -> List[Sink]:
+    """
+    按名称创建事件汇
+
+    Args:
+        names: 逗号分隔的汇名称（SINKS中的键）
+        **options: 每个汇共用的Sink参数
+
+    Returns:
+        list: 事件汇（尚未启动）
+    """
+    sinks = []
+    for name in (name.strip() for name in names.split(",")):
+        if not name:
+            continue
+        if name not in SINKS:
+            raise ValueError(f"Unknown sink: {name!r} (expected some of {', '.join(SINKS)})")
+        sinks.append(SINKS[name](**options))
+    if not sinks:
+        raise ValueError("At least one sink is required")
+    return sinks
+
+
+class EventService:
+    """
+    从一个事件队列读取，把每批事件分发给所有汇
+
+    所有汇都处理完一批事件后才向事件队列确认，检查点只前进到已确认的位置
+    """
+
+    def __init__(self, log_queue, sinks: List[Sink], batch_size: int = DEFAULT_SINK_BATCH_SIZE,
+                 max_wait: float = 1.0):
+        """
+        初始化服务
+
+        Args:
+            log_queue: 事件队列（EventLogQueue，尚未启动）
+            sinks: 事件汇列表
+            batch_size: 每次从队列取出的最大事件数
+            max_wait: 等待一批事件的最长秒数（之后检查是否停止）
+        """
+        self.log_queue = log_queue
+        self.sinks = sinks
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+
+    def run(self):
+        """启动所有汇和事件队列，分发事件直到队列停止或被中断"""
+        for sink in self.sinks:
+            sink.start()
+        self.log_queue.start()
+        try:
+            for batch in self.log_queue.iter_batches(self.batch_size, self.max_wait):
+                for sink in self.sinks:
+                    sink.submit(batch)
+                self._ack()
+        finally:
+            self.stop()
+
+    def _ack(self):
+        """向事件队列确认所有汇都已处理完的事件"""
+        self.log_queue.ack(min((sink.completed for sink in self.sinks), default=None))
+
+    def stop(self):
+        """停止读取，让每个汇处理完已缓冲的事件，再保存检查点"""
+        self.log_queue.stop()
+        for sink in self.sinks:
+            sink.stop()
+        self._ack()
+        self.log_queue.save_checkpoint()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取事件队列和每个汇的统计信息"""
+        return {
+            "source": self.log_queue.get_stats(),
+            "sinks": {sink.name: sink.get_stats() for sink in self.sinks},
+        }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m hanabi.service",
+        description="Read Falco events once and fan them out to the Prometheus exporter and the HBT profiler.",
+    )
+    parser.add_argument("--sinks", default=DEFAULT_SINKS,
+                        help=f"comma separated sinks, some of {', '.join(SINKS)} (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=int(os.getenv("HANABI_METRICS_PORT", DEFAULT_METRICS_PORT)),
+                        help="port of the /metrics endpoint (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    mark_startup()
+    start_http_server(args.port)
+    print(f"Metrics endpoint: http://0.0.0.0:{args.port}/metrics", file=sys.stderr)
+
+    service = EventService(create_event_queue(), create_sinks(args.sinks))
+    try:
+        service.run()
+    except KeyboardInterrupt:
+        print("\nStopped by user", file=sys.stderr)
+    print(f"Service stats: {service.get_stats()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
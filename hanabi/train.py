@@ -0,0 +1,182 @@
+"""
+从历史Falco事件归档离线构建HBT基线
+
+用法：
+    python -m hanabi.train DIR [DIR_OR_FILE ...] [-o OUTPUT] [-w WORKERS]
+
+每个文件（可以是gzip/zstd压缩的）交给进程池中的一个工作进程，工作进程按container.id
+把事件分到各自的模型并建树，返回每个容器的部分HBT；主进程按文件路径顺序把同一容器的部分HBT
+合并（events_count相加），为每个容器输出一个模型文件，可直接用HBTModel.from_model加载
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import sys
+import time
+from multiprocessing import get_context
+from typing import Dict, Any, List, Optional, Tuple
+
+from .models.batch_matcher import MicroBatchMatcher
+from .models.embedding import is_backend_loading, warm_up
+from .models.event_parser import EventParser
+from .models.learning_state import LearningPhase
+from .models.registry import DEFAULT_KEY_FIELD, HBTRegistry, model_filename
+from .models.snapshot import read_snapshot
+from .models.tree_node import TreeNode
+from .models.tree_writer import write_model as write_tree_model
+
+DEFAULT_OUTPUT_DIR = "hbt-models"
+
+# 工作进程的配置，由_init_worker设置
+_worker_options: Dict[str, Any] = {}
+
+
+def find_event_files(paths: List[str]) -> List[str]:
+    """
+    展开目录，返回排序后的事件文件列表（跳过隐藏文件）
+
+    Args:
+        paths: 目录或文件路径
+
+    Returns:
+        list: 文件路径，按路径排序以保证合并顺序确定
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+                files.extend(os.path.join(dirpath, name) for name in filenames if not name.startswith("."))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def _init_worker(key_field: str):
+    # Ctrl-C由主进程处理
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_options.update(key_field=key_field)
+    warm_up()
+
+
+def train_file(path: str) -> Tuple[str, int, Dict[str, Dict[str, Any]]]:
+    """
+    工作进程中从一个文件构建每个容器的部分HBT
+
+    Args:
+        path: 事件文件路径
+
+    Returns:
+        tuple: (文件路径, 事件数, key -> get_model()的输出)
+    """
+    # 离线训练不赶时间，等语义模型加载完成，保证和在线建树使用相同的匹配层级
+    while is_backend_loading():
+        time.sleep(0.05)
+
+    # 离线训练只学习，不切换到检测阶段；换出的模型只用于本次训练，不加载或写入持久化快照
+    registry = HBTRegistry(key_field=_worker_options["key_field"], learning_options={"converge": False},
+                           snapshot_dir=None)
+    matcher = MicroBatchMatcher(registry)
+    count = 0
+    try:
+        for events in EventParser.iter_event_batches(path):
+            matcher.process_batch(events)
+            count += len(events)
+        partial = {key: model.get_model() for key, model in registry.models()}
+        for key, spill_path in registry.spilled.items():
+            partial[key] = read_snapshot(spill_path).get_model()
+    finally:
+        shutil.rmtree(registry.spill_dir, ignore_errors=True)
+    return path, count, partial
+
+
+def train(paths: List[str], output_dir: str = DEFAULT_OUTPUT_DIR, workers: Optional[int] = None,
+          key_field: str = DEFAULT_KEY_FIELD) -> Dict[str, TreeNode]:
+    """
+    并行构建并合并HBT基线，每个容器写出一个模型文件
+
+    每个工作进程各加载一份语义模型，后端由HANABI_EMBEDDING_BACKEND选择
+
+    Args:
+        paths: 事件文件或包含事件文件的目录
+        output_dir: 模型输出目录
+        workers: 工作进程数量，默认为CPU核心数
+        key_field: 用于区分模型的输出字段
+
+    Returns:
+        dict: key -> 合并后的HBT根节点
+    """
+    files = find_event_files(paths)
+    if not files:
+        print(f"No event files found in {', '.join(paths)}", file=sys.stderr)
+        return {}
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    print(f"Training on {len(files)} files with {workers} workers", file=sys.stderr)
+
+    start = time.monotonic()
+    merged: Dict[str, TreeNode] = {}
+    total = 0
+    context = get_context("spawn")
+    with context.Pool(workers, initializer=_init_worker, initargs=(key_field,)) as pool:
+        # imap按提交顺序返回结果，按路径顺序合并，结果与工作进程数量和调度无关
+        for done, (path, count, partial) in enumerate(pool.imap(train_file, files), 1):
+            for key, model in partial.items():
+                tree = TreeNode.from_dict(model["hbt_structure"])
+                if key in merged:
+                    merged[key].merge(tree)
+                else:
+                    merged[key] = tree
+            total += count
+            print(f"[{done}/{len(files)}] {path}: {count:,} events, {len(partial)} containers", file=sys.stderr)
+
+    os.makedirs(output_dir, exist_ok=True)
+    for key, root in merged.items():
+        write_model(output_dir, key, root)
+    elapsed = time.monotonic() - start
+    print(f"Built {len(merged)} models from {total:,} events in {elapsed:.1f}s "
+          f"({total / elapsed if elapsed else 0:,.0f} events/s) -> {output_dir}", file=sys.stderr)
+    return merged
+
+
+def write_model(output_dir: str, key: str, root: TreeNode) -> str:
+    """
+    把合并后的HBT写成get_model()格式的文件，加载后直接进入检测阶段
+
+    Args:
+        output_dir: 输出目录
+        key: 模型key
+        root: HBT根节点
+
+    Returns:
+        str: 模型文件路径
+    """
+    path = os.path.join(output_dir, model_filename(key, ".json"))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        write_tree_model(f, key, LearningPhase.DETECTING.value, root)
+    os.replace(tmp_path, path)
+    return path
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m hanabi.train",
+        description="Build HBT baselines offline from archived Falco JSON event files.",
+    )
+    parser.add_argument("paths", nargs="+", help="directories or files of Falco JSON events (gzip/zstd allowed)")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT_DIR, help="directory for the per-container models")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--key-field", default=DEFAULT_KEY_FIELD, help="output field that identifies a model")
+    parser.add_argument("--embedding-backend", default=None,
+                        help="embedding backend for the workers, e.g. hashing (default: $HANABI_EMBEDDING_BACKEND)")
+    args = parser.parse_args(argv)
+    if args.embedding_backend:
+        # 工作进程以spawn方式启动，导入时读取该环境变量
+        os.environ["HANABI_EMBEDDING_BACKEND"] = args.embedding_backend
+    train(args.paths, args.output, args.workers, args.key_field)
+
+
+if __name__ == "__main__":
+    main()
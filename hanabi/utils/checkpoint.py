@@ -0,0 +1,169 @@
+"""
+Ingest checkpoints: remember how far the consumer got so a restart can
+resume from there instead of only reading new events.
+"""
+
+import json
+import os
+import sys
+import time
+from threading import Lock
+
+from .parser import event_num, event_time_ns
+
+DEFAULT_CHECKPOINT_PATH = os.getenv("HANABI_CHECKPOINT_PATH")
+DEFAULT_CHECKPOINT_INTERVAL = 5.0
+
+
+def fsync_directory(path):
+    """
+    Flush a directory to disk so a rename into it survives a crash.
+
+    Platforms or filesystems that cannot open or sync a directory are
+    skipped silently.
+
+    Args:
+        path: Directory path ("" means the current directory)
+    """
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class Checkpoint:
+    """
+    High-water mark of the events the consumer has acknowledged.
+
+    Stores the largest ``evt.time`` (nanoseconds) and ``evt.num`` seen so
+    far and writes them to a JSON file at most every ``interval`` seconds,
+    atomically. On restart, an event is a duplicate if both its evt.num and
+    its evt.time are at or below the mark. evt.num alone is not enough
+    because it restarts from zero when Falco restarts, and evt.time alone is
+    not enough because many events share a timestamp.
+    """
+
+    def __init__(self, path, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        """
+        Load the checkpoint if the file exists.
+
+        Args:
+            path: Checkpoint file path
+            interval: Minimum seconds between writes
+        """
+        self.path = path
+        self.interval = interval
+        self.lock = Lock()
+        self.evt_time = 0
+        self.evt_num = 0
+        self.dirty = False
+        self.last_save = time.monotonic()
+        self.load()
+
+    @property
+    def exists(self):
+        """Whether there is a position to resume from."""
+        return self.evt_time > 0
+
+    def load(self):
+        """Read the checkpoint file (a missing or corrupt file starts from scratch)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.evt_time = int(state.get("evt_time", 0))
+            self.evt_num = int(state.get("evt_num", 0))
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            print(f"Ignoring unreadable checkpoint {self.path}: {e}", file=sys.stderr)
+
+    def advance(self, events):
+        """
+        Move the mark past a batch of events the consumer has finished.
+
+        Args:
+            events: List of Falco events
+        """
+        with self.lock:
+            mark = self.mark_of(events, (self.evt_time, self.evt_num))
+            if mark != (self.evt_time, self.evt_num):
+                self.evt_time, self.evt_num = mark
+                self.dirty = True
+            if self.dirty and time.monotonic() - self.last_save >= self.interval:
+                self._save()
+
+    def save(self):
+        """Write the checkpoint now if it changed."""
+        with self.lock:
+            if self.dirty:
+                self._save()
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"evt_time": self.evt_time, "evt_num": self.evt_num, "saved_at": time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        fsync_directory(os.path.dirname(self.path))
+        self.dirty = False
+        self.last_save = time.monotonic()
+
+    @staticmethod
+    def mark_of(events, mark=(0, 0)):
+        """
+        Extend an (evt_time, evt_num) mark with a batch of events.
+
+        Args:
+            events: List of Falco events
+            mark: Mark to extend
+
+        Returns:
+            tuple: (largest evt_time, largest evt_num)
+        """
+        mark_time, mark_num = mark
+        for event in events:
+            evt_time = event_time_ns(event)
+            if evt_time is not None and evt_time > mark_time:
+                mark_time = evt_time
+            num = event_num(event)
+            if num is not None and num > mark_num:
+                mark_num = num
+        return mark_time, mark_num
+
+    def mark(self):
+        """
+        Snapshot the current position for deduplication.
+
+        Returns:
+            tuple: (evt_time, evt_num)
+        """
+        with self.lock:
+            return self.evt_time, self.evt_num
+
+
+def is_duplicate(event, mark):
+    """
+    Check whether an event is at or below a (evt_time, evt_num) mark.
+
+    Events without evt.num or a time are never treated as duplicates.
+
+    Args:
+        event: Falco event
+        mark: Tuple returned by Checkpoint.mark()
+
+    Returns:
+        bool: True if the event was already handed out before the mark
+    """
+    mark_time, mark_num = mark
+    num = event_num(event)
+    if num is None or num > mark_num:
+        return False
+    evt_time = event_time_ns(event)
+    return evt_time is not None and evt_time <= mark_time
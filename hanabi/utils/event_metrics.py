@@ -0,0 +1,238 @@
+"""
+Prometheus metrics describing the Falco events themselves.
+
+``syscall_events_total`` counts events by a configurable set of labels and
+``syscall_last_event_timestamp_nanoseconds`` tracks the newest event per
+container. Both are shared by ``prometheus/exporter.py`` and the Prometheus
+sink of ``hanabi.service``; metrics are registered on the default
+prometheus_client registry when this module is imported.
+
+Label cardinality is bounded: each label keeps at most EXPORTER_LABEL_TOP_K
+values and folds the rest into ``other``. Values that stay idle are replaced
+by more frequent ones every window, and their series are removed.
+"""
+
+import logging
+import os
+import time
+
+from prometheus_client import Counter, Gauge
+
+from .metrics import StageTimer, observe_event_lag
+from .parser import event_time_ns
+
+# Available event labels: label name -> (taken from output_fields, Falco field, default when missing)
+LABEL_FIELDS = {
+    'rule': (False, 'rule', 'unknown'),
+    'priority': (False, 'priority', 'unknown'),
+    'container_name': (True, 'container.name', 'unknown'),
+    'image_repository': (True, 'container.image.repository', 'unknown'),
+    'process_name': (True, 'proc.name', 'unknown'),
+    # Kubernetes fields may be null
+    'k8s_namespace': (True, 'k8s.ns.name', 'none'),
+    'k8s_pod': (True, 'k8s.pod.name', 'none'),
+}
+
+# Labels of the event counter; EXPORTER_LABELS (comma separated) keeps only some of them
+EVENT_LABELS = [
+    label.strip() for label in os.getenv('EXPORTER_LABELS', ','.join(LABEL_FIELDS)).split(',') if label.strip()
+]
+for _label in EVENT_LABELS:
+    if _label not in LABEL_FIELDS:
+        raise ValueError(f"Unknown label in EXPORTER_LABELS: {_label!r} (expected some of {', '.join(LABEL_FIELDS)})")
+
+# Maximum number of values kept per label; the rest are folded into OTHER_VALUE
+LABEL_TOP_K = int(os.getenv('EXPORTER_LABEL_TOP_K', '100'))
+# Period (seconds) for counting value frequencies and rebalancing the kept values
+LABEL_WINDOW_SECONDS = float(os.getenv('EXPORTER_LABEL_WINDOW_SECONDS', '60'))
+# Number of consecutive windows without events after which a kept value may be replaced
+LABEL_IDLE_WINDOWS = int(os.getenv('EXPORTER_LABEL_IDLE_WINDOWS', '5'))
+OTHER_VALUE = 'other'
+
+SYSCALL_EVENTS = Counter('syscall_events_total', 'Total number of syscall events observed.', EVENT_LABELS)
+
+LAST_EVENT_TIMESTAMP = Gauge(
+    'syscall_last_event_timestamp_nanoseconds',
+    'Timestamp (nanoseconds) of the last processed syscall event.',
+    ['container_name']
+)
+
+
+class LabelLimiter:
+    """
+    Admission of the values of one label: at most top_k values are kept,
+    the others map to OTHER_VALUE.
+
+    New values are kept while there is room. Once the set is full, every
+    window the most frequent folded values replace kept values that had no
+    events for idle_windows consecutive windows (e.g. short-lived pods that
+    have exited).
+    """
+
+    def __init__(self, top_k=LABEL_TOP_K, idle_windows=LABEL_IDLE_WINDOWS):
+        self.top_k = top_k
+        self.idle_windows = idle_windows
+        # kept value -> consecutive windows without events
+        self.admitted = {}
+
+    def map(self, value):
+        """Return the label value used in the metric for a raw value."""
+        if value in self.admitted:
+            return value
+        if len(self.admitted) < self.top_k:
+            self.admitted[value] = 0
+            return value
+        return OTHER_VALUE
+
+    def rebalance(self, counts):
+        """
+        Adjust the kept values from the event counts of the last window.
+
+        Args:
+            counts: Raw value -> event count (including values folded into OTHER_VALUE)
+
+        Returns:
+            tuple: (set of replaced values, set of newly kept values)
+        """
+        for value in self.admitted:
+            self.admitted[value] = 0 if counts.get(value) else self.admitted[value] + 1
+        candidates = [(count, value) for value, count in counts.items() if value not in self.admitted]
+        if not candidates:
+            return set(), set()
+        candidates.sort(reverse=True)
+        idle = sorted(
+            (value for value, windows in self.admitted.items() if windows >= self.idle_windows),
+            key=self.admitted.get, reverse=True,
+        )
+        evicted, admitted = set(), set()
+        for _, value in candidates:
+            if len(self.admitted) >= self.top_k:
+                if not idle:
+                    break
+                victim = idle.pop(0)
+                del self.admitted[victim]
+                evicted.add(victim)
+            self.admitted[value] = 0
+            admitted.add(value)
+        return evicted, admitted
+
+
+class BoundChildren:
+    """
+    Cache of bound metric children keyed by the raw label value tuple, with
+    the number of values per label bounded.
+
+    A cache hit costs one dict lookup per event instead of hashing the label
+    tuple again in labels(). The cache and the series are cleaned up every
+    window in maintain(), so memory and scrape size do not grow with the
+    number of values ever seen.
+    """
+
+    def __init__(self, metric, label_count, top_k=LABEL_TOP_K, idle_windows=LABEL_IDLE_WINDOWS):
+        self.metric = metric
+        self.limiters = [LabelLimiter(top_k, idle_windows) for _ in range(label_count)]
+        # raw value tuple -> [metric child, events this window, label value tuple actually used]
+        self.entries = {}
+        # series created so far (label value tuples actually used)
+        self.series = set()
+
+    def get(self, raw):
+        """
+        Get the metric child for a raw label value tuple.
+
+        Args:
+            raw: Raw label value tuple
+
+        Returns:
+            The metric child (result of Counter/Gauge labels())
+        """
+        entry = self.entries.get(raw)
+        if entry is None:
+            values = tuple(limiter.map(value) for limiter, value in zip(self.limiters, raw))
+            entry = self.entries[raw] = [self.metric.labels(*values), 0, values]
+            self.series.add(values)
+        entry[1] += 1
+        return entry[0]
+
+    def maintain(self):
+        """Rebalance each label from the last window, remove replaced series and clean the cache."""
+        changes = []
+        for index, limiter in enumerate(self.limiters):
+            counts = {}
+            for raw, entry in self.entries.items():
+                counts[raw[index]] = counts.get(raw[index], 0) + entry[1]
+            changes.append(limiter.rebalance(counts))
+
+        for values in list(self.series):
+            if any(values[index] in evicted for index, (evicted, _) in enumerate(changes)):
+                self.series.discard(values)
+                self.metric.remove(*values)
+
+        for raw, entry in list(self.entries.items()):
+            # Rebind entries that were idle this window, use a replaced value, or
+            # were folded before one of their values got admitted
+            if not entry[1] or any(
+                entry[2][index] in evicted or raw[index] in admitted
+                for index, (evicted, admitted) in enumerate(changes)
+            ):
+                del self.entries[raw]
+            else:
+                entry[1] = 0
+
+
+SYSCALL_EVENT_CHILDREN = BoundChildren(SYSCALL_EVENTS, len(EVENT_LABELS))
+LAST_EVENT_TIMESTAMP_CHILDREN = BoundChildren(LAST_EVENT_TIMESTAMP, 1)
+_last_maintain = time.monotonic()
+EXPORT_TIMER = StageTimer('export')
+
+# How each event label value is extracted
+_LABEL_SPECS = [LABEL_FIELDS[label] for label in EVENT_LABELS]
+
+
+def process_event(event_data):
+    """Count one Falco event in syscall_events_total."""
+    try:
+        # Missing fields fall back to the label's default instead of failing
+        output_fields = event_data.get('output_fields') or {}
+        raw = tuple(
+            (output_fields if from_fields else event_data).get(field) or default
+            for from_fields, field, default in _LABEL_SPECS
+        )
+        SYSCALL_EVENT_CHILDREN.get(raw).inc()
+
+        # Per-event logging only at DEBUG level, the message is not formatted otherwise
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug(f"Processed event: {dict(zip(EVENT_LABELS, raw))}")
+
+    except Exception as e:
+        logging.error(f"Error processing event: {e}\nData: {event_data}")
+
+
+def update_last_event_timestamps(events):
+    """Update the newest event timestamp per container, parsing one time per container per batch."""
+    latest = {}
+    for event_data in events:
+        output_fields = event_data.get('output_fields') or {}
+        latest[output_fields.get('container.name') or 'unknown'] = event_data
+    for container_name, event_data in latest.items():
+        # evt.time.iso8601 is integer nanoseconds or an ISO string depending on the Falco
+        # version; the top-level time field is used when it is missing
+        event_timestamp = event_time_ns(event_data)
+        if event_timestamp is not None:
+            LAST_EVENT_TIMESTAMP_CHILDREN.get((container_name,)).set(event_timestamp)
+
+
+def process_events(events):
+    """Count a batch of events and rebalance the label values every window."""
+    global _last_maintain
+    start = EXPORT_TIMER.start()
+    for event_data in events:
+        process_event(event_data)
+    update_last_event_timestamps(events)
+    EXPORT_TIMER.stop(start, len(events))
+    observe_event_lag('exporter', events)
+    now = time.monotonic()
+    if now - _last_maintain >= LABEL_WINDOW_SECONDS:
+        _last_maintain = now
+        SYSCALL_EVENT_CHILDREN.maintain()
+        LAST_EVENT_TIMESTAMP_CHILDREN.maintain()
@@ -0,0 +1,223 @@
+"""
+Prometheus metrics describing the hanabi pipeline itself.
+
+Metrics are registered on the default prometheus_client registry, so they are
+served by whichever process calls ``start_http_server``.
+
+Stage timers, event lag and embedding inference timing are observed once per
+batch and can be switched off with ``HANABI_STAGE_TIMING=0``. Queue depth
+gauges are computed at scrape time and cost nothing per event.
+"""
+
+import os
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .parser import event_time_ns
+
+STAGE_TIMING = os.getenv('HANABI_STAGE_TIMING', '1') != '0'
+
+STARTUP_TO_FIRST_EVENT_SECONDS = Gauge(
+    'hanabi_startup_to_first_event_seconds',
+    'Seconds from process startup until the first event was added to an HBT model.'
+)
+EMBEDDING_WARMUP_SECONDS = Gauge(
+    'hanabi_embedding_warmup_seconds',
+    'Seconds the embedding backend took to load on the warm-up thread.'
+)
+QUEUE_DROPPED_EVENTS = Counter(
+    'hanabi_queue_dropped_events_total',
+    'Events dropped by the ingest queue overflow policy.',
+    ['rule', 'priority', 'policy']
+)
+SINK_DROPPED_EVENTS = Counter(
+    'hanabi_sink_dropped_events_total',
+    'Events dropped by the overflow policy of a service sink buffer.',
+    ['sink', 'rule', 'priority', 'policy']
+)
+ANOMALIES = Counter(
+    'hanabi_anomalies_total',
+    'Events that did not match their HBT model in detection, by branch and tree level.',
+    ['branch', 'level']
+)
+ANOMALIES_SUPPRESSED = Counter(
+    'hanabi_anomalies_suppressed_total',
+    'Anomaly records not published: duplicate, rate_limited, or dropped (alert queue full).',
+    ['reason']
+)
+LEARNING_TRANSITIONS = Counter(
+    'hanabi_learning_transitions_total',
+    'HBT models entering a learning phase (learning, detecting or relearning).',
+    ['phase']
+)
+STAGE_DURATION_SECONDS = Histogram(
+    'hanabi_stage_duration_seconds',
+    'Time spent on one batch in each pipeline stage.',
+    ['stage'],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+STAGE_EVENTS = Counter(
+    'hanabi_stage_events_total',
+    'Events that went through each pipeline stage (rate() gives events per second).',
+    ['stage']
+)
+EVENT_LAG_SECONDS = Histogram(
+    'hanabi_event_lag_seconds',
+    'Delay from the Falco event time until a consumer finished processing the event '
+    '(sampled once per batch, oldest event).',
+    ['consumer'],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+QUEUE_DEPTH = Gauge(
+    'hanabi_queue_depth',
+    'Events waiting in a pipeline queue.',
+    ['queue']
+)
+EMBEDDING_INFERENCE_SECONDS = Histogram(
+    'hanabi_embedding_inference_seconds',
+    'Time per embedding model call on texts missing from the cache.',
+    ['backend'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+EMBEDDING_TEXTS_ENCODED = Counter(
+    'hanabi_embedding_texts_encoded_total',
+    'Texts run through the embedding model.',
+    ['backend']
+)
+
+_startup_time = time.monotonic()
+_first_event_latency = None
+
+
+def mark_startup():
+    """Reset the startup reference point (call at the top of ``main``)."""
+    global _startup_time, _first_event_latency
+    _startup_time = time.monotonic()
+    _first_event_latency = None
+
+
+def mark_first_event():
+    """Record the startup-to-first-event latency; later calls are no-ops."""
+    global _first_event_latency
+    if _first_event_latency is None:
+        _first_event_latency = time.monotonic() - _startup_time
+        STARTUP_TO_FIRST_EVENT_SECONDS.set(_first_event_latency)
+
+
+def set_embedding_warmup_seconds(seconds):
+    """Record how long the embedding backend took to load."""
+    EMBEDDING_WARMUP_SECONDS.set(seconds)
+
+
+def record_dropped_events(rule, priority, policy, count=1):
+    """Count events dropped by the ingest queue."""
+    QUEUE_DROPPED_EVENTS.labels(rule=rule, priority=priority, policy=policy).inc(count)
+
+
+def record_sink_dropped_events(sink, rule, priority, policy, count=1):
+    """Count events dropped by a service sink buffer."""
+    SINK_DROPPED_EVENTS.labels(sink=sink, rule=rule, priority=priority, policy=policy).inc(count)
+
+
+def record_anomaly(branch, level):
+    """Count one detected anomaly."""
+    ANOMALIES.labels(branch=branch, level=level).inc()
+
+
+def record_anomalies_suppressed(reason, count=1):
+    """Count anomaly records that were not published."""
+    ANOMALIES_SUPPRESSED.labels(reason=reason).inc(count)
+
+
+def record_learning_transition(phase):
+    """Count an HBT model entering ``phase``."""
+    LEARNING_TRANSITIONS.labels(phase=phase).inc()
+
+
+def set_stage_timing(enabled):
+    """Turn the per-batch stage, lag and inference timers on or off at runtime."""
+    global STAGE_TIMING
+    STAGE_TIMING = bool(enabled)
+
+
+def timer_start():
+    """Return perf_counter() for a timed section, or 0.0 if timing is disabled."""
+    return time.perf_counter() if STAGE_TIMING else 0.0
+
+
+class StageTimer:
+    """
+    Times batches through one pipeline stage.
+
+    The label children are bound once, so a batch costs two perf_counter()
+    calls, one histogram observation and one counter increment::
+
+        start = DECODE_TIMER.start()
+        ...
+        DECODE_TIMER.stop(start, len(events))
+
+    A stage that runs many times inside another one (such as the semantic
+    tier inside build) accumulates with add() and is recorded per batch with
+    observe(take(), count), so the outer stage can subtract it.
+    """
+
+    __slots__ = ("duration", "events", "pending")
+
+    def __init__(self, stage):
+        self.duration = STAGE_DURATION_SECONDS.labels(stage=stage)
+        self.events = STAGE_EVENTS.labels(stage=stage)
+        self.pending = 0.0
+
+    def start(self):
+        """Return the start time, or 0.0 if timing is disabled."""
+        return timer_start()
+
+    def stop(self, start, count):
+        """Record a batch of `count` events that started at `start`."""
+        if STAGE_TIMING and start:
+            self.observe(time.perf_counter() - start, count)
+
+    def observe(self, seconds, count):
+        """Record a batch of `count` events that took `seconds` in this stage."""
+        if STAGE_TIMING:
+            self.duration.observe(seconds)
+            self.events.inc(count)
+
+    def add(self, start):
+        """Accumulate the time since `start` of one section run within a batch."""
+        if STAGE_TIMING and start:
+            self.pending += time.perf_counter() - start
+
+    def take(self):
+        """Return and reset the time accumulated by add()."""
+        pending, self.pending = self.pending, 0.0
+        return pending
+
+
+def observe_event_lag(consumer, events):
+    """Record the lag of the oldest event in a processed batch."""
+    if not STAGE_TIMING or not events or not isinstance(events[0], dict):
+        return
+    evt_time = event_time_ns(events[0])
+    if evt_time is not None:
+        EVENT_LAG_SECONDS.labels(consumer=consumer).observe(max(time.time_ns() - evt_time, 0) / 1e9)
+
+
+def track_queue_depth(queue, size_function):
+    """Report a queue's depth at scrape time."""
+    QUEUE_DEPTH.labels(queue=queue).set_function(size_function)
+
+
+def record_embedding_inference(backend, start, count):
+    """Record one embedding model call on `count` texts that started at `start`."""
+    if STAGE_TIMING and start:
+        EMBEDDING_INFERENCE_SECONDS.labels(backend=backend).observe(time.perf_counter() - start)
+        EMBEDDING_TEXTS_ENCODED.labels(backend=backend).inc(count)
+
+
+def get_startup_stats():
+    """Get startup latency figures (``None`` for values not measured yet)."""
+    return {
+        "startup_to_first_event_seconds": _first_event_latency,
+    }
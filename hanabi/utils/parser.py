@@ -0,0 +1,82 @@
+"""
+Helpers for reading common fields out of Falco JSON events.
+"""
+
+from datetime import datetime
+
+
+def _output_fields(event):
+    return event.get("output_fields") or {}
+
+
+def parse_iso8601_ns(text):
+    """
+    Convert an RFC 3339 timestamp such as Falco's ``time`` field to Unix nanoseconds.
+
+    ``datetime.fromisoformat`` stops at microseconds, so the fraction is
+    parsed separately to keep all nine digits.
+
+    Args:
+        text: Timestamp like "2025-11-02T14:22:39.178045148Z"
+
+    Returns:
+        int: Nanoseconds since the epoch
+    """
+    text = text.strip()
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    fraction_ns = 0
+    if "." in text:
+        base, rest = text.split(".", 1)
+        digits = len(rest) - len(rest.lstrip("0123456789"))
+        fraction, offset = rest[:digits], rest[digits:]
+        fraction_ns = int(fraction[:9].ljust(9, "0")) if fraction else 0
+        text = base + offset
+    seconds = int(datetime.fromisoformat(text).timestamp())
+    return seconds * 1_000_000_000 + fraction_ns
+
+
+def event_time_ns(event):
+    """
+    Get the event time in Unix nanoseconds.
+
+    Uses ``evt.time`` / ``evt.time.iso8601`` from output_fields (an integer,
+    or an ISO string depending on the Falco version), and falls back to the
+    top-level ``time`` string.
+
+    Args:
+        event: Falco JSON event
+
+    Returns:
+        int: Nanoseconds since the epoch, or None if the event has no usable time
+    """
+    fields = _output_fields(event)
+    for value in (fields.get("evt.time"), fields.get("evt.time.iso8601"), event.get("time")):
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str) and value:
+            if value.isdigit():
+                return int(value)
+            try:
+                return parse_iso8601_ns(value)
+            except ValueError:
+                continue
+    return None
+
+
+def event_num(event):
+    """
+    Get Falco's per-instance event sequence number (``evt.num``).
+
+    Args:
+        event: Falco JSON event
+
+    Returns:
+        int: The sequence number, or None if missing
+    """
+    value = _output_fields(event).get("evt.num")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
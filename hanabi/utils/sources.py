@@ -0,0 +1,321 @@
+"""
+Falco event sources besides the Docker log stream.
+
+Each source is an EventLogQueue, so consumers use the same get_batch() /
+iter_batches() API whichever way Falco delivers its JSON output:
+
+- FileTailQueue follows Falco's ``file_output`` file
+- HttpReceiverQueue accepts POSTs from Falco's ``http_output``
+- UnixSocketQueue reads newline-delimited JSON written to a Unix domain
+  socket (e.g. ``program_output`` piping into ``socat - UNIX-CONNECT:...``)
+"""
+
+import os
+import selectors
+import socket
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+
+from .checkpoint import DEFAULT_CHECKPOINT_PATH
+from .queue import (
+    DEFAULT_OVERFLOW_POLICY,
+    DEFAULT_SAMPLE_RATE,
+    DockerLogQueue,
+    EventLogQueue,
+    LineFramer,
+    READ_TIMER,
+)
+
+READ_SIZE = 65536
+DEFAULT_HTTP_HOST = "127.0.0.1"
+DEFAULT_HTTP_PORT = 2801
+
+
+class FileTailQueue(EventLogQueue):
+    """
+    Follows a Falco ``file_output`` file.
+
+    Polls the open file with plain reads from the last offset and stats the
+    path between reads. If the path now refers to a different file (rotated)
+    or the file shrank (truncated), the rest of the old file is drained and
+    reading restarts from the beginning of the new one. Like ``tail -F``, a
+    copytruncate that is refilled past the read offset between two polls is
+    not noticed; prefer rename-based rotation.
+
+    With a checkpoint that holds a position, reading starts at the beginning
+    of the file and the events already acknowledged are skipped.
+    """
+
+    source_name = "file tail"
+
+    def __init__(self, path, from_end=True, poll_interval=0.2, max_queue_size=10000,
+                 overflow_policy=DEFAULT_OVERFLOW_POLICY, sample_rate=DEFAULT_SAMPLE_RATE, checkpoint=None):
+        """
+        Initialize the file tail.
+
+        Args:
+            path: Path of the file Falco writes to
+            from_end: Start at the current end of the file (only new events) instead of the beginning
+            poll_interval: Seconds to sleep when no new data is available
+            max_queue_size: Maximum number of items in the queue (default: 10000)
+            overflow_policy: What to do when the queue is full, one of OVERFLOW_POLICIES
+            sample_rate: For the "sample" policy, keep 1 in sample_rate overflowing events per rule
+            checkpoint: Checkpoint, or a checkpoint file path, to resume from (overrides from_end)
+        """
+        super().__init__(max_queue_size, overflow_policy, sample_rate, checkpoint)
+        self.path = path
+        self.from_end = from_end
+        self.poll_interval = poll_interval
+        self.file = None
+        self.inode = None
+        self.rotations = 0
+
+    def _open(self):
+        # The file may not exist yet if Falco has not written its first alert
+        if os.path.exists(self.path):
+            self._reopen(seek_end=self.from_end and not self.resuming)
+        print(f"✅ Tailing '{self.path}'", file=sys.stderr)
+
+    def _reopen(self, seek_end=False):
+        if self.file is not None:
+            self.file.close()
+        self.file = open(self.path, "rb", buffering=0)
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        if seek_end:
+            self.file.seek(0, os.SEEK_END)
+
+    def _rotated(self):
+        """Check whether the path was rotated or the file truncated."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != self.inode or stat.st_size < self.file.tell()
+
+    def _run(self):
+        framer = LineFramer()
+        while not self.stop_event.is_set():
+            if self.file is None:
+                if os.path.exists(self.path):
+                    self._reopen()
+                else:
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+
+            start = READ_TIMER.start()
+            chunk = self.file.read(READ_SIZE)
+            if chunk:
+                lines = framer.feed(chunk)
+                READ_TIMER.stop(start, len(lines))
+                self._publish(lines)
+                continue
+
+            if self._rotated():
+                self._publish(framer.flush())
+                self._reopen()
+                self.rotations += 1
+            else:
+                self.stop_event.wait(self.poll_interval)
+        self._publish(framer.flush())
+
+    def _close(self):
+        if self.thread:
+            self.thread.join(timeout=2)
+        if self.file is not None:
+            self.file.close()
+
+    def get_stats(self):
+        """Get statistics about the tail, including the number of rotations followed."""
+        return {**super().get_stats(), "rotations": self.rotations}
+
+
+class _FalcoHTTPHandler(BaseHTTPRequestHandler):
+    """Accepts Falco ``http_output`` POSTs (one JSON object, or NDJSON) on any path."""
+
+    # Keep-alive, so a sender does not reconnect for every event. Each
+    # connection has its own thread, so an idle one does not hold up the
+    # others; idle connections are closed after `timeout` seconds
+    protocol_version = "HTTP/1.1"
+    timeout = 2
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        start = READ_TIMER.start()
+        body = self.rfile.read(length)
+        framer = LineFramer()
+        lines = framer.feed(body) + framer.flush()
+        READ_TIMER.stop(start, len(lines))
+        source = self.server.source
+        with source.publish_lock:
+            source._publish(lines)
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        # One access log line per event would swamp stderr
+        pass
+
+
+class HttpReceiverQueue(EventLogQueue):
+    """
+    Local HTTP endpoint for Falco's ``http_output``.
+
+    Point ``http_output.url`` at ``http://<host>:<port>/``. The body of each
+    POST may hold one JSON event or several newline-delimited ones.
+    Concurrent senders are served on their own threads.
+    """
+
+    source_name = "HTTP receiver"
+
+    def __init__(self, host=DEFAULT_HTTP_HOST, port=DEFAULT_HTTP_PORT, max_queue_size=10000,
+                 overflow_policy=DEFAULT_OVERFLOW_POLICY, sample_rate=DEFAULT_SAMPLE_RATE):
+        """
+        Initialize the HTTP receiver.
+
+        Args:
+            host: Address to bind
+            port: Port to bind (0 picks a free port, see server_address after start())
+            max_queue_size: Maximum number of items in the queue (default: 10000)
+            overflow_policy: What to do when the queue is full, one of OVERFLOW_POLICIES
+            sample_rate: For the "sample" policy, keep 1 in sample_rate overflowing events per rule
+        """
+        super().__init__(max_queue_size, overflow_policy, sample_rate)
+        self.host = host
+        self.port = port
+        self.server = None
+        # Handler threads publish one request at a time
+        self.publish_lock = Lock()
+
+    @property
+    def server_address(self):
+        return self.server.server_address if self.server else (self.host, self.port)
+
+    def _open(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), _FalcoHTTPHandler)
+        self.server.daemon_threads = True
+        self.server.source = self
+        print(f"✅ Listening for Falco http_output on http://{self.server_address[0]}:{self.server_address[1]}/",
+              file=sys.stderr)
+
+    def _run(self):
+        self.server.serve_forever(poll_interval=0.5)
+
+    def _close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class UnixSocketQueue(EventLogQueue):
+    """
+    Reads newline-delimited JSON from writers connected to a Unix domain socket.
+
+    Any number of writers may be connected at once; each connection has its
+    own line framer, and all of them are served from one thread.
+    """
+
+    source_name = "Unix socket"
+
+    def __init__(self, path, max_queue_size=10000, overflow_policy=DEFAULT_OVERFLOW_POLICY,
+                 sample_rate=DEFAULT_SAMPLE_RATE):
+        """
+        Initialize the socket reader.
+
+        Args:
+            path: Filesystem path of the socket (replaced if it already exists)
+            max_queue_size: Maximum number of items in the queue (default: 10000)
+            overflow_policy: What to do when the queue is full, one of OVERFLOW_POLICIES
+            sample_rate: For the "sample" policy, keep 1 in sample_rate overflowing events per rule
+        """
+        super().__init__(max_queue_size, overflow_policy, sample_rate)
+        self.path = path
+        self.listener = None
+        self.selector = None
+
+    def _open(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        print(f"✅ Listening on Unix socket '{self.path}'", file=sys.stderr)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            for key, _ in self.selector.select(timeout=0.5):
+                if key.data is None:
+                    conn, _ = self.listener.accept()
+                    conn.setblocking(False)
+                    self.selector.register(conn, selectors.EVENT_READ, LineFramer())
+                    continue
+                conn, framer = key.fileobj, key.data
+                start = READ_TIMER.start()
+                try:
+                    chunk = conn.recv(READ_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    chunk = b""
+                if chunk:
+                    lines = framer.feed(chunk)
+                    READ_TIMER.stop(start, len(lines))
+                    self._publish(lines)
+                else:
+                    self._publish(framer.flush())
+                    self.selector.unregister(conn)
+                    conn.close()
+
+    def _close(self):
+        if self.thread:
+            self.thread.join(timeout=2)
+        if self.selector is not None:
+            for key in list(self.selector.get_map().values()):
+                key.fileobj.close()
+            self.selector.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# Sources that can replay events from before a restart
+RESUMABLE_SOURCES = {"docker", "file"}
+
+# source -> (queue class, name of the argument that `target` fills in)
+SOURCES = {
+    "docker": (DockerLogQueue, "container_name"),
+    "file": (FileTailQueue, "path"),
+    "http": (HttpReceiverQueue, "port"),
+    "unix": (UnixSocketQueue, "path"),
+}
+
+
+def create_event_queue(source=None, target=None, **options):
+    """
+    Create an event queue for the configured source.
+
+    Args:
+        source: One of SOURCES (default: $HANABI_EVENT_SOURCE or "docker")
+        target: Container name, file path, HTTP port or socket path, depending on
+            the source (default: $HANABI_EVENT_SOURCE_TARGET, else the queue's own default)
+        **options: Other keyword arguments for the queue class. For the docker and
+            file sources, checkpoint defaults to $HANABI_CHECKPOINT_PATH
+
+    Returns:
+        EventLogQueue: The (not yet started) queue
+    """
+    source = source or os.getenv("HANABI_EVENT_SOURCE", "docker")
+    target = target or os.getenv("HANABI_EVENT_SOURCE_TARGET")
+    if source not in SOURCES:
+        raise ValueError(f"Unknown event source: {source!r} (expected one of {', '.join(SOURCES)})")
+    queue_class, target_arg = SOURCES[source]
+    if target is None and target_arg == "path":
+        raise ValueError(f"The {source} source needs a target path (set HANABI_EVENT_SOURCE_TARGET)")
+    if target is not None:
+        options[target_arg] = int(target) if target_arg == "port" else target
+    if source in RESUMABLE_SOURCES and DEFAULT_CHECKPOINT_PATH:
+        options.setdefault("checkpoint", DEFAULT_CHECKPOINT_PATH)
+    return queue_class(**options)
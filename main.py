@@ -1,97 +1,174 @@
-from hanabi.utils.queue import DockerLogQueue
-from hanabi.models.hbt import HBTModel
-from hanabi.models.event_parser import EventParser
+from hanabi.utils.sources import create_event_queue
+from hanabi.models.registry import HBTRegistry
+from hanabi.models.batch_matcher import MicroBatchMatcher
+from hanabi.models.pipeline import ShardedPipeline
 from hanabi.models.tree_node import TreeNode
+from hanabi.models.tree_writer import walk
+from hanabi.models.anomaly import get_anomaly_sink
+from hanabi.models.child_index import get_match_report
+from hanabi.models.embedding import get_warmup_seconds, warm_up
+from hanabi.utils.metrics import get_startup_stats, mark_startup, set_embedding_warmup_seconds
+from prometheus_client import start_http_server
 from rich.tree import Tree
 from rich import print as rprint
+from typing import Optional
 import json
+import os
+import sys
+import time
+
+# 打印模型时的剪枝：最大深度和节点的最少事件数
+PRINT_MAX_DEPTH = int(os.getenv("HANABI_PRINT_MAX_DEPTH", "0")) or None
+PRINT_MIN_EVENTS = int(os.getenv("HANABI_PRINT_MIN_EVENTS", "0"))
+
+
+def print_tree(node: TreeNode, max_depth: Optional[int] = PRINT_MAX_DEPTH,
+               min_events: int = PRINT_MIN_EVENTS) -> Tree:
+    """将TreeNode（或ColumnarNode）转换为Rich树形结构进行可视化输出"""
+    # 按先序遍历，branches[d]是深度d上最近的节点，新节点挂在上一层的最近节点下
+    branches = []
+    for _, _, depth, child in walk(node, max_depth, min_events):
+        if depth == 0:
+            node_text = f"[bold blue]{child.name}[/bold blue] ({child.node_type})"
+        else:
+            node_text = f"[blue]{child.name}[/blue] ({child.node_type})"
+        if child.events_count > 0:
+            node_text += f" [green]({child.events_count} events)[/green]"
+        del branches[depth:]
+        branches.append(Tree(node_text) if depth == 0 else branches[-1].add(node_text))
+    return branches[0]
+
+
+def print_models(models):
+    """打印模型快照（key -> get_model()的输出）"""
+    for container_id, model_dict in models.items():
+        print(f"\n===== {container_id} =====")
+        # 打印最终模型结构
+        print("Final HBT model (JSON format):")
+        print(json.dumps(model_dict, ensure_ascii=False, default=str))
+
+        # 以树形结构打印模型
+        print("\nFinal HBT model (Tree format):")
+        rprint(print_tree(TreeNode.from_dict(model_dict["hbt_structure"])))
+
+
+def print_resident_models(registry):
+    """打印内存中的模型：JSON边遍历边写到stdout，树形结构直接从模型的树生成，不经过get_model()的字典"""
+    for container_id, hbt_model in registry.models():
+        print(f"\n===== {container_id} =====")
+        print("Final HBT model (JSON format):")
+        hbt_model.write_model(sys.stdout, max_depth=PRINT_MAX_DEPTH, min_events=PRINT_MIN_EVENTS)
+        print()
+
+        print("\nFinal HBT model (Tree format):")
+        rprint(print_tree(hbt_model.hbt_builder.root))
+
+
+def print_match_report(report):
+    """打印各匹配层级解决的查找次数"""
+    print("\nMatch tier report:")
+    for tier, result in report.items():
+        print(f"  {tier:<10} {result['lookups']:>10} ({result['ratio']:.1%})")
+
+
+def acknowledge_pipeline(pipeline, log_queue, processed: bool):
+    """
+    工作进程处理完已发送的事件后向事件队列确认
+
+    有批次处理失败后不再确认，检查点停在失败之前，重启后从那里重新读取
+    """
+    if processed:
+        log_queue.ack()
+    elif pipeline.failed_batches:
+        print(f"⚠️  {pipeline.failed_batches} batches failed in the workers, checkpoint no longer advances",
+              file=sys.stderr)
+
+
+def run_pipeline(log_queue, workers):
+    """
+    多进程模式：按container.id把事件分片到workers个工作进程
+
+    工作进程异步处理事件，有检查点时每隔一个保存间隔等待已发送的事件处理完，再向事件队列确认
+    """
+    pipeline = ShardedPipeline(workers=workers)
+    pipeline.start()
+    last_ack = time.monotonic()
+    models = None
+    try:
+        cnt = 0
+        for batch in log_queue.iter_batches(max_items=1024):
+            cnt += len(batch)
+            print("log:", cnt)
+            pipeline.submit_batch(batch)
+            if log_queue.checkpoint is not None and not pipeline.failed_batches and \
+                    time.monotonic() - last_ack >= log_queue.checkpoint.interval:
+                acknowledge_pipeline(pipeline, log_queue, pipeline.wait_processed())
+                last_ack = time.monotonic()
+    except KeyboardInterrupt:
+        print("\n⏹️  Stopped by user")
+        models = pipeline.snapshot()
+    finally:
+        # stop()在工作进程处理完已发送的事件后返回每个进程的最终统计
+        final_stats = pipeline.stop()
+        acknowledge_pipeline(pipeline, log_queue,
+                             len(final_stats) == pipeline.workers and not pipeline.failed_batches)
+    if models is not None:
+        stats = ShardedPipeline.aggregate(final_stats)
+        match_report = stats.pop("match_report")
+        print(f"Pipeline stats: {stats}")
+        print_models(models)
+        print_match_report(match_report)
 
-def print_tree(node: TreeNode, tree: Tree = None, level: int = 0) -> Tree:
-    """将TreeNode转换为Rich树形结构进行可视化输出"""
-    if tree is None:
-        # 创建根节点
-        root_text = f"[bold blue]{node.name}[/bold blue] ({node.node_type})"
-        if node.events_count > 0:
-            root_text += f" [green]({node.events_count} events)[/green]"
-        tree = Tree(root_text)
-        # 递归处理子节点
-        for child in node.children.values():
-            print_tree(child, tree, level + 1)
-    else:
-        # 创建当前节点文本
-        node_text = f"[blue]{node.name}[/blue] ({node.node_type})"
-        if node.events_count > 0:
-            node_text += f" [green]({node.events_count} events)[/green]"
-        
-        # 添加节点到树
-        branch = tree.add(node_text)
-        
-        # 递归处理子节点
-        for child in node.children.values():
-            print_tree(child, branch, level + 1)
-    
-    return tree
 
 def main():
-    log_queue = DockerLogQueue(container_name="falco")
+    mark_startup()
+
+    # 设置HANABI_METRICS_PORT后在该端口提供流水线自身的Prometheus指标（各阶段耗时、延迟、队列深度等）
+    metrics_port = os.getenv("HANABI_METRICS_PORT")
+    if metrics_port:
+        start_http_server(int(metrics_port))
+
+    # 事件来源由HANABI_EVENT_SOURCE选择，默认读取falco容器的Docker日志
+    log_queue = create_event_queue()
     log_queue.start()
 
-    print("before HBTModel")
-    # 创建HBT模型实例
-    hbt_model = HBTModel("falco_container")
-    print("after HBTModel")
-    print("before EventParser")
-    # 初始化事件解析器
-    event_parser = EventParser()
-    print("after EventParser")
+    # HANABI_WORKERS大于0时使用多进程流水线，每个工作进程各自加载语义模型
+    workers = int(os.getenv("HANABI_WORKERS", "0"))
+    if workers > 0:
+        try:
+            run_pipeline(log_queue, workers)
+        finally:
+            log_queue.stop()
+        return
+
+    # 在后台线程加载语义模型，加载完成前事件只走精确/词法匹配
+    warm_up(on_ready=set_embedding_warmup_seconds)
+
+    # 按container.id为每个容器创建独立的HBT模型
+    registry = HBTRegistry()
+    # 微批语义匹配阶段：批量预计算语义向量后再把事件加入HBT模型
+    matcher = MicroBatchMatcher(registry)
+    matcher.start()
     
     try:
         cnt = 0
-        while True:
-            json_obj = log_queue.get(timeout=1)
-            if json_obj:
-                cnt += 1
-                print("log:", cnt)
-                # 解析事件并添加到HBT模型
-                output_fields = event_parser.extract_output_fields(json_obj)
-                category = event_parser.categorize_event(json_obj)
-                
-                if category == "process":
-                    print("process log")
-                    hbt_model.add_process_event(output_fields)
-                elif category == "network":
-                    print("network log")
-                    hbt_model.add_network_event(output_fields)
-                elif category == "file":
-                    print("file log")
-                    hbt_model.add_file_event(output_fields)
-
-                    
+        for batch in log_queue.iter_batches(max_items=matcher.max_batch_size):
+            cnt += len(batch)
+            print("log:", cnt)
+            matcher.submit_batch(batch)
+            # 匹配器按提交顺序处理，event_count之前的事件都已加入模型
+            log_queue.ack(matcher.event_count)
     except KeyboardInterrupt:
         print("\n⏹️  Stopped by user")
-        # 打印最终模型结构
-        print("Final HBT model (JSON format):")
-        print(json.dumps(hbt_model.get_model(), ensure_ascii=False, default=str))
-        
-        # 以树形结构打印模型
-        print("\nFinal HBT model (Tree format):")
-        model_dict = hbt_model.get_model()
-        hbt_structure = model_dict["hbt_structure"]
-        # 重建根节点
-        root_node = TreeNode(hbt_structure["name"], hbt_structure["type"])
-        root_node.events_count = hbt_structure["events_count"]
-        root_node.metadata = hbt_structure["metadata"]
-        # 递归重建子节点
-        def rebuild_tree(node_dict, parent_node):
-            for child_name, child_dict in node_dict["children"].items():
-                child_node = parent_node.add_child(child_name, child_dict["type"])
-                child_node.events_count = child_dict["events_count"]
-                child_node.metadata = child_dict["metadata"]
-                rebuild_tree(child_dict, child_node)
-        rebuild_tree(hbt_structure, root_node)
-        # 打印树形结构
-        tree = print_tree(root_node)
-        rprint(tree)
+        matcher.stop()
+        log_queue.ack(matcher.event_count)
+        registry.snapshot()
+        print(f"Micro-batch stats: {matcher.get_stats()}")
+        print(f"Startup stats: {get_startup_stats()}, embedding warm-up: {get_warmup_seconds()}s")
+        print(f"Registry stats: {registry.get_statistics()}")
+        print(f"Anomaly stats: {get_anomaly_sink().get_stats()}")
+        print_resident_models(registry)
+        print_match_report(get_match_report())
     finally:
         log_queue.stop()
 
@@ -1,91 +1,37 @@
-from prometheus_client import start_http_server, Counter, Gauge
+from prometheus_client import start_http_server
 import logging
 import sys
 import os
 
 # 添加项目根目录到 Python 路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from hanabi.utils.queue import DockerLogQueue
+# 指标定义、标签基数限制和逐事件处理与 hanabi.service 的 Prometheus 汇共用
+from hanabi.utils.event_metrics import process_events
+from hanabi.utils.sources import create_event_queue
 
 # --- 1. 初始化日志 ---
+# 设置 EXPORTER_LOG_LEVEL=DEBUG 可以输出逐事件日志
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.getenv('EXPORTER_LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
-# --- 2. 定义 Prometheus 指标 ---
 
-# 定义事件计数器的标签。这是我们查询数据的维度。
-EVENT_LABELS = [
-    'rule', 'priority', 'container_name', 
-    'image_repository', 'process_name', 'k8s_namespace', 'k8s_pod'
-]
-SYSCALL_EVENTS = Counter('syscall_events_total', 'Total number of syscall events observed.', EVENT_LABELS)
-
-# 定义最新事件时间戳的仪表盘
-LAST_EVENT_TIMESTAMP = Gauge(
-    'syscall_last_event_timestamp_nanoseconds',
-    'Timestamp (nanoseconds) of the last processed syscall event.',
-    ['container_name']
-)
-
-# --- 3. 处理事件数据的函数 ---
-def process_event(event_data):
-    """从队列中获取 JSON 数据并更新 Prometheus 指标"""
-    try:
-        # --- 4. 从 JSON 中安全地提取数据 ---
-        # 使用 .get() 方法可以避免因缺少字段而导致程序崩溃
-        output_fields = event_data.get('output_fields', {})
-        
-        # 提取标签值，为缺失的值提供默认 'unknown'
-        rule = event_data.get('rule', 'unknown')
-        priority = event_data.get('priority', 'unknown')
-        container_name = output_fields.get('container.name', 'unknown')
-        image_repository = output_fields.get('container.image.repository', 'unknown')
-        process_name = output_fields.get('proc.name', 'unknown')
-        
-        # Kubernetes 字段可能是 null，需要处理
-        k8s_namespace = output_fields.get('k8s.ns.name') or 'none'
-        k8s_pod = output_fields.get('k8s.pod.name') or 'none'
-
-        # --- 5. 更新 Prometheus 指标 ---
-        
-        # 增加计数器
-        SYSCALL_EVENTS.labels(
-            rule=rule,
-            priority=priority,
-            container_name=container_name,
-            image_repository=image_repository,
-            process_name=process_name,
-            k8s_namespace=k8s_namespace,
-            k8s_pod=k8s_pod
-        ).inc()
-
-        # 更新最新时间戳
-        event_timestamp = output_fields.get('evt.time.iso8601')
-        if event_timestamp and isinstance(event_timestamp, int):
-            LAST_EVENT_TIMESTAMP.labels(container_name=container_name).set(event_timestamp)
-
-        logging.info(f"Processed event from container: {container_name}, rule: {rule}")
-
-    except Exception as e:
-        logging.error(f"Error processing event: {e}\nData: {event_data}")
-
-
-# --- 6. 从 DockerLogQueue 消费数据 ---
+# --- 2. 从事件队列消费数据 ---
 def consume_events(container_name="falco"):
-    """从 DockerLogQueue 持续消费事件"""
+    """从事件队列持续消费事件（来源由 HANABI_EVENT_SOURCE 选择，默认 Docker 日志）"""
     log_queue = None
     try:
-        logging.info(f"Starting to consume events from container: {container_name}")
-        log_queue = DockerLogQueue(container_name=container_name, max_queue_size=10000)
+        source = os.getenv('HANABI_EVENT_SOURCE', 'docker')
+        logging.info(f"Starting to consume events from {source} source")
+        target = container_name if source == 'docker' else None
+        log_queue = create_event_queue(source, target, max_queue_size=10000)
         log_queue.start()
         
-        while True:
-            json_obj = log_queue.get(timeout=1)
-            if json_obj:
-                process_event(json_obj)
-                
+        # 每次取出队列中已有的全部事件（最多500个），分摊每个事件的加锁和唤醒开销
+        for batch in log_queue.iter_batches(max_items=500, max_wait=1):
+            process_events(batch)
+            
     except KeyboardInterrupt:
         logging.info("Stopping event consumer...")
     except Exception as e:
@@ -0,0 +1,25 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+# The hashing backend needs no model download, so tests can exercise the semantic tier.
+os.environ.setdefault("HANABI_EMBEDDING_BACKEND", "hashing")
+
+EXAMPLE_EVENTS = Path(__file__).resolve().parent.parent / "hanabi" / "models" / "example.json"
+
+
+@pytest.fixture
+def falco_events():
+    """The pretty-printed Falco events shipped in hanabi/models/example.json."""
+    text = EXAMPLE_EVENTS.read_text(encoding="utf-8")
+    decoder = json.JSONDecoder()
+    events, position = [], 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position >= len(text):
+            return events
+        event, position = decoder.raw_decode(text, position)
+        events.append(event)
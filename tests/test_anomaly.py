@@ -0,0 +1,77 @@
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from hanabi.models import anomaly
+from hanabi.models.anomaly import AnomalySink
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(anomaly, "time", SimpleNamespace(monotonic=lambda: now.value, time=time.time))
+    return now
+
+
+def _sink(tmp_path, **options):
+    sink = AnomalySink(log_path=str(tmp_path / "anomalies.jsonl"), **options)
+    published = []
+    sink.subscribe(published.append)
+    return sink, published
+
+
+def _report(sink, query, container="c1"):
+    return sink.report(container, "process", "proc.name", query, {"proc.name": query},
+                       nearest=lambda: ("bash", 0.5))
+
+
+def test_duplicates_are_published_once_per_window(tmp_path, clock):
+    sink, published = _sink(tmp_path, rate=0, dedup_seconds=60)
+    assert _report(sink, "nc")
+    assert not _report(sink, "nc")
+    assert not _report(sink, "nc")
+    # A different container or name is a different anomaly
+    assert _report(sink, "nc", container="c2")
+    assert _report(sink, "socat")
+
+    clock.value += 60
+    assert _report(sink, "nc")
+    sink.stop()
+
+    assert [(item.container, item.query, item.repeats) for item in published] == [
+        ("c1", "nc", 0), ("c2", "nc", 0), ("c1", "socat", 0), ("c1", "nc", 2),
+    ]
+    with open(tmp_path / "anomalies.jsonl") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["query"] for record in records] == ["nc", "nc", "socat", "nc"]
+    assert records[0]["nearest"] == "bash"
+    assert sink.get_stats()["duplicates"] == 2
+
+
+def test_dedup_table_is_bounded(tmp_path, clock):
+    sink, _ = _sink(tmp_path, rate=0, dedup_seconds=60, max_dedup_keys=2)
+    for query in ("a", "b", "c"):
+        assert _report(sink, query)
+    # "a" was the oldest entry and has been forgotten
+    assert _report(sink, "a")
+    assert not _report(sink, "c")
+    sink.stop()
+    assert len(sink.recent) == 2
+
+
+def test_token_bucket_limits_the_rate(tmp_path, clock):
+    sink, _ = _sink(tmp_path, rate=2, dedup_seconds=0)
+    assert [_report(sink, f"p{n}") for n in range(3)] == [True, True, False]
+
+    clock.value += 0.5
+    assert [_report(sink, f"q{n}") for n in range(2)] == [True, False]
+
+    # Idle time refills the bucket up to the burst size only
+    clock.value += 10
+    assert [_report(sink, f"r{n}") for n in range(3)] == [True, True, False]
+    sink.stop()
+
+    stats = sink.get_stats()
+    assert (stats["reported"], stats["published"], stats["rate_limited"]) == (8, 5, 3)
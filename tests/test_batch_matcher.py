@@ -0,0 +1,56 @@
+import copy
+
+from prometheus_client import REGISTRY
+
+from hanabi.models import embedding
+from hanabi.models.batch_matcher import MicroBatchMatcher
+from hanabi.models.child_index import SEMANTIC_MATCH_TIMER
+from hanabi.models.registry import HBTRegistry
+
+
+def _variant(event, **fields):
+    variant = copy.deepcopy(event)
+    variant["output_fields"].update(fields)
+    return variant
+
+
+def test_prefetch_encodes_only_lexical_misses(falco_events):
+    embedding.warm_up().join()
+    cache = embedding._get_backend().cache
+    matcher = MicroBatchMatcher(HBTRegistry(snapshot_dir=None))
+    matcher.process_batch(falco_events)
+    learned = matcher.encoded_count
+
+    # Exact hits need no vectors
+    matcher.process_batch(copy.deepcopy(falco_events))
+    assert matcher.encoded_count == learned
+
+    # Names the normalized tier resolves (case, container IDs) are not prefetched
+    file_event = next(event for event in falco_events if event["rule"] == "file")
+    directory = file_event["output_fields"]["fd.directory"]
+    other_id = directory.replace(directory.rsplit("/", 1)[1], "ab" * 32)
+    matcher.process_batch([_variant(file_event, **{"proc.name": ".RUNC", "fd.directory": other_id})])
+    assert matcher.encoded_count == learned
+    assert ".RUNC" not in cache and other_id not in cache
+
+    # A process name no lexical tier resolves is prefetched instead of encoded on the hot path
+    process_event = next(event for event in falco_events if event["rule"] == "process")
+    matcher.process_batch([_variant(process_event, **{"proc.name": "worker-4242"})])
+    assert matcher.encoded_count > learned
+    assert "worker-4242" in cache
+
+
+def test_semantic_match_is_timed_apart_from_build(falco_events):
+    def batches(stage):
+        return REGISTRY.get_sample_value("hanabi_stage_duration_seconds_count", {"stage": stage}) or 0.0
+
+    matcher = MicroBatchMatcher(HBTRegistry(snapshot_dir=None))
+    before = {stage: batches(stage) for stage in ("parse", "build", "semantic_match")}
+    matcher.process_batch(falco_events)
+    process_event = next(event for event in falco_events if event["rule"] == "process")
+    matcher.process_batch([_variant(process_event, **{"proc.name": "worker-4242"})])
+
+    assert {stage: batches(stage) - count for stage, count in before.items()} == {
+        "parse": 2, "build": 2, "semantic_match": 2,
+    }
+    assert SEMANTIC_MATCH_TIMER.pending == 0.0
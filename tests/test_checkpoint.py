@@ -0,0 +1,79 @@
+import json
+import time
+
+from hanabi.utils.checkpoint import Checkpoint
+from hanabi.utils.queue import EventLogQueue
+from hanabi.utils.sources import FileTailQueue
+
+BASE_TIME = 1_700_000_000_000_000_000
+
+
+def _event(num):
+    return {"rule": "r", "output_fields": {"evt.num": num, "evt.time": BASE_TIME + num}}
+
+
+def _append(path, nums):
+    with open(path, "a", encoding="utf-8") as f:
+        for num in nums:
+            f.write(json.dumps(_event(num)) + "\n")
+
+
+def _read(source, count):
+    events = []
+    deadline = time.monotonic() + 5
+    while len(events) < count and time.monotonic() < deadline:
+        events.extend(source.get_batch(100, max_wait=0.1))
+    return [event["output_fields"]["evt.num"] for event in events]
+
+
+def test_checkpoint_advances_only_on_ack(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    queue = EventLogQueue(checkpoint=Checkpoint(path, interval=0))
+    queue.queue.put_batch([_event(1), _event(2)])
+    queue.get_batch()
+    queue.queue.put_batch([_event(3), _event(4), _event(5)])
+    queue.get_batch()
+    assert queue.checkpoint.mark() == (0, 0)
+
+    # The second batch is only half done
+    queue.ack(3)
+    assert Checkpoint(path).mark() == (BASE_TIME + 2, 2)
+    assert queue.get_stats()["unacknowledged"] == 3
+    queue.ack()
+    assert Checkpoint(path).mark() == (BASE_TIME + 5, 5)
+
+
+def test_resume_skips_acknowledged_events(tmp_path):
+    log, checkpoint = str(tmp_path / "events.json"), str(tmp_path / "checkpoint.json")
+    _append(log, range(1, 6))
+    first = FileTailQueue(log, from_end=False, poll_interval=0.01, checkpoint=checkpoint)
+    first.start()
+    assert _read(first, 5) == [1, 2, 3, 4, 5]
+    first.ack()
+    first.stop()
+
+    _append(log, [6, 7])
+    second = FileTailQueue(log, poll_interval=0.01, checkpoint=checkpoint)
+    second.start()
+    try:
+        assert _read(second, 2) == [6, 7]
+        assert second.get_stats()["duplicates_skipped"] == 5
+    finally:
+        second.stop()
+
+
+def test_unacknowledged_events_are_read_again(tmp_path):
+    log, checkpoint = str(tmp_path / "events.json"), str(tmp_path / "checkpoint.json")
+    _append(log, range(1, 4))
+    first = FileTailQueue(log, from_end=False, poll_interval=0.01, checkpoint=checkpoint)
+    first.start()
+    assert _read(first, 3) == [1, 2, 3]
+    first.stop()
+
+    assert not Checkpoint(checkpoint).exists
+    second = FileTailQueue(log, from_end=False, poll_interval=0.01, checkpoint=checkpoint)
+    second.start()
+    try:
+        assert _read(second, 3) == [1, 2, 3]
+    finally:
+        second.stop()
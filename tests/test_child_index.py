@@ -0,0 +1,80 @@
+import pytest
+
+from hanabi.models.child_index import MATCH_STATS, ChildIndex, _dice, normalize_name
+
+
+def _tier(index: ChildIndex, query: str):
+    before = dict(MATCH_STATS.counts)
+    key, score = index.match(query, semantic=False)
+    tier = next(tier for tier, count in MATCH_STATS.counts.items() if count != before[tier])
+    return key, score, tier
+
+
+def test_normalize_masks_only_volatile_tokens():
+    assert normalize_name("/proc/1234/status") == "/proc/self/status"
+    assert normalize_name("/var/lib/docker/2cde3dcbeff2e24b/config") == "/var/lib/docker/<id>/config"
+    assert normalize_name(" /USR//bin/ ") == "/usr/bin"
+    assert normalize_name("/etc/passwd2") == "/etc/passwd2"
+    assert normalize_name("10.0.0.1:5432:ipv4") == "10.0.0.1:5432:ipv4"
+    assert normalize_name("/proc/1234/status", mask_volatile=False) == "/proc/1234/status"
+
+
+def test_new_ip_and_port_do_not_match():
+    index = ChildIndex(["127.0.0.1:5432:ipv4"], mask_volatile=False)
+    key, _, tier = _tier(index, "6.6.6.6:4444:ipv4")
+    assert key is None and tier == "miss"
+
+
+def test_numbered_file_does_not_match():
+    index = ChildIndex(["/etc/passwd1"])
+    key, _, tier = _tier(index, "/etc/passwd2")
+    assert key is None and tier == "miss"
+
+
+def test_pid_variant_is_a_normalized_match_with_partial_score():
+    index = ChildIndex(["/proc/123/status"])
+    key, score, tier = _tier(index, "/proc/45678/status")
+    assert key == "/proc/123/status" and tier == "normalized"
+    assert 0.0 < score < 1.0
+
+
+def test_network_index_does_not_mask():
+    index = ChildIndex(["/proc/123/status"], mask_volatile=False)
+    key, _, tier = _tier(index, "/proc/45678/status")
+    assert tier != "normalized"
+
+
+@pytest.mark.parametrize("known, query, mask_volatile", [
+    ("192.168.100.101:54321:ipv4", "192.168.100.102:54321:ipv4", False),
+    ("192.168.100.101:54321:ipv4", "192.168.100.101:54322:ipv4", False),
+    ("/var/lib/postgresql/data/base/16384/2610", "/var/lib/postgresql/data/base/16384/2619", True),
+])
+def test_changed_numbers_do_not_match(known, query, mask_volatile):
+    index = ChildIndex([known], mask_volatile=mask_volatile)
+    key, _, tier = _tier(index, query)
+    assert key is None and tier == "miss"
+    assert index.match(query, semantic=True)[0] is None
+
+
+def test_trigram_tier():
+    index = ChildIndex(["/usr/lib/python3/dist-packages/requests/adapters.py", "/etc/hosts"])
+    key, score, tier = _tier(index, "/usr/lib/python3/dist-packages/requests/adapter.py")
+    assert key == "/usr/lib/python3/dist-packages/requests/adapters.py" and tier == "trigram"
+    assert score >= index.trigram_threshold
+
+
+def test_trigram_ranks_by_dice_not_overlap():
+    index = ChildIndex(["nginx-worker-process-with-a-long-name", "nginx-workers"])
+    assert index.nearest("nginx-worker", semantic=False)[0] == "nginx-workers"
+
+
+def test_dice_of_empty_strings():
+    assert _dice("", "") == 1.0
+    assert _dice("", "a") == 0.0
+
+
+def test_nearest_reports_best_candidate_below_threshold():
+    index = ChildIndex(["nginx", "bash"])
+    assert index.match("nginz", semantic=False)[0] is None
+    key, score = index.nearest("nginz", semantic=False)
+    assert key == "nginx" and 0.0 < score < index.trigram_threshold
@@ -0,0 +1,13 @@
+import pytest
+
+from hanabi.models.embedding import OnnxBackend
+
+
+def test_onnx_backend_requires_an_export_directory(tmp_path):
+    with pytest.raises(ValueError, match="model.onnx"):
+        OnnxBackend(None)
+    # A hub id or a directory without model.onnx fails before anything is downloaded.
+    with pytest.raises(ValueError, match="model.onnx"):
+        OnnxBackend("BAAI/bge-m3")
+    with pytest.raises(ValueError, match="model.onnx"):
+        OnnxBackend(str(tmp_path))
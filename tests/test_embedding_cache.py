@@ -0,0 +1,75 @@
+import pytest
+import torch
+
+from hanabi.models import embedding
+from hanabi.models.embedding import EmbeddingCache
+
+
+def _vector(value: float, dim: int = 4) -> torch.Tensor:
+    return torch.full((dim,), value)
+
+
+def test_persisted_cache_reloads(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    cache = EmbeddingCache(4, path=path, key="hashing:test")
+    cache.put("a", _vector(1.0))
+    cache.put("b", _vector(2.0))
+    cache.flush()
+
+    reloaded = EmbeddingCache(4, path=path, key="hashing:test")
+    assert len(reloaded) == 2
+    assert torch.equal(reloaded.get("b"), _vector(2.0))
+
+
+def test_cache_from_another_backend_is_discarded(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    cache = EmbeddingCache(4, path=path, key="hashing:test")
+    cache.put("a", _vector(1.0))
+    cache.flush()
+
+    other = EmbeddingCache(4, path=path, key="transformer:BAAI/bge-m3")
+    assert len(other) == 0
+    # The matrix is reallocated for the new backend's dim.
+    other.put("a", _vector(0.5, dim=8))
+    assert torch.equal(other.get("a"), _vector(0.5, dim=8))
+
+
+def test_slot_overwritten_after_flush_is_dropped(tmp_path):
+    path = str(tmp_path / "cache.bin")
+    cache = EmbeddingCache(2, path=path, key="hashing:test", flush_interval=1000)
+    cache.put("a", _vector(1.0))
+    cache.put("b", _vector(2.0))
+    cache.flush()
+    # Evicts "a" and reuses its slot; the on-disk index still maps "a" to it.
+    cache.put("c", _vector(3.0))
+
+    reloaded = EmbeddingCache(2, path=path, key="hashing:test")
+    assert "a" not in reloaded
+    assert torch.equal(reloaded.get("b"), _vector(2.0))
+    # The dropped slot is reused before anything is evicted.
+    reloaded.put("d", _vector(4.0))
+    assert "b" in reloaded and len(reloaded) == 2
+
+
+def test_dim_mismatch_is_rejected():
+    cache = EmbeddingCache(2)
+    cache.put("a", _vector(1.0))
+    with pytest.raises(ValueError):
+        cache.put("b", _vector(1.0, dim=8))
+
+
+def test_in_memory_matrix_grows_as_it_fills(monkeypatch):
+    monkeypatch.setattr(embedding, "CACHE_INITIAL_ROWS", 2)
+    cache = EmbeddingCache(5)
+    cache.put("a", _vector(1.0))
+    assert cache._storage.shape == (2, 4)
+    for n in range(2, 6):
+        cache.put(str(n), _vector(float(n)))
+    assert cache._storage.shape == (5, 4)
+    assert torch.equal(cache.get("a"), _vector(1.0))
+    assert torch.equal(cache.get("5"), _vector(5.0))
+
+    # Full: the least recently used entry is evicted instead of growing further
+    cache.put("b", _vector(6.0))
+    assert cache._storage.shape == (5, 4)
+    assert "2" not in cache and cache.evictions == 1
@@ -0,0 +1,55 @@
+from prometheus_client import CollectorRegistry, Counter
+
+from hanabi.utils.event_metrics import OTHER_VALUE, BoundChildren, LabelLimiter
+
+
+def _counter():
+    registry = CollectorRegistry()
+    return registry, Counter("events_total", "Events.", ["pod"], registry=registry)
+
+
+def _count(registry, pod):
+    return registry.get_sample_value("events_total", {"pod": pod})
+
+
+def test_limiter_folds_values_past_top_k():
+    limiter = LabelLimiter(top_k=2, idle_windows=1)
+    assert [limiter.map(value) for value in ("a", "b", "c", "a")] == ["a", "b", OTHER_VALUE, "a"]
+
+
+def test_limiter_keeps_busy_values():
+    limiter = LabelLimiter(top_k=2, idle_windows=1)
+    limiter.map("a")
+    limiter.map("b")
+    assert limiter.rebalance({"a": 1, "b": 1, "c": 50}) == (set(), set())
+    assert limiter.map("c") == OTHER_VALUE
+
+
+def test_limiter_replaces_idle_values_with_the_most_frequent():
+    limiter = LabelLimiter(top_k=2, idle_windows=2)
+    limiter.map("a")
+    limiter.map("b")
+    # "b" has been idle for one window only
+    assert limiter.rebalance({"a": 5, "c": 10}) == (set(), set())
+    assert limiter.rebalance({"a": 5, "c": 10, "d": 3}) == ({"b"}, {"c"})
+    assert [limiter.map(value) for value in ("a", "b", "c", "d")] == ["a", OTHER_VALUE, "c", OTHER_VALUE]
+
+
+def test_bound_children_remove_evicted_series():
+    registry, counter = _counter()
+    children = BoundChildren(counter, 1, top_k=2, idle_windows=1)
+    for pod in ("a", "b", "c", "c"):
+        children.get((pod,)).inc()
+    assert (_count(registry, "a"), _count(registry, "b"), _count(registry, OTHER_VALUE)) == (1, 1, 2)
+    assert _count(registry, "c") is None
+
+    children.maintain()
+    # "b" exits; "c" keeps sending events and takes its place
+    children.get(("a",)).inc()
+    children.get(("c",)).inc()
+    children.maintain()
+
+    children.get(("c",)).inc()
+    assert _count(registry, "b") is None
+    assert _count(registry, "c") == 1
+    assert children.series == {("a",), ("c",), (OTHER_VALUE,)}
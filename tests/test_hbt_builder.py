@@ -0,0 +1,24 @@
+import pytest
+
+from hanabi.models.hbt_builder import HBTBuilder
+
+
+def _walked(builder):
+    return {
+        "process": builder.process_branch.count_nodes(),
+        "network": builder.network_branch.count_nodes(),
+        "file": builder.file_branch.count_nodes(),
+    }
+
+
+@pytest.mark.parametrize("store", ["object", "columnar"])
+def test_node_counts_are_kept_without_walking(falco_events, store):
+    builder = HBTBuilder("c1", store=store)
+    assert builder.count_nodes() == 4
+    builder.add_events(falco_events)
+    assert builder.branch_node_counts() == _walked(builder)
+    assert builder.count_nodes() == builder.root.count_nodes()
+
+    restored = HBTBuilder("c1", store=store)
+    restored.load_model(builder.get_model())
+    assert restored.branch_node_counts() == _walked(builder)
@@ -0,0 +1,57 @@
+from hanabi.models.learning_state import LearningPhase, LearningState
+
+
+def _learning_state(new_nodes: int) -> LearningState:
+    state = LearningState(warmup_seconds=0, window_seconds=10)
+    start = state.phase_started
+    for second in range(new_nodes):
+        state.on_event(start + 1 + second)
+        state.on_new_node(start + 1 + second)
+    state.update(start + 10)
+    return state
+
+
+def test_two_new_nodes_in_ten_seconds_is_not_converged():
+    assert _learning_state(2).phase is LearningPhase.LEARNING
+
+
+def test_one_new_node_in_ten_seconds_is_converged():
+    assert _learning_state(1).phase is LearningPhase.DETECTING
+
+
+def _detecting_state(**options) -> LearningState:
+    state = LearningState(warmup_seconds=0, window_seconds=10, **options)
+    state.restore(LearningPhase.DETECTING.value)
+    return state
+
+
+def test_anomaly_rate_triggers_relearning():
+    state = _detecting_state(max_anomaly_rate=1.0)
+    start = state.phase_started
+    for second in range(1, 10):
+        state.on_anomaly(start + second)
+        assert state.update(start + second) is LearningPhase.DETECTING
+    state.on_anomaly(start + 10)
+    assert state.update(start + 10) is LearningPhase.RELEARNING
+
+
+def test_relearning_is_off_without_a_threshold():
+    state = _detecting_state(max_anomaly_rate=None)
+    start = state.phase_started
+    for second in range(1, 30):
+        state.on_anomaly(start + second)
+    assert state.update(start + 30) is LearningPhase.DETECTING
+
+
+def test_registry_relearn(falco_events):
+    from hanabi.models.registry import HBTRegistry
+
+    registry = HBTRegistry(snapshot_dir=None)
+    registry.add_events(falco_events)
+    key = next(key for key, _ in registry.models())
+    assert not registry.relearn(key)  # still warming up
+    state = registry.get_model(key).hbt_builder.learning_state
+    state.restore(LearningPhase.DETECTING.value)
+    assert registry.relearn(key)
+    assert state.phase is LearningPhase.RELEARNING
+    assert not registry.relearn("no-such-container")
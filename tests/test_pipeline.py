@@ -0,0 +1,21 @@
+from hanabi.models.pipeline import ShardedPipeline
+
+
+def test_failed_batch_is_reported_and_sticks(falco_events):
+    pipeline = ShardedPipeline(workers=1, semantic=False, registry_options={"snapshot_dir": None})
+    pipeline.start()
+    try:
+        pipeline.submit_batch(falco_events)
+        assert pipeline.wait_processed()
+
+        # A non-string file name fails inside the worker
+        pipeline.submit_batch([{"rule": "file", "output_fields": {
+            "container.id": "c1", "evt.type": "open", "proc.name": "cat", "fd.name": 5,
+        }}])
+        pipeline.submit_batch(falco_events)
+        assert not pipeline.wait_processed()
+        assert pipeline.failed_batches == 1
+    finally:
+        stats = ShardedPipeline.aggregate(pipeline.stop())
+    assert stats["errors"] == 1 and stats["failed_events"] == 1
+    assert pipeline.failed_batches == 1
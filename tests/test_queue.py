@@ -0,0 +1,64 @@
+import pytest
+
+from hanabi.utils.queue import EventBuffer
+
+
+def _events(rule, start, count):
+    return [{"rule": rule, "priority": "Notice", "n": n} for n in range(start, start + count)]
+
+
+def _buffer(policy, **options):
+    drops = []
+    buffer = EventBuffer(maxsize=4, policy=policy, on_drop=lambda *args: drops.append(args), **options)
+    return buffer, drops
+
+
+def _numbers(buffer):
+    return [event["n"] for event in buffer.get_batch(100, timeout=0)]
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        EventBuffer(policy="drop_everything")
+
+
+def test_block_times_out_without_dropping():
+    buffer, drops = _buffer("block")
+    assert buffer.put_batch(_events("a", 0, 4))
+    assert not buffer.put_batch(_events("a", 4, 1), timeout=0.01)
+    assert _numbers(buffer) == [0, 1, 2, 3]
+    assert drops == [] and buffer.get_stats()["dropped"] == 0
+
+
+def test_block_accepts_an_oversized_batch_once_there_is_room():
+    buffer, _ = _buffer("block")
+    assert buffer.put_batch(_events("a", 0, 6))
+    assert len(buffer) == 6
+
+
+def test_drop_newest_keeps_what_fits():
+    buffer, drops = _buffer("drop_newest")
+    buffer.put_batch(_events("a", 0, 3))
+    buffer.put_batch(_events("a", 3, 3))
+    assert _numbers(buffer) == [0, 1, 2, 3]
+    assert drops == [("a", "Notice", "drop_newest", 2)]
+
+
+def test_drop_oldest_evicts_from_the_front():
+    buffer, drops = _buffer("drop_oldest")
+    buffer.put_batch(_events("a", 0, 3))
+    buffer.put_batch(_events("b", 3, 3))
+    assert _numbers(buffer) == [2, 3, 4, 5]
+    assert drops == [("a", "Notice", "drop_oldest", 2)]
+    stats = buffer.get_stats()
+    assert stats["dropped_by_rule"] == {"a": 2} and stats["dropped_by_priority"] == {"Notice": 2}
+
+
+def test_sample_keeps_one_in_rate_per_rule():
+    buffer, drops = _buffer("sample", sample_rate=3)
+    buffer.put_batch(_events("a", 0, 4))
+    buffer.put_batch(_events("b", 4, 6))
+    # Overflowing "b" events 4 and 7 are sampled in, evicting the two oldest
+    assert _numbers(buffer) == [2, 3, 4, 7]
+    assert buffer.get_stats()["dropped_by_rule"] == {"a": 2, "b": 4}
+    assert sum(count for *_, count in drops) == 6
@@ -0,0 +1,26 @@
+from hanabi.models.registry import MAX_FILENAME_KEY_LENGTH, HBTRegistry, model_filename
+from hanabi.models.snapshot import SNAPSHOT_SUFFIX
+
+
+def test_model_filename_does_not_collide():
+    keys = ["a/b", "a_b", "a%2Fb", "a:b", "../etc", "docker.io/library/nginx"]
+    names = [model_filename(key) for key in keys]
+    assert len(set(names)) == len(keys)
+    assert all("/" not in name and name.endswith(SNAPSHOT_SUFFIX) for name in names)
+    assert model_filename("abc123", ".json") == "abc123.json"
+
+
+def test_model_filename_caps_long_keys():
+    long_a, long_b = "x" * 300 + "a", "x" * 300 + "b"
+    assert model_filename(long_a) != model_filename(long_b)
+    assert len(model_filename(long_a)) <= MAX_FILENAME_KEY_LENGTH + len(SNAPSHOT_SUFFIX)
+
+
+def test_snapshot_paths_for_similar_keys(tmp_path, falco_events):
+    registry = HBTRegistry(key_field="rule", snapshot_dir=str(tmp_path))
+    for key in ("a/b", "a_b"):
+        registry.add_events([dict(event, output_fields=dict(event["output_fields"], rule=key))
+                             for event in falco_events])
+    assert registry.snapshot() == 2
+    assert sorted(HBTRegistry(key_field="rule", snapshot_dir=str(tmp_path)).spilled) == ["a/b", "a_b"]
+
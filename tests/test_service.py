@@ -0,0 +1,78 @@
+from hanabi.service import EventService, Sink
+from hanabi.utils.checkpoint import Checkpoint
+from hanabi.utils.queue import EventLogQueue
+
+BASE_TIME = 1_700_000_000_000_000_000
+
+
+def _event(num):
+    return {"rule": "r", "output_fields": {"evt.num": num, "evt.time": BASE_TIME + num}}
+
+
+class RecordingSink(Sink):
+    name = "recording"
+
+    def __init__(self, checkpoint=None, **options):
+        super().__init__(**options)
+        self.checkpoint = checkpoint
+        self.handled = []
+        self.early_acks = []
+
+    def handle_batch(self, events):
+        nums = [event["output_fields"]["evt.num"] for event in events]
+        if self.checkpoint is not None and self.checkpoint.mark()[1] >= min(nums):
+            self.early_acks.append(nums)
+        self.handled.extend(nums)
+
+
+class ReplayQueue(EventLogQueue):
+    """Hands out a fixed list of events in one-event batches, then stops."""
+
+    source_name = "replay"
+
+    def __init__(self, events, checkpoint):
+        super().__init__(checkpoint=checkpoint)
+        self.events = events
+
+    def _open(self):
+        pass
+
+    def _run(self):
+        for event in self.events:
+            self.queue.put_batch([event])
+        self.stop_event.set()
+
+
+def test_dropped_newest_events_do_not_complete_earlier_ones():
+    sink = RecordingSink(max_buffer=2, overflow_policy="drop_newest")
+    for num in (1, 2, 3):
+        sink.submit([_event(num)])
+    # Event 3 was dropped, but 1 and 2 are still waiting
+    assert sink.completed == 0
+    sink.stop()
+    assert sink.handled == [1, 2]
+    assert sink.completed == 3
+
+
+def test_dropped_oldest_events_complete_in_order():
+    sink = RecordingSink(max_buffer=2, overflow_policy="drop_oldest")
+    for num in (1, 2, 3):
+        sink.submit([_event(num)])
+    assert sink.completed == 1
+    sink.stop()
+    assert sink.handled == [2, 3] and sink.completed == 3
+
+
+def test_service_acks_only_events_every_sink_finished(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"), interval=0)
+    sinks = [
+        RecordingSink(checkpoint, max_buffer=2, overflow_policy="drop_newest", batch_size=1),
+        RecordingSink(checkpoint, max_buffer=100, batch_size=1),
+    ]
+    service = EventService(ReplayQueue([_event(num) for num in range(1, 51)], checkpoint), sinks, max_wait=0.01)
+    service.run()
+
+    assert sinks[1].handled == list(range(1, 51))
+    assert all(not sink.early_acks for sink in sinks)
+    assert Checkpoint(checkpoint.path).mark() == (BASE_TIME + 50, 50)
+    assert service.get_stats()["source"]["unacknowledged"] == 0
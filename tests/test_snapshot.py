@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from hanabi.models.hbt import HBTModel
+from hanabi.models.learning_state import LearningPhase
+from hanabi.models.snapshot import read_snapshot, read_snapshot_header, write_snapshot
+
+
+def _model(falco_events, store="object"):
+    model = HBTModel("c1", store=store)
+    for event in falco_events:
+        model.add_event(event)
+    root = model.hbt_builder.root
+    next(iter(root.children.values())).metadata = {"note": "ünïcode"}
+    model.hbt_builder.learning_state.restore(LearningPhase.DETECTING.value)
+    return model
+
+
+@pytest.mark.parametrize("written, loaded", [
+    ("object", "object"), ("columnar", "columnar"), ("object", "columnar"), ("columnar", "object"),
+])
+def test_round_trip(tmp_path, falco_events, written, loaded):
+    model = _model(falco_events, written)
+    path = str(tmp_path / "c1.hbts")
+    size = write_snapshot(model, path, embeddings=False)
+
+    header = read_snapshot_header(path)
+    assert header["container_id"] == "c1" and header["learning_phase"] == "detecting"
+    assert header["nodes"] > 1 and size == (tmp_path / "c1.hbts").stat().st_size
+
+    restored = read_snapshot(path, store=loaded, embeddings=False)
+    assert restored.get_model() == model.get_model()
+    assert restored.hbt_builder.learning_state.phase is LearningPhase.DETECTING
+
+
+def test_corrupt_snapshot_is_rejected(tmp_path, falco_events):
+    path = tmp_path / "c1.hbts"
+    write_snapshot(_model(falco_events), str(path), embeddings=False)
+    data = bytearray(path.read_bytes())
+
+    flipped = data.copy()
+    flipped[len(data) // 2] ^= 0xFF
+    path.write_bytes(bytes(flipped))
+    with pytest.raises(ValueError, match="checksum"):
+        read_snapshot(str(path))
+
+    path.write_bytes(bytes(data[:-10]))
+    with pytest.raises(ValueError):
+        read_snapshot(str(path))
+
+    path.write_bytes(b"JUNK" + bytes(data[4:]))
+    with pytest.raises(ValueError, match="not an HBT snapshot"):
+        read_snapshot(str(path))
+
+
+@pytest.mark.parametrize("durable", [True, False])
+def test_write_syncs_file_before_rename_and_directory_after(tmp_path, falco_events, monkeypatch, durable):
+    path = tmp_path / "c1.hbts"
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (synced.append(path.exists()), fsync(fd)))
+    write_snapshot(_model(falco_events), str(path), embeddings=False, durable=durable)
+    assert synced == ([False, True] if durable else [])
@@ -0,0 +1,28 @@
+import http.client
+import json
+
+from hanabi.utils.sources import HttpReceiverQueue
+
+
+def _post(conn, event):
+    conn.request("POST", "/", body=json.dumps(event), headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def test_http_receiver_serves_senders_concurrently():
+    receiver = HttpReceiverQueue(port=0)
+    receiver.start()
+    host, port = receiver.server_address
+    idle = http.client.HTTPConnection(host, port, timeout=5)
+    busy = http.client.HTTPConnection(host, port, timeout=1)
+    try:
+        # The first connection stays open (keep-alive) without sending anything else
+        assert _post(idle, {"rule": "a"}) == 200
+        assert _post(busy, {"rule": "b"}) == 200
+        assert [event["rule"] for event in receiver.get_batch(10, max_wait=1)] == ["a", "b"]
+    finally:
+        idle.close()
+        busy.close()
+        receiver.stop()
@@ -0,0 +1,39 @@
+import pytest
+
+from hanabi.models.columnar_store import ColumnarStore
+from hanabi.models.tree_node import TreeNode
+
+
+def test_children_is_read_only_view():
+    root = TreeNode("root", "root")
+    with pytest.raises(TypeError):
+        root.children["x"] = TreeNode("x", "file")
+    child = root.add_child("x", "file")
+    children = root.children
+    with pytest.raises(TypeError):
+        children["y"] = TreeNode("y", "file")
+    assert dict(children) == {"x": child}
+    root.add_child("y", "file")
+    assert list(children) == ["x", "y"]
+
+
+def test_merge_returns_added_nodes():
+    left = TreeNode("root", "root")
+    left.add_child("a", "file").add_child("x", "file")
+    right = TreeNode("root", "root")
+    right.add_child("a", "file").add_child("y", "file")
+    right.add_child("b", "file").add_child("z", "file")
+    assert left.merge(right) == 3
+    assert left.count_nodes() == 6
+
+
+def test_child_names_without_a_view():
+    root = TreeNode("root", "root")
+    assert not root.has_children() and list(root.child_names()) == []
+    root.add_child("x", "file")
+    root.add_child("y", "file")
+    assert root.has_children() and list(root.child_names()) == ["x", "y"]
+
+    columnar = ColumnarStore.from_dict(root.to_dict()).root
+    assert columnar.has_children() and list(columnar.child_names()) == ["x", "y"]
+    assert not columnar.get_child("x").has_children()
@@ -0,0 +1,84 @@
+import io
+import json
+
+import pytest
+
+from hanabi.models.columnar_store import ColumnarStore
+from hanabi.models.tree_node import TreeNode
+from hanabi.models.tree_writer import write_model, write_tree
+
+
+def _tree():
+    root = TreeNode("root", "root")
+    branch = root.add_child("file_branch", "branch")
+    runc = branch.add_child("runc", "process")
+    runc.add_child("/etc", "file").increment_events_count(5)
+    runc.add_child("/tmp", "file").increment_events_count(1)
+    runc.update_metadata("user", "root")
+    branch.add_child("sh", "process").add_child("/dev", "file").increment_events_count(1)
+    root.add_child("network_branch", "branch")
+    return root
+
+
+def _root(store):
+    tree = _tree()
+    return tree if store == "object" else ColumnarStore.from_dict(tree.to_dict()).root
+
+
+def _paths(data, prefix=()):
+    path = prefix + (data["name"],)
+    yield path
+    for child in data["children"].values():
+        yield from _paths(child, path)
+
+
+@pytest.mark.parametrize("store", ["object", "columnar"])
+def test_json_loads_back(store):
+    out = io.StringIO()
+    count = write_tree(_root(store), out, chunk_size=16)
+    data = json.loads(out.getvalue())
+    assert count == 8
+    assert data == _tree().to_dict()
+    assert TreeNode.from_dict(data).to_dict() == data
+
+
+@pytest.mark.parametrize("store", ["object", "columnar"])
+def test_json_prunes_by_subtree_events(store):
+    out = io.StringIO()
+    count = write_tree(_root(store), out, min_events=2)
+    data = json.loads(out.getvalue())
+    # Intermediate nodes have no events of their own but are kept for their subtree
+    assert sorted(_paths(data)) == [
+        ("root",), ("root", "file_branch"), ("root", "file_branch", "runc"),
+        ("root", "file_branch", "runc", "/etc"),
+    ]
+    assert count == 4
+    assert TreeNode.from_dict(data).children["file_branch"].children["runc"].metadata == {"user": "root"}
+
+
+@pytest.mark.parametrize("store", ["object", "columnar"])
+def test_ndjson_lists_nodes_parent_first(store):
+    out = io.StringIO()
+    count = write_tree(_root(store), out, format="ndjson", max_depth=2, min_events=1)
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert count == len(rows) == 4
+    assert [(row["id"], row["parent"], row["depth"], row["name"]) for row in rows] == [
+        (0, -1, 0, "root"), (1, 0, 1, "file_branch"), (2, 1, 2, "runc"), (3, 1, 2, "sh"),
+    ]
+
+
+def test_model_formats():
+    out = io.StringIO()
+    write_model(out, "abc", "detecting", _tree())
+    assert json.loads(out.getvalue()) == {
+        "container_id": "abc", "learning_phase": "detecting", "hbt_structure": _tree().to_dict(),
+    }
+
+    out = io.StringIO()
+    write_model(out, "abc", "detecting", _tree(), format="ndjson", max_depth=0)
+    header, root = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert header == {"container_id": "abc", "learning_phase": "detecting"}
+    assert root["name"] == "root"
+
+    with pytest.raises(ValueError):
+        write_tree(_tree(), io.StringIO(), format="xml")